@@ -0,0 +1,737 @@
+# action_pipeline.py
+import asyncio
+import inspect
+import os
+import pickle
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from agent import metrics
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+QUOTA_OVERFLOW_POLICIES = ("defer", "drop")
+NO_CLIENT = "(none)" # Stats key for events of contracts without a client_id
+_RECORD_HEADER = struct.Struct(">I")
+
+ACTION_SECONDS = metrics.histogram("action_run_seconds", "Run time of successful action attempts", ["action"])
+ACTION_RUNS = metrics.counter("action_runs_total", "Finished actions by outcome (ok, failed)", ["action", "outcome"])
+ACTION_RETRIES_TOTAL = metrics.counter("action_retries_total", "Action attempts retried after an error or timeout", ["action"])
+ACTION_QUEUE_WAIT = metrics.histogram("action_queue_wait_seconds", "Time actions spend queued before a worker picks them up")
+ACTION_OVERFLOW_TOTAL = metrics.counter("action_overflow_total", "Actions that hit a full queue, by what happened to them (dropped, spilled)", ["result"])
+CLIENT_LATENCY = metrics.histogram("action_client_latency_seconds", "Time from submit to a finished action, per client", ["client"], buckets=metrics.LAG_BUCKETS[:1] + metrics.DEFAULT_BUCKETS[6:])
+CLIENT_EVENTS = metrics.counter("action_client_events_total", "Events per client by admission (ok, deferred, dropped over quota)", ["client", "admission"])
+CLIENT_DROPPED = metrics.counter("action_client_dropped_total", "Actions dropped or spilled because the pipeline was full, per client", ["client", "result"])
+
+
+class _SpillFile:
+    """
+    Append-only overflow file of length-prefixed pickled (action_id, event) records.
+    Records are read back in order; the file is truncated once fully consumed, and
+    records left over from a previous run are replayed after a restart.
+    The pipeline calls append/read/rewrite on one IO thread, so they run in call
+    order and off the event loop; it keeps `pending` itself, on the loop.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._writer = None
+        self._read_offset = 0
+        self.pending = self._count_existing()
+
+    def _count_existing(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        count = 0
+        with open(self.path, "rb") as f:
+            while True:
+                header = f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    break
+                (size,) = _RECORD_HEADER.unpack(header)
+                f.seek(size, os.SEEK_CUR)
+                count += 1
+        return count
+
+    def append(self, records: list) -> None:
+        """Appends already pickled records."""
+        if self._writer is None:
+            self._writer = open(self.path, "ab")
+        self._writer.write(b"".join(_RECORD_HEADER.pack(len(data)) + data for data in records))
+        self._writer.flush()
+
+    def _close_writer(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _read_remaining(self) -> list:
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, "rb") as f:
+            f.seek(self._read_offset)
+            while True:
+                header = f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    return records
+                (size,) = _RECORD_HEADER.unpack(header)
+                records.append(f.read(size))
+
+    def rewrite(self, front_records: list) -> int:
+        """
+        Replaces the file with `front_records` followed by the unread records, dropping
+        what was already consumed, so a restart resumes exactly where this run stopped.
+        Returns the number of records left in the file.
+        """
+        self._close_writer()
+        remaining = self._read_remaining()
+        self._read_offset = 0
+        if not front_records and not remaining:
+            if os.path.exists(self.path):
+                os.truncate(self.path, 0)
+            return 0
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for data in [pickle.dumps(r, protocol=pickle.HIGHEST_PROTOCOL) for r in front_records] + remaining:
+                f.write(_RECORD_HEADER.pack(len(data)) + data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        return len(front_records) + len(remaining)
+
+    def read(self, max_records: int) -> list:
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, "rb") as f:
+            f.seek(self._read_offset)
+            while len(records) < max_records:
+                header = f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    break
+                (size,) = _RECORD_HEADER.unpack(header)
+                records.append(pickle.loads(f.read(size)))
+            self._read_offset = f.tell()
+            consumed = self._read_offset >= os.fstat(f.fileno()).st_size
+        if consumed:
+            # Appends queued behind this read land in the emptied file, read from its start
+            self._read_offset = 0
+            self._close_writer()
+            os.truncate(self.path, 0)
+        return records
+
+
+class _ActionStats:
+    __slots__ = ("completed", "failed", "timeouts", "retries", "total_seconds", "max_seconds", "recent")
+
+    def __init__(self):
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.recent = deque(maxlen=1024) # Latency samples for percentiles
+
+    def record(self, seconds: float) -> None:
+        self.completed += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.recent.append(seconds)
+
+    def as_dict(self) -> dict:
+        samples = sorted(self.recent) # Sorted once; _percentile_ms's own sort is then a linear pass
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "avg_ms": round(self.total_seconds / self.completed * 1000, 3) if self.completed else None,
+            "p50_ms": _percentile_ms(samples, 0.50),
+            "p99_ms": _percentile_ms(samples, 0.99),
+            "max_ms": round(self.max_seconds * 1000, 3),
+        }
+
+
+def _percentile_ms(samples, p: float) -> Optional[float]:
+    samples = sorted(samples)
+    return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 3) if samples else None
+
+
+def parse_client_options(weights: str = "", quotas: str = "", quota_overflow: str = "defer") -> Dict[str, dict]:
+    """
+    Per-client options from the CLIENT_WEIGHTS ("a=3,b=1") and CLIENT_QUOTAS
+    ("a=50:200:drop,*=100", events/s[:burst[:defer|drop]]) settings; "*" applies to
+    every client without an entry of its own.
+    """
+    options: Dict[str, dict] = {}
+    for entry in filter(None, (e.strip() for e in (weights or "").split(","))):
+        client_id, _, weight = entry.partition("=")
+        options.setdefault(client_id.strip(), {})["weight"] = float(weight)
+    for entry in filter(None, (e.strip() for e in (quotas or "").split(","))):
+        client_id, _, spec = entry.partition("=")
+        rate, burst, policy = (spec.split(":") + ["", ""])[:3]
+        options.setdefault(client_id.strip(), {}).update(
+            rate=float(rate), burst=float(burst) if burst else None, quota_overflow=policy or quota_overflow
+        )
+    return options
+
+
+class _Quota:
+    """Token bucket: `rate` events per second with bursts of up to `burst`."""
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+class _ClientQueue:
+    """One client's queued actions: lane 0 is in quota, lane 1 holds events deferred by the quota."""
+
+    def __init__(self, key: str, weight: float = 1.0, quota: Optional[_Quota] = None, quota_overflow: str = "defer"):
+        self.key = key
+        self.weight = weight
+        self.quota = quota
+        self.quota_overflow = quota_overflow
+        self.lanes = (deque(), deque())
+        self.deficit = [0.0, 0.0] # Deficit round robin credit per lane
+        self.active = [False, False] # In the scheduler ring of that lane
+        self.spill_pending = 0 # Own actions in the spill file; later ones follow them there
+        self.events = 0
+        self.deferred = 0
+        self.quota_dropped = 0
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.waits = deque(maxlen=1024)
+        self.latencies = deque(maxlen=1024)
+
+    def __len__(self) -> int:
+        return len(self.lanes[0]) + len(self.lanes[1])
+
+    def as_dict(self) -> dict:
+        return {
+            "weight": self.weight,
+            "quota": {"rate": self.quota.rate, "burst": self.quota.burst, "overflow": self.quota_overflow} if self.quota else None,
+            "queued": len(self.lanes[0]),
+            "deferred_queued": len(self.lanes[1]),
+            "spilled_pending": self.spill_pending,
+            "events": self.events,
+            "deferred": self.deferred,
+            "quota_dropped": self.quota_dropped,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "queue_wait_p99_ms": _percentile_ms(self.waits, 0.99),
+            "latency_p50_ms": _percentile_ms(self.latencies, 0.50),
+            "latency_p99_ms": _percentile_ms(self.latencies, 0.99),
+        }
+
+
+class ActionPipeline:
+    """
+    Runs ACTION_DISPATCHER functions off the ingestion path.
+    submit() queues (action_id, event) per client (the event's client_id) and
+    `workers` tasks take them by weighted deficit round robin, so a noisy client
+    cannot starve the others; coroutine functions are awaited, plain functions run
+    on a thread pool of the same size. Each run is bounded by a timeout and
+    retried with backoff; a plain function that timed out is still running on its
+    thread, so it is only retried if declared idempotent.
+    admit() applies a client's event-rate quota before decoding: events over it
+    are dropped, or deferred to a lane that only runs when no in-quota action waits.
+    When `queue_size` actions are queued the `overflow` policy applies to the
+    client with the most queued actions for its weight:
+      block        submit() waits for room (backpressure onto the listener)
+      drop_oldest  that client's oldest queued action is discarded
+      spill        that client's newest actions go to an on-disk overflow file, fed back in order as the queue drains
+    `on_settled(action_id, event)`, if set, is called once per submitted action when
+    it is done with: run (or failed for good), dropped, or written to the spill file,
+    which outlives the process.
+    """
+
+    def __init__(self, dispatcher: Dict[str, Callable], workers: int = 16, queue_size: int = 10000,
+                 timeout: float = 10.0, retries: int = 2, retry_backoff: float = 0.5,
+                 overflow: str = "spill", spill_path: Optional[str] = None,
+                 client_options: Optional[Dict[str, dict]] = None, action_options: Optional[Dict[str, dict]] = None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}', expected one of {OVERFLOW_POLICIES}")
+        if overflow == "spill" and not spill_path:
+            raise ValueError("The spill overflow policy needs a spill_path")
+        self.dispatcher = dispatcher
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.overflow = overflow
+        self._spill = _SpillFile(spill_path) if overflow == "spill" else None
+        self._spill_all = bool(self._spill and self._spill.pending) # Owners of leftover records are unknown
+        self._options: Dict[str, dict] = {}
+        for action_id, options in (action_options or {}).items():
+            self.set_action_options(action_id, **options)
+        self._client_options: Dict[str, dict] = {}
+        self._clients: Dict[str, _ClientQueue] = {}
+        for client_id, options in (client_options or {}).items():
+            self.set_client_options(client_id, **options)
+        self._rings = (deque(), deque()) # Clients with queued actions, per lane
+        self._queued = 0 # Actions in memory
+        self._unfinished = 0 # ...plus the ones running
+        self._wakeup = asyncio.Event()
+        self._room = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._stats: Dict[str, _ActionStats] = {}
+        self._tasks = []
+        self._stopping = False
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._serial_executor: Optional[ThreadPoolExecutor] = None
+        self._spill_io: Optional[ThreadPoolExecutor] = None # The spill file's IO thread
+        self._spill_buffer = [] # Pickled records waiting for the IO thread
+        self._spill_buffer_lock = threading.Lock()
+        self._refill_task: Optional[asyncio.Task] = None
+        self._queue_wait = deque(maxlen=1024)
+        self.submitted = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.on_settled: Optional[Callable[[str, dict], None]] = None
+
+    def set_spill_path(self, path: str) -> None:
+        """
+        Moves the overflow file before start(). Every process running a pipeline needs
+        its own: leftovers are replayed, and the file truncated, by whoever opens it.
+        """
+        if self._tasks:
+            raise RuntimeError("The spill path cannot change while the pipeline runs")
+        if self._spill is not None:
+            self._spill = _SpillFile(path)
+            self._spill_all = bool(self._spill.pending)
+
+    def set_action_options(self, action_id: str, timeout: Optional[float] = None, retries: Optional[int] = None,
+                           idempotent: bool = False, serial: bool = False) -> None:
+        """
+        Overrides the pipeline-wide timeout/retries for one action. A plain function is
+        retried after a timeout only if `idempotent`; `serial` runs it on a thread of its
+        own, one call at a time in the order workers take them (per client, submit order).
+        """
+        self._options[action_id] = {"timeout": timeout, "retries": retries, "idempotent": idempotent, "serial": serial}
+
+    def set_client_options(self, client_id: Optional[str], weight: Optional[float] = None, rate: Optional[float] = None,
+                           burst: Optional[float] = None, quota_overflow: Optional[str] = None) -> None:
+        """
+        Scheduling share (`weight`, default 1) and event quota (`rate` events/s, bursts
+        of `burst`) of one client; "*" sets the defaults for clients without options.
+        """
+        quota_overflow = quota_overflow or "defer"
+        if quota_overflow not in QUOTA_OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown quota overflow policy '{quota_overflow}', expected one of {QUOTA_OVERFLOW_POLICIES}")
+        if weight is not None and weight <= 0:
+            raise ValueError(f"Client weight must be positive, got {weight}")
+        key = client_id if client_id == "*" else self._key(client_id)
+        options = {"weight": weight or 1.0, "rate": rate, "burst": burst, "quota_overflow": quota_overflow}
+        self._client_options[key] = options
+        # Clients seen before pick up the new options (the "*" defaults too, unless they have their own)
+        for client in self._clients.values():
+            if client.key == key or (key == "*" and client.key not in self._client_options):
+                self._configure(client, options)
+
+    @staticmethod
+    def _key(client_id) -> str:
+        return NO_CLIENT if client_id is None else str(client_id)
+
+    @staticmethod
+    def _configure(client: _ClientQueue, options: dict) -> None:
+        client.weight = options["weight"]
+        client.quota = _Quota(options["rate"], options["burst"]) if options["rate"] else None
+        client.quota_overflow = options["quota_overflow"]
+
+    def _client(self, client_id) -> _ClientQueue:
+        key = self._key(client_id)
+        client = self._clients.get(key)
+        if client is None:
+            client = self._clients[key] = _ClientQueue(key)
+            options = self._client_options.get(key) or self._client_options.get("*")
+            if options:
+                self._configure(client, options)
+        return client
+
+    # --- Lifecycle ---
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        # Bound to the running loop (the backfill and benchmarks start pipelines in fresh loops)
+        self._wakeup, self._room, self._idle = asyncio.Event(), asyncio.Event(), asyncio.Event()
+        if not self._unfinished:
+            self._idle.set()
+        self._wakeup.set()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="action")
+        self._serial_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="action-serial")
+        if self._spill is not None:
+            self._spill_io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="action-spill")
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self._spill is not None and self._spill.pending:
+            print(f"Action pipeline: replaying {self._spill.pending} spilled action(s) from {self._spill.path}.")
+            self._schedule_refill()
+
+    async def close(self, drain_timeout: float = 5.0) -> None:
+        """Waits up to `drain_timeout` for queued actions; with the spill policy the rest are kept on disk."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+        # wait_for (3.11) can swallow a cancel that races an action finishing: workers also check the flag
+        self._stopping = True
+        self._wakeup.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._refill_task is not None:
+            # Records it already read from disk are queued now, and kept with the rest below
+            await asyncio.gather(self._refill_task, return_exceptions=True)
+            self._refill_task = None
+        left = []
+        for client in self._clients.values():
+            for lane in client.lanes:
+                left.extend(lane)
+                lane.clear()
+            client.active = [False, False]
+            client.spill_pending = 0
+        for ring in self._rings:
+            ring.clear()
+        self._queued = self._unfinished = 0
+        self._idle.set()
+        left.sort(key=lambda item: item[2])
+        if self._spill is not None:
+            # Queued actions are older than the unread spill records: keep them in front
+            front = [(action_id, event) for action_id, event, _, _, _ in left]
+            self._spill.pending = await asyncio.get_running_loop().run_in_executor(self._spill_io, self._spill.rewrite, front)
+            self._spill_all = bool(self._spill.pending)
+            self._spill_io.shutdown(wait=False)
+            self._spill_io = None
+        if left:
+            kept = "spilled to disk" if self._spill is not None else "dropped"
+            print(f"Action pipeline: {len(left)} queued action(s) {kept} at shutdown.")
+            if self._spill is not None:
+                for action_id, event, _, _, tracked in left:
+                    if tracked:
+                        self._settle(action_id, event)
+        self._executor.shutdown(wait=False)
+        self._serial_executor.shutdown(wait=False)
+
+    async def join(self) -> None:
+        """Waits until every queued and spilled action has run."""
+        while True:
+            await self._idle.wait()
+            if self._spill is None or not self._spill.pending:
+                return
+            if not await self._schedule_refill():
+                return # Unreadable spill file (reported by _refill)
+
+    # --- Ingestion side ---
+    def admit(self, client_id) -> str:
+        """
+        Checks one event of `client_id` against its quota before it is decoded:
+        "ok", "defer" (submit its actions with deferred=True) or "drop".
+        """
+        client = self._client(client_id)
+        client.events += 1
+        if client.quota is None or client.quota.take():
+            admission = "ok"
+        elif client.quota_overflow == "drop":
+            client.quota_dropped += 1
+            admission = "drop"
+        else:
+            client.deferred += 1
+            admission = "defer"
+        CLIENT_EVENTS.labels(client.key, admission).inc()
+        return admission
+
+    async def submit(self, action_id: str, event: dict, deferred: bool = False) -> None:
+        client = self._client(event.get("client_id"))
+        self.submitted += 1
+        client.submitted += 1
+        if self._spill is not None and self._spill.pending and (self._spill_all or client.spill_pending):
+            # Older actions of this client are still on disk: queue behind them to keep order
+            self._spill_record(client, (action_id, event))
+            return
+        if self._queued >= self.queue_size:
+            if self.overflow == "block":
+                while self._queued >= self.queue_size:
+                    self._room.clear()
+                    await self._room.wait()
+            else:
+                victim = self._heaviest(client)
+                if self.overflow == "drop_oldest":
+                    self.dropped += 1
+                    victim.dropped += 1
+                    ACTION_OVERFLOW_TOTAL.labels("dropped").inc()
+                    CLIENT_DROPPED.labels(victim.key, "dropped").inc()
+                    if not len(victim):
+                        self._settle(action_id, event)
+                        return # Nothing of this client queued: the new action is its oldest
+                    victim_action, victim_event, _, _, tracked = (victim.lanes[1] or victim.lanes[0]).popleft()
+                    self._queued -= 1
+                    self._finished_one()
+                    if tracked:
+                        self._settle(victim_action, victim_event)
+                elif victim is client:
+                    self._spill_record(client, (action_id, event))
+                    return
+                else:
+                    # Make room by moving the victim's newest action to disk; its next ones follow it
+                    newest = max((lane for lane in victim.lanes if lane), key=lambda lane: lane[-1][2])
+                    victim_action, victim_event, _, _, tracked = newest.pop()
+                    self._queued -= 1
+                    self._finished_one()
+                    self._spill_record(victim, (victim_action, victim_event), settle=tracked)
+        # The last field: settle when done (actions fed back from the spill file were settled when spilled)
+        self._enqueue(client, (action_id, event, time.perf_counter(), client, True), 1 if deferred else 0)
+
+    def _heaviest(self, incoming: _ClientQueue) -> _ClientQueue:
+        """The client with the most queued actions for its weight, counting the one being submitted."""
+        victim, load = incoming, (len(incoming) + 1) / incoming.weight
+        for client in self._clients.values():
+            if client is not incoming and len(client) and len(client) / client.weight > load:
+                victim, load = client, len(client) / client.weight
+        return victim
+
+    def _settle(self, action_id: str, event: dict) -> None:
+        if self.on_settled is not None:
+            try:
+                self.on_settled(action_id, event)
+            except Exception as e:
+                print(f"  Action pipeline Error: on_settled failed for '{action_id}': {e}")
+
+    def _spill_record(self, client: _ClientQueue, record: tuple, settle: bool = True) -> None:
+        data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        if self._spill_io is not None:
+            with self._spill_buffer_lock:
+                self._spill_buffer.append(data)
+                first = len(self._spill_buffer) == 1
+            if first:
+                # Queued before any later read, and writes whatever was buffered by the time it runs
+                self._spill_io.submit(self._write_spill_buffer).add_done_callback(self._spill_written)
+        else:
+            self._spill.append([data])
+        self._spill.pending += 1
+        client.spill_pending += 1
+        client.spilled += 1
+        self.spilled += 1
+        ACTION_OVERFLOW_TOTAL.labels("spilled").inc()
+        CLIENT_DROPPED.labels(client.key, "spilled").inc()
+        if settle:
+            self._settle(*record)
+
+    def _enqueue(self, client: _ClientQueue, item: tuple, lane: int) -> None:
+        client.lanes[lane].append(item)
+        if not client.active[lane]:
+            client.active[lane] = True
+            client.deficit[lane] = client.weight
+            self._rings[lane].append(client)
+        self._queued += 1
+        self._unfinished += 1
+        self._idle.clear()
+        self._wakeup.set()
+
+    def _write_spill_buffer(self) -> None:
+        with self._spill_buffer_lock:
+            records, self._spill_buffer = self._spill_buffer, []
+        self._spill.append(records)
+
+    @staticmethod
+    def _spill_written(future) -> None:
+        if future.exception() is not None:
+            print(f"  Action pipeline Error: failed to write a spilled action: {future.exception()}")
+
+    def _schedule_refill(self) -> asyncio.Task:
+        """Starts feeding spilled actions back into the queues, unless a refill is already running."""
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill())
+        return self._refill_task
+
+    async def _refill(self) -> int:
+        """Queues up to the free room of spilled actions. Returns how many."""
+        room = self.queue_size - self._queued
+        if room <= 0:
+            return 0
+        try:
+            records = await asyncio.get_running_loop().run_in_executor(self._spill_io, self._spill.read, room)
+        except Exception as e:
+            print(f"  Action pipeline Error: failed to read spilled actions: {e}")
+            return 0
+        self._spill.pending = max(0, self._spill.pending - len(records))
+        for action_id, event in records:
+            client = self._client(event.get("client_id"))
+            client.spill_pending = max(0, client.spill_pending - 1)
+            self._enqueue(client, (action_id, event, time.perf_counter(), client, False), 0)
+        if not self._spill.pending:
+            self._spill_all = False
+            for client in self._clients.values():
+                client.spill_pending = 0
+        return len(records)
+
+    # --- Execution side ---
+    def _pop(self) -> Optional[tuple]:
+        """Next action by deficit round robin; deferred actions only when no in-quota action waits."""
+        for lane, ring in enumerate(self._rings):
+            while ring:
+                client = ring[0]
+                queue = client.lanes[lane]
+                if not queue:
+                    ring.popleft()
+                    client.active[lane] = False
+                    client.deficit[lane] = 0.0
+                    continue
+                if client.deficit[lane] < 1.0:
+                    # Quantum used up: the next client's turn, this one is credited for its next
+                    ring.rotate(-1)
+                    client.deficit[lane] += client.weight
+                    continue
+                client.deficit[lane] -= 1.0
+                self._queued -= 1
+                self._room.set()
+                return queue.popleft()
+        return None
+
+    def _finished_one(self) -> None:
+        self._unfinished -= 1
+        if not self._unfinished:
+            self._idle.set()
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            item = self._pop()
+            if item is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            action_id, event, enqueued_at, client, tracked = item
+            try:
+                waited = time.perf_counter() - enqueued_at
+                self._queue_wait.append(waited)
+                client.waits.append(waited)
+                ACTION_QUEUE_WAIT.observe(waited)
+                await self._run(action_id, event)
+                latency = time.perf_counter() - enqueued_at
+                client.completed += 1
+                client.latencies.append(latency)
+                CLIENT_LATENCY.labels(client.key).observe(latency)
+                if tracked:
+                    self._settle(action_id, event)
+            finally:
+                self._finished_one()
+                if self._spill is not None and self._spill.pending and self._queued <= self.queue_size // 2:
+                    self._schedule_refill()
+
+    async def _run(self, action_id: str, event: dict) -> None:
+        func = self.dispatcher.get(action_id)
+        stats = self._stats.setdefault(action_id, _ActionStats())
+        if func is None:
+            stats.failed += 1
+            print(f"  Warning: Unknown action '{action_id}' configured.")
+            return
+        options = self._options.get(action_id, {})
+        timeout = options.get("timeout") or self.timeout
+        retries = options.get("retries")
+        retries = self.retries if retries is None else retries
+        is_async = inspect.iscoroutinefunction(func)
+        executor = self._serial_executor if options.get("serial") else self._executor
+        attempts = 0
+        while attempts <= retries:
+            attempts += 1
+            started = time.perf_counter()
+            try:
+                if is_async:
+                    await asyncio.wait_for(func(event), timeout)
+                else:
+                    started = await self._run_in_thread(executor, func, event, timeout)
+                elapsed = time.perf_counter() - started
+                stats.record(elapsed)
+                ACTION_SECONDS.labels(action_id).observe(elapsed)
+                ACTION_RUNS.labels(action_id, "ok").inc()
+                return
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                stats.timeouts += 1
+                error = f"timed out after {timeout}s"
+                if not is_async and not options.get("idempotent"):
+                    # A timed-out thread cannot be interrupted: running it again could apply it twice
+                    error += ", left running and not retried"
+                    break
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            if attempts <= retries:
+                stats.retries += 1
+                ACTION_RETRIES_TOTAL.labels(action_id).inc()
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempts - 1))
+        stats.failed += 1
+        ACTION_RUNS.labels(action_id, "failed").inc()
+        print(f"  ACTION ERROR ({action_id}): {error} (after {attempts} attempt(s))")
+
+    @staticmethod
+    async def _run_in_thread(executor: ThreadPoolExecutor, func: Callable, event, timeout: float) -> float:
+        """
+        Runs func(event) on `executor` and returns the perf_counter time it started at. The
+        timeout counts from that start, not from the wait for a free thread (serial actions queue).
+        """
+        started_at = []
+        def call():
+            started_at.append(time.perf_counter())
+            return func(event)
+        future = asyncio.wrap_future(executor.submit(call))
+        while True:
+            remaining = timeout - (time.perf_counter() - started_at[0]) if started_at else timeout
+            await asyncio.wait((future,), timeout=max(0.0, remaining)) # Never cancels the call
+            if future.done():
+                future.result()
+                return started_at[0]
+            if started_at and time.perf_counter() - started_at[0] >= timeout:
+                raise asyncio.TimeoutError
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    @property
+    def spilled_pending(self) -> int:
+        return self._spill.pending if self._spill is not None else 0
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "queue_size": self.queue_size,
+            "spilled_pending": self.spilled_pending,
+            "overflow": self.overflow,
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "queue_wait_p99_ms": _percentile_ms(self._queue_wait, 0.99),
+            "actions": {action_id: s.as_dict() for action_id, s in self._stats.items()},
+            "clients": {key: c.as_dict() for key, c in self._clients.items()},
+        }
@@ -2,22 +2,60 @@ import sys
 import json
 import os
 
-# Setup Django-like path resolution
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# Run as a script, Python puts this directory first on the path, where the regular
+# agent/agent package would shadow the top-level `agent` namespace: use the repo root
+sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-from tools.monitoring_tools import add_contract_tracking_target
+from agent.tools.monitoring_tools import add_contract_tracking_target
+
+DEFAULT_EVENTS = ["Transfer", "Approval"]  # Default common events
+DEFAULT_ACTIONS = ["log_event", "check_value"]
+
+def add_many(addresses):
+    """Onboards many contracts at once: one batched, rate-limited ABI fetch and one registry write."""
+    from agent.config import ABI_DIR, BASESCAN_API_KEY
+    from agent.tools import contract_manager
+    from agent.tools.abi_store import fetch_and_save_abis
+
+    results = fetch_and_save_abis(addresses, BASESCAN_API_KEY, ABI_DIR)
+    entries = []
+    for address, result in results.items():
+        if isinstance(result, Exception):
+            print(f"Error: {address}: failed to fetch ABI: {result}")
+            continue
+        existing = contract_manager.get_contract(address) or {}
+        entries.append({
+            "contract_address": address,
+            "abi_path": result,
+            "events_to_track": DEFAULT_EVENTS,
+            "actions": DEFAULT_ACTIONS,
+            "client_id": existing.get("client_id"),
+            "extra_info": existing.get("extra_info"),
+        })
+    count = contract_manager.add_or_update_contracts(entries)
+    print(f"Added/updated {count} of {len(results)} contract(s).")
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python add_contract.py <contract_address>")
+        print("Usage: python add_contract.py <contract_address> [<contract_address> ...]")
+        print("       python add_contract.py --file addresses.txt")
         sys.exit(1)
 
+    if sys.argv[1] == "--file":
+        with open(sys.argv[2], "r") as f:
+            addresses = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        add_many(addresses)
+        return
+    if len(sys.argv) > 2:
+        add_many(sys.argv[1:])
+        return
+
     contract_address = sys.argv[1]
 
     # Use default values for ABI filename (will trigger auto-fetch), events, actions
     abi_filename = f"abi_{contract_address.lower()}.json"
-    events_to_track = ["Transfer", "Approval"]  # Default common events
-    actions = ["log_event", "check_value"]
+    events_to_track = DEFAULT_EVENTS
+    actions = DEFAULT_ACTIONS
 
     result = add_contract_tracking_target(
         contract_address=contract_address,
@@ -28,4 +66,4 @@ def main():
     print(result)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -4,6 +4,8 @@ from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 def get_agent_prompt(available_tool_names: list[str]) -> ChatPromptTemplate:
     # Dynamically build parts of the prompt based on available tools
     capabilities = ["- Checking native ETH balances for addresses on the Base network using Basescan."]
+    if "get_base_native_balances" in available_tool_names:
+        capabilities.append("- Checking balances for many addresses at once (e.g. airdrop eligibility) with a single tool call.")
     if "get_latest_tweets_from_user" in available_tool_names:
         capabilities.append("- Getting recent tweets from specific X users.")
         # Inside get_agent_prompt function...
@@ -13,6 +15,8 @@ def get_agent_prompt(available_tool_names: list[str]) -> ChatPromptTemplate:
          capabilities.append("- List contracts currently being monitored by the background listener.")
     if "get_recent_tracked_events" in available_tool_names:
          capabilities.append("- Show recent events detected by the background listener.")
+    if "get_token_holders" in available_tool_names:
+         capabilities.append("- Build airdrop recipient lists from the holder ledger of tracked ERC20 tokens (balances at a block, minimum balance, activity window).")
 
     # Adjust system message wording...
     system_message = f"""You are an assistant that configures and queries a background service monitoring Base network contracts..."""
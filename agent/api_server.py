@@ -1,10 +1,36 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Optional
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from .tools.monitoring_tools import add_contract_tracking_target
-from .background_listener import RECENT_EVENTS_LOG
+from .background_listener import RECENT_EVENTS, get_action_stats, get_decode_stats, get_rpc_stats, get_transfer_stats
+from .config import STREAM_BUFFER_SIZE, STREAM_KEEPALIVE_SECONDS, EVENT_BUS_PATH
+from .event_bus import EventBusClient
+from .event_record import json_default, records_json
+from .event_stream import EventBroadcaster
+from .metrics import REGISTRY as METRICS
+from .tools.cache import TOOL_CACHE
 
-app = FastAPI()
+# Pushes new RECENT_EVENTS entries to /events/stream subscribers
+BROADCASTER = EventBroadcaster(RECENT_EVENTS, buffer_size=STREAM_BUFFER_SIZE)
+# The listener runs in another process: its events are mirrored into RECENT_EVENTS over the event bus
+BUS_CLIENT = EventBusClient(EVENT_BUS_PATH, RECENT_EVENTS) if EVENT_BUS_PATH else None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    BROADCASTER.attach(asyncio.get_running_loop())
+    if BUS_CLIENT is not None:
+        BUS_CLIENT.start()
+    yield
+    if BUS_CLIENT is not None:
+        BUS_CLIENT.stop()
+    BROADCASTER.detach()
+
+app = FastAPI(lifespan=lifespan)
 
 class TrackRequest(BaseModel):
     contract_address: str
@@ -27,8 +53,97 @@ def add_contract(req: TrackRequest):
     return {"message": result}
 
 @app.get("/get_events")
-def get_events():
-    return {"events": RECENT_EVENTS_LOG[-100:]}
+def get_events(
+    contract: Optional[str] = None,
+    event: Optional[str] = None,
+    client_id: Optional[str] = None,
+    block_number: Optional[int] = None,
+    from_block: Optional[int] = None,
+    to_block: Optional[int] = None,
+    cursor: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Newest-first decoded events. Pass next_cursor back as `cursor` for the next page."""
+    events, next_cursor = RECENT_EVENTS.query(
+        address=contract,
+        event=event,
+        client_id=client_id,
+        block_number=block_number,
+        from_block=from_block,
+        to_block=to_block,
+        cursor=cursor,
+        limit=limit,
+    )
+    # Records are encoded straight to compact JSON, skipping FastAPI's generic encoder
+    body = f'{{"events":{records_json(events)},"next_cursor":{json.dumps(next_cursor)}}}'
+    return Response(body, media_type="application/json")
+
+def _sse_message(kind: str, entry: Optional[dict]) -> str:
+    if kind == "keepalive":
+        return ": keepalive\n\n"
+    data = json.dumps(entry, separators=(",", ":"), default=json_default)
+    if kind == "event":
+        # Plain messages carry the seq as the SSE id, so EventSource resumes via Last-Event-ID
+        return f"id: {entry.seq}\ndata: {data}\n\n"
+    return f"event: {kind}\ndata: {data}\n\n"
+
+@app.get("/events/stream")
+async def stream_events(
+    contract: Optional[str] = None,
+    event: Optional[str] = None,
+    client_id: Optional[str] = None,
+    cursor: Optional[int] = None,
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Server-Sent Events stream of decoded events matching the filters, pushed as they
+    are recorded. Reconnecting clients resume after `Last-Event-ID` (or `cursor`).
+    Other message types: `removed` (log dropped by a reorg), `gap` (events after the
+    cursor were already evicted) and `overflow` (client fell behind; reconnect to resume).
+    """
+    if last_event_id and last_event_id.isdigit():
+        cursor = int(last_event_id)
+
+    async def messages():
+        async for kind, entry in BROADCASTER.stream(
+            address=contract, event=event, client_id=client_id, cursor=cursor,
+            keepalive=STREAM_KEEPALIVE_SECONDS
+        ):
+            yield _sse_message(kind, entry)
+
+    return StreamingResponse(
+        messages(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/stats")
+def get_stats():
+    """Listener diagnostics: action queue depth/latency, per-event decode cost and stream subscribers."""
+    if BUS_CLIENT is not None and BUS_CLIENT.connected:
+        try:
+            stats = BUS_CLIENT.request("stats")
+        except Exception as e:
+            stats = {"error": f"listener stats unavailable: {e}"}
+        stats["event_bus_client"] = BUS_CLIENT.stats()
+    else:
+        stats = {"actions": get_action_stats(), "decoding": get_decode_stats(), "transfers": get_transfer_stats(), "rpc": get_rpc_stats()}
+    stats["streaming"] = BROADCASTER.stats()
+    stats["tool_cache"] = TOOL_CACHE.stats()
+    return stats
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Listener metrics (latency histograms, log counters, queue depths, lag) in Prometheus text format."""
+    text = None
+    if BUS_CLIENT is not None and BUS_CLIENT.connected:
+        try:
+            text = BUS_CLIENT.request("metrics") # Served by the listener process (all shards when sharded)
+        except Exception as e:
+            print(f"API Warning: listener metrics unavailable: {e}")
+    if text is None:
+        text = METRICS.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4; charset=utf-8")
 
 if __name__ == "__main__":
     uvicorn.run("agent.api_server:app", host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,342 @@
+# backfill.py
+"""
+Historical event backfill over eth_getLogs.
+
+Usage:
+    python -m agent.backfill --from-block 12000000 [--to-block 13000000] [--address 0x...] [--rpc-url URL,URL]
+
+Logs are fetched in concurrent block-range chunks (sized adaptively to the
+provider's result limits), then decoded and dispatched strictly in block order
+through the same handle_event / ACTION_DISPATCHER path as live events.
+A per-contract checkpoint (last fully processed block) is saved as ranges
+complete, so an interrupted run resumes where it stopped.
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+from agent.tools.utils import atomic_write_json, file_lock
+
+# Substrings providers use when a getLogs range returns too much data
+_RANGE_ERROR_HINTS = ("more than", "too many results", "too large", "block range", "limit exceeded",
+                      "-32005", "response size", "message too big")
+# ...as opposed to throttling, which is retried with backoff rather than split
+_RATE_LIMIT_HINTS = ("rate limit", "429", "too many requests")
+
+
+def _is_range_error(error: Exception) -> bool:
+    message = str(error).lower()
+    if any(hint in message for hint in _RATE_LIMIT_HINTS):
+        return False
+    return any(hint in message for hint in _RANGE_ERROR_HINTS)
+
+
+class BackfillCheckpoints:
+    """
+    Per-contract last processed block, persisted as JSON with atomic rewrites.
+    Several listener processes may share the file: save() merges with what is on
+    disk under a file lock, keeping the furthest block per contract.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._blocks: Dict[str, int] = self._read()
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, int]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return {addr.lower(): int(block) for addr, block in json.load(f).items()}
+        except (json.JSONDecodeError, ValueError) as e:
+            print(f"Warning: ignoring unreadable backfill checkpoints at {self.path}: {e}")
+            return {}
+
+    def get(self, address: str) -> Optional[int]:
+        return self._blocks.get(address.lower())
+
+    def advance(self, address: str, block: int) -> None:
+        """Moves the checkpoint forward only; never rewinds."""
+        address = address.lower()
+        with self._lock:
+            if block > self._blocks.get(address, -1):
+                self._blocks[address] = block
+                self._dirty = True
+
+    def refresh(self) -> None:
+        """Picks up checkpoints other processes saved (e.g. for contracts handed over by another shard)."""
+        on_disk = self._read()
+        with self._lock:
+            for addr, block in on_disk.items():
+                if block > self._blocks.get(addr, -1):
+                    self._blocks[addr] = block
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = dict(self._blocks)
+            self._dirty = False
+        with file_lock(self.path):
+            for addr, block in self._read().items():
+                if block > snapshot.get(addr, -1):
+                    snapshot[addr] = block
+            atomic_write_json(self.path, snapshot, indent=2)
+
+
+class BlockProgress:
+    """
+    Moves checkpoints only past blocks whose actions have settled (run, failed for
+    good, dropped or spilled to disk), so actions still queued when the process
+    dies are replayed on restart. Feed it submitted() before each action is handed
+    to the pipeline, settled() from the pipeline's on_settled, and reached() once
+    every log of a contract up to a block has been handled. Event loop only.
+    """
+
+    def __init__(self, checkpoints: BackfillCheckpoints):
+        self.checkpoints = checkpoints
+        self._outstanding: Dict[str, Dict[int, int]] = {} # address -> block -> unsettled actions
+        self._heaps: Dict[str, List[int]] = {} # address -> outstanding blocks (lazily pruned min-heap)
+        self._reached: Dict[str, int] = {}
+
+    def submitted(self, address: str, block: int, count: int = 1) -> None:
+        outstanding = self._outstanding.setdefault(address, {})
+        if block not in outstanding:
+            outstanding[block] = 0
+            heapq.heappush(self._heaps.setdefault(address, []), block)
+        outstanding[block] += count
+
+    def settled(self, address: str, block: int) -> None:
+        outstanding = self._outstanding.get(address)
+        if not outstanding or block not in outstanding:
+            return
+        outstanding[block] -= 1
+        if outstanding[block] <= 0:
+            del outstanding[block]
+            self._update(address)
+
+    def reached(self, address: str, block: int) -> None:
+        if block > self._reached.get(address, -1):
+            self._reached[address] = block
+            self._update(address)
+
+    def unsettled(self) -> int:
+        return sum(sum(blocks.values()) for blocks in self._outstanding.values())
+
+    def _update(self, address: str) -> None:
+        block = self._reached.get(address)
+        if block is None:
+            return
+        outstanding, heap = self._outstanding.get(address), self._heaps.get(address)
+        while heap and heap[0] not in outstanding:
+            heapq.heappop(heap)
+        if heap:
+            block = min(block, heap[0] - 1)
+        self.checkpoints.advance(address, block)
+
+
+class LogBackfiller:
+    """
+    Fetches logs for a set of addresses/topics between two blocks.
+    Up to `concurrency` chunk requests are in flight; results are yielded in
+    block order. The chunk size halves when the provider rejects a range as too
+    large and grows again while responses stay small, though not past half the
+    smallest range rejected so far (or every chunk would be rejected and split again).
+    """
+
+    def __init__(self, w3, chunk_size: int = 2000, min_chunk_size: int = 10, max_chunk_size: int = 100000,
+                 concurrency: int = 4, target_logs_per_request: int = 5000, max_retries: int = 3):
+        self.w3 = w3
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.concurrency = concurrency
+        self.target_logs_per_request = target_logs_per_request
+        self.max_retries = max_retries
+        self.ceiling = max_chunk_size # Largest chunk the provider is expected to accept
+        self.requests = 0
+
+    async def _get_logs(self, log_filter: dict, start: int, end: int) -> list:
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.requests += 1
+                logs = await self.w3.eth.get_logs({**log_filter, "fromBlock": start, "toBlock": end})
+            except Exception as e:
+                if _is_range_error(e) and end > start:
+                    # Too much data for one call: split the range and shrink future chunks
+                    self.ceiling = max(self.min_chunk_size, min(self.ceiling, (end - start + 1) // 2))
+                    self.chunk_size = min(self.chunk_size, self.ceiling)
+                    mid = (start + end) // 2
+                    return await self._get_logs(log_filter, start, mid) + await self._get_logs(log_filter, mid + 1, end)
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(0.5 * 2 ** attempt)
+                continue
+            if len(logs) < self.target_logs_per_request // 4:
+                self.chunk_size = min(self.ceiling, self.chunk_size * 2)
+            return list(logs)
+
+    async def iter_ranges(self, log_filter: dict, from_block: int, to_block: int):
+        """Yields (start, end, logs) per chunk, in ascending block order."""
+        pending = deque()
+        next_start = from_block
+        try:
+            while next_start <= to_block or pending:
+                while len(pending) < self.concurrency and next_start <= to_block:
+                    end = min(to_block, next_start + self.chunk_size - 1)
+                    task = asyncio.create_task(self._get_logs(log_filter, next_start, end))
+                    pending.append((next_start, end, task))
+                    next_start = end + 1
+                start, end, task = pending.popleft()
+                logs = await task
+                logs.sort(key=lambda log: (log["blockNumber"], log["logIndex"]))
+                yield start, end, logs
+        finally:
+            for _, _, task in pending:
+                task.cancel()
+
+
+async def backfill_contracts(w3, active_contracts: Dict[str, dict], checkpoints: BackfillCheckpoints,
+                             handler, to_block: Optional[int] = None, from_block: Optional[int] = None,
+                             addresses: Optional[Iterable[str]] = None, rewind_blocks: int = 0,
+                             progress: Optional[BlockProgress] = None, **backfiller_kwargs) -> int:
+    """
+    Replays history for `addresses` (default: all active contracts) through `handler(raw_log)`.
+    Each contract starts after its checkpoint, or else at its extra_info["start_block"]
+    or `from_block`; contracts with none of these are skipped. `rewind_blocks` starts
+    that many blocks before each checkpoint (the handler must tolerate repeats).
+    With `progress`, checkpoints wait for the actions the handler submitted to settle.
+    Returns the number of logs dispatched.
+    """
+    if to_block is None:
+        to_block = await w3.eth.block_number
+    wanted = set(a.lower() for a in addresses) if addresses is not None else set(active_contracts)
+    selected = {a: info for a, info in active_contracts.items() if a in wanted}
+
+    from agent.subscriptions import build_log_filters # Imports web3
+
+    dispatched = 0
+    for log_filter in build_log_filters(selected):
+        members = [a.lower() for a in log_filter["address"]]
+        starts = {}
+        for addr in members:
+            checkpoint = checkpoints.get(addr)
+            if checkpoint is not None:
+                start = max(0, checkpoint + 1 - rewind_blocks)
+            else:
+                # Contracts can be onboarded with an explicit history start
+                start = (selected[addr]["config"].get("extra_info") or {}).get("start_block", from_block)
+            if start is not None and start <= to_block:
+                starts[addr] = start
+        if not starts:
+            continue
+        log_filter = dict(log_filter, address=[a for a in log_filter["address"] if a.lower() in starts])
+        backfiller = LogBackfiller(w3, **backfiller_kwargs)
+        first_block = min(starts.values())
+        print(f"Backfill: {len(starts)} contract(s), blocks {first_block}-{to_block}")
+        started = time.monotonic()
+        last_save = started
+        async for start, end, logs in backfiller.iter_ranges(log_filter, first_block, to_block):
+            for raw_log in logs:
+                addr = raw_log["address"].lower()
+                # Skip blocks a contract with a later checkpoint already processed
+                if raw_log["blockNumber"] < starts.get(addr, 0):
+                    continue
+                await handler(raw_log)
+                dispatched += 1
+            for addr, contract_start in starts.items():
+                if contract_start <= end:
+                    if progress is not None:
+                        progress.reached(addr, end)
+                    else:
+                        checkpoints.advance(addr, end)
+            if time.monotonic() - last_save >= 1.0:
+                checkpoints.save()
+                last_save = time.monotonic()
+        checkpoints.save()
+        print(f"Backfill: done up to block {to_block} in {time.monotonic() - started:.1f}s "
+              f"({backfiller.requests} getLogs request(s), {dispatched} event(s) dispatched so far)")
+    return dispatched
+
+
+async def run_backfill(rpc_url: Optional[str], from_block: Optional[int], to_block: Optional[int],
+                       addresses: Optional[List[str]] = None, concurrency: int = 4, chunk_size: int = 2000) -> int:
+    """Backfills over `rpc_url` (comma-separated URLs form a pool), or by default the RPC_URLS pool."""
+    from agent import background_listener as listener
+    from agent.event_decoding import EventDecoderRegistry
+    from agent.rpc_pool import RPC_POOL, RpcPool, pooled_web3
+
+    # getLogs chunks spread over the pool: hedged when slow, moved on when an endpoint fails
+    pool = RpcPool(rpc_url.split(",")) if rpc_url else RPC_POOL
+    w3 = pooled_web3(pool)
+    listener.DECODER_REGISTRY = EventDecoderRegistry(w3)
+    listener.load_tracking_targets_from_storage()
+    active_contracts = {}
+    for addr, config in listener.TRACKING_TARGETS.items():
+        contract_info = listener.load_contract(addr, config)
+        if contract_info:
+            active_contracts[addr] = contract_info
+
+    async def handler(raw_log):
+        await listener.handle_event(raw_log, active_contracts, w3)
+
+    from agent.holder_ledger import HOLDER_LEDGERS
+    from agent.transfer_windows import TOKEN_DECIMALS, TRANSFER_WINDOWS
+    TOKEN_DECIMALS.w3 = w3
+    TRANSFER_WINDOWS.on_alert = listener.dispatch_alert
+    journal_task = asyncio.create_task(listener.EVENT_JOURNAL.run())
+    ledger_task = asyncio.create_task(HOLDER_LEDGERS.run())
+    windows_task = asyncio.create_task(TRANSFER_WINDOWS.run())
+    probe_task = asyncio.create_task(pool.run())
+    await listener.ACTION_PIPELINE.start()
+    try:
+        dispatched = await backfill_contracts(
+            w3, active_contracts, listener.BACKFILL_CHECKPOINTS, handler,
+            to_block=to_block, from_block=from_block, addresses=addresses, progress=listener.BLOCK_PROGRESS,
+            concurrency=concurrency, chunk_size=chunk_size
+        )
+        await listener.ACTION_PIPELINE.join() # Let the actions of the last events finish
+        return dispatched
+    finally:
+        await listener.ACTION_PIPELINE.close()
+        listener.BACKFILL_CHECKPOINTS.save() # Up to the blocks whose actions settled (or were spilled)
+        windows_task.cancel()
+        journal_task.cancel()
+        ledger_task.cancel()
+        probe_task.cancel() # Also closes the pool's sockets
+        await asyncio.gather(windows_task, journal_task, ledger_task, probe_task, return_exceptions=True)
+
+
+def main():
+    from agent.config import RPC_URLS
+
+    parser = argparse.ArgumentParser(description="Backfill tracked contract events via eth_getLogs.")
+    parser.add_argument("--from-block", type=int, default=None,
+                        help="Start block for contracts without a checkpoint (others resume from their checkpoint)")
+    parser.add_argument("--to-block", type=int, default=None, help="End block (default: latest)")
+    parser.add_argument("--address", action="append", help="Only backfill this contract (repeatable)")
+    parser.add_argument("--rpc-url", default=None, help="Comma-separated RPC URLs (default: RPC_URLS)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    args = parser.parse_args()
+    if not args.rpc_url and not RPC_URLS:
+        print("Backfill Error: no RPC URL configured (RPC_URLS / BASE_RPC_URL / BASE_WSS_URL).")
+        return
+    try:
+        count = asyncio.run(run_backfill(args.rpc_url, args.from_block, args.to_block, args.address,
+                                         args.concurrency, args.chunk_size))
+        print(f"Backfill complete: {count} event(s) dispatched.")
+    except KeyboardInterrupt:
+        print("\nBackfill interrupted; progress is saved in the checkpoint file.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,46 @@
 # background_listener.py
 import asyncio
+import functools
 import json
 import os
+import random
+import sys
 import time
-from web3 import Web3
-from web3.exceptions import ContractLogicError # To catch reverts cleanly
-from agent.config import BASE_WSS_URL, ABI_DIR
+from collections import Counter, OrderedDict, deque
+from agent import metrics
+from agent.config import (
+    ABI_DIR, LISTENER_WORKERS, LISTENER_QUEUE_SIZE, TARGETS_POLL_INTERVAL,
+    RECENT_EVENTS_MAX_SIZE, EVENT_JOURNAL_PATH, EVENT_JOURNAL_FLUSH_INTERVAL, EVENT_JOURNAL_FLUSH_SIZE,
+    EVENT_JOURNAL_RETENTION_DAYS, EVENT_JOURNAL_MAX_PENDING, EVENT_JOURNAL_BUSY_TIMEOUT, BACKFILL_CHECKPOINT_FILE, BACKFILL_CONCURRENCY, BACKFILL_CHUNK_SIZE,
+    DEDUP_CAPACITY, WSS_MAX_MESSAGE_SIZE, RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY, REORG_REPLAY_DEPTH,
+    MAX_ADDRESSES_PER_FILTER, ACTION_WORKERS, ACTION_QUEUE_SIZE, ACTION_TIMEOUT, ACTION_RETRIES,
+    ACTION_OVERFLOW, ACTION_SPILL_PATH, EVENT_BUS_PATH, ALERT_ACTIONS,
+    CLIENT_WEIGHTS, CLIENT_QUOTAS, CLIENT_QUOTA_OVERFLOW
+)
+from agent.action_pipeline import ActionPipeline, parse_client_options
+from agent.backfill import BackfillCheckpoints, BlockProgress, backfill_contracts
+from agent.delivery import DeliveryDeduplicator, log_key
+from agent.event_bus import EventBusServer
+from agent.event_journal import EventJournal
+from agent.event_record import EventRecord, to_hex
+from agent.event_store import RecentEventStore, format_event
 from agent.tools import contract_manager
 
+def _target_from_record(data):
+    return {
+        "abi_path": data.get("abi_path"),
+        "tracked_events": data.get("tracked_events", []),
+        "actions": data.get("actions", []),
+        "client_id": data.get("client_id"),
+        "extra_info": data.get("extra_info", {})
+    }
+
 def load_tracking_targets_from_storage():
     global TRACKING_TARGETS
     contracts = contract_manager.load_contracts()
     TRACKING_TARGETS.clear()
     for addr, data in contracts.items():
-        TRACKING_TARGETS[addr] = {
-            "abi_path": data.get("abi_path"),
-            "tracked_events": data.get("tracked_events", []),
-            "actions": data.get("actions", []),
-            "client_id": data.get("client_id"),
-            "extra_info": data.get("extra_info", {})
-        }
+        TRACKING_TARGETS[addr] = _target_from_record(data)
     print(f"Loaded {len(TRACKING_TARGETS)} contract(s) from persistent storage.")
 
 # --- Configuration (Managed via agent tools later) ---
@@ -32,181 +53,708 @@ TRACKING_TARGETS = {
     #     "actions": ["log_event", "check_value"] # Simple action identifiers
     # }
 }
-RECENT_EVENTS_LOG = [] # Store recent detected events for agent queries
-RECENT_EVENTS_FILE = os.path.join(os.path.dirname(__file__), "recent_events.json")
+RECENT_EVENTS = RecentEventStore(RECENT_EVENTS_MAX_SIZE) # Indexed recent events for agent/API queries
+DECODER_REGISTRY = None # EventDecoderRegistry, built once the listener connects
+# Durable history: batched appends to SQLite, RECENT_EVENTS is rebuilt from it at startup
+EVENT_JOURNAL = EventJournal(
+    EVENT_JOURNAL_PATH,
+    flush_interval=EVENT_JOURNAL_FLUSH_INTERVAL,
+    flush_size=EVENT_JOURNAL_FLUSH_SIZE,
+    retention_seconds=EVENT_JOURNAL_RETENTION_DAYS * 24 * 3600,
+    max_pending=EVENT_JOURNAL_MAX_PENDING,
+    busy_timeout=EVENT_JOURNAL_BUSY_TIMEOUT
+)
 
-async def persist_recent_events_periodically(interval_seconds=5):
-    while True:
+def restore_recent_events():
+    try:
+        events = EVENT_JOURNAL.replay(RECENT_EVENTS.maxlen)
+    except Exception as e:
+        print(f"Error restoring recent events from journal: {e}")
+        return
+    for event in events:
+        RECENT_EVENTS.append(event)
+    print(f"Restored {len(events)} recent event(s) from the event journal.")
+
+# Last fully processed block per contract, shared by live handling and backfill
+BACKFILL_CHECKPOINTS = BackfillCheckpoints(BACKFILL_CHECKPOINT_FILE)
+BLOCK_PROGRESS = BlockProgress(BACKFILL_CHECKPOINTS) # ...moved only past blocks whose actions have settled
+BACKFILLING = Counter() # Replays running per contract; live events don't move the checkpoint of one being replayed
+DELIVERED_LOGS = DeliveryDeduplicator(DEDUP_CAPACITY) # (txHash, logIndex) of recently handled logs
+
+# --- Sharding hooks (set by agent.sharding in listener worker processes) ---
+SHARD_FILTER = None # callable(address) -> bool: only matching contracts are tracked by this process
+EVENT_SINKS = [] # callables(kind, payload) receiving ("event", entry) and ("removed", (tx, logIndex, block))
+JOURNAL_EVENTS = True # Shards leave the journal to the supervisor, which writes the merged, de-duplicated stream
+_HANDLED_LOGS = {} # With a SHARD_FILTER: address -> deque of (block, log key) handled past its checkpoint
+_force_reload = None # Set while watch_tracking_targets runs
+
+def request_target_reload(on_applied=None):
+    """
+    Makes the watcher re-apply the contract store even if it did not change (e.g. a new
+    SHARD_FILTER). `on_applied()` is called on the listener's loop once it has been.
+    Returns False if the listener is not running.
+    """
+    if _force_reload is None:
+        return False
+    _force_reload(on_applied)
+    return True
+
+def _remember_handled(address, raw_log):
+    # What a new owner must not dispatch again if this contract is handed to another shard
+    handled = _HANDLED_LOGS.get(address)
+    if handled is None:
+        handled = _HANDLED_LOGS[address] = deque()
+    handled.append((raw_log["blockNumber"], log_key(raw_log)))
+    checkpoint = BACKFILL_CHECKPOINTS.get(address)
+    while checkpoint is not None and handled and handled[0][0] <= checkpoint:
+        handled.popleft()
+
+async def hand_over_targets():
+    """
+    Applies the current SHARD_FILTER now and returns {address: [log keys]} for the
+    contracts it dropped: the logs handled for them past their (saved) checkpoint,
+    which the next owner passes to adopt_handed_over() before replaying from there.
+    """
+    before = set(TRACKING_TARGETS)
+    applied = asyncio.get_running_loop().create_future()
+    if request_target_reload(lambda: applied.done() or applied.set_result(None)):
+        await applied
+    handed = {}
+    for addr in before.difference(TRACKING_TARGETS):
+        checkpoint = BACKFILL_CHECKPOINTS.get(addr)
+        handed[addr] = [key for block, key in _HANDLED_LOGS.pop(addr, ()) if checkpoint is None or block > checkpoint]
+    return handed
+
+def adopt_handed_over(handed):
+    """Marks the logs another shard handled for the contracts it handed over as delivered."""
+    for keys in handed.values():
+        for key in keys:
+            DELIVERED_LOGS.first_seen(key)
+
+def _emit(kind, payload):
+    for sink in EVENT_SINKS:
         try:
-            with open(RECENT_EVENTS_FILE, "w") as f:
-                json.dump(RECENT_EVENTS_LOG[-100:], f, indent=2)
+            sink(kind, payload)
         except Exception as e:
-            print(f"Error persisting recent events: {e}")
-        await asyncio.sleep(interval_seconds)
-MAX_LOG_SIZE = 100
+            print(f"Listener Warning: event sink failed: {e}")
 
 # --- Action Functions ---
 # Define simple functions the listener can trigger
 def log_event_action(event_data):
-    client_info = f" (Client: {event_data.get('client_id')})" if event_data.get('client_id') else ""
-    log_entry = f"{time.strftime('%Y-%m-%d %H:%M:%S')} DETECTED: {event_data['event']} on {event_data['address']} - Args: {event_data['args']} (Tx: {event_data['transactionHash']}){client_info}"
-    print(log_entry)
-    RECENT_EVENTS_LOG.append(log_entry)
-    if len(RECENT_EVENTS_LOG) > MAX_LOG_SIZE:
-        RECENT_EVENTS_LOG.pop(0) # Keep log size manageable
-
-def check_value_action(event_data):
-    # Example: Check value in a 'Transfer' event (adjust args based on actual event)
-    if event_data['event'] == 'Transfer' and 'value' in event_data['args']:
-        try:
-            # Assuming standard ERC20 Transfer event: Transfer(address indexed from, address indexed to, uint256 value)
-            value = event_data['args']['value']
-            # Note: Need contract decimals to interpret value correctly! Add to TRACKING_TARGETS if needed.
-            print(f"  CHECK_VALUE: Transfer on {event_data['address']} involved value: {value}")
-            # Add more logic: if value > threshold... send notification, etc.
-        except Exception as e:
-            print(f"  CHECK_VALUE: Error processing value: {e}")
+    started = time.perf_counter()
+    seq = RECENT_EVENTS.append(event_data) # Oldest entries are evicted once the store is full
+    entry = RECENT_EVENTS.get(seq)
+    if JOURNAL_EVENTS:
+        EVENT_JOURNAL.append(entry)
+    _emit("event", entry)
+    _RECORD_STAGE.observe(time.perf_counter() - started)
+    print(format_event(entry))
+
+def _transfer_args(event_data):
+    # ERC20 Transfer(from, to, value) as a tuple, or None. Arguments are taken by position
+    # (WETH names them src/dst/wad); ERC721 Transfers carry a tokenId instead of a value
+    if event_data['event'] != 'Transfer':
+        return None
+    if isinstance(event_data, EventRecord):
+        names, values = event_data.schema.arg_names, event_data.args
+    else:
+        names, values = list(event_data['args']), list(event_data['args'].values())
+    if len(names) != 3 or 'tokenid' in names[2].lower() or not isinstance(values[2], int):
+        return None
+    return to_hex(values[0]), to_hex(values[1]), values[2]
+
+async def check_value_action(event_data):
+    # Feeds Transfer values into the per-token/per-client windows; whale and volume-spike
+    # alerts are raised from there (see agent/transfer_windows.py)
+    transfer = _transfer_args(event_data)
+    if transfer is None:
+        return
+    from agent.transfer_windows import TOKEN_DECIMALS, TRANSFER_WINDOWS # numpy is only loaded once in use
+    token = event_data['address'].lower()
+    extra_info = (TRACKING_TARGETS.get(token) or {}).get('extra_info') or {}
+    decimals = extra_info.get('decimals')
+    if decimals is None:
+        decimals = await TOKEN_DECIMALS.get(token) # One RPC call per token, then cached
+    if 'whale_threshold' in extra_info or 'volume_threshold' in extra_info:
+        TRANSFER_WINDOWS.set_thresholds(token, extra_info.get('whale_threshold'), extra_info.get('volume_threshold'))
+    TRANSFER_WINDOWS.add(
+        token, event_data.get('client_id'), event_data['blockNumber'], *transfer, decimals,
+        tx_hash=event_data.get('transactionHash', ''), log_index=event_data.get('logIndex', 0)
+    )
+
+def track_holders_action(event_data):
+    # ERC20 Transfers into the token's holder ledger (see agent/holder_ledger.py)
+    transfer = _transfer_args(event_data)
+    if transfer is None:
+        return
+    from agent.holder_ledger import HOLDER_LEDGERS # numpy is only loaded once a ledger is in use
+    HOLDER_LEDGERS.record_transfer(event_data['address'], event_data['blockNumber'], *transfer)
+
+async def dispatch_alert(alert):
+    """Runs ALERT_ACTIONS on a whale / volume-spike alert raised by the transfer windows."""
+    subject = alert['address'] or f"client {alert['client_id']}"
+    print(f"  ALERT ({alert['alert']}): {alert['event']} on {subject} at block {alert['blockNumber']} - {alert['args']}")
+    for action_id in ALERT_ACTIONS:
+        if action_id in ACTION_DISPATCHER:
+            await ACTION_PIPELINE.submit(action_id, alert)
+        else:
+            print(f"  Warning: Unknown alert action '{action_id}' configured.")
 
 ACTION_DISPATCHER = {
     "log_event": log_event_action,
     "check_value": check_value_action,
-    # Add more complex actions here
+    "track_holders": track_holders_action,
+    # Add more complex actions here (plain functions run on a thread pool, async ones on the loop)
 }
+ACTION_OPTIONS = {
+    # Store, journal and bus appends run one at a time in the order they are taken off
+    # the queues, and are never re-run after a timeout (that would record the event twice)
+    "log_event": {"serial": True},
+}
+# Actions run here, off the decode path: bounded per-client queues served fairly by
+# a worker pool, with timeouts, retries and per-client event quotas
+ACTION_PIPELINE = ActionPipeline(
+    ACTION_DISPATCHER,
+    workers=ACTION_WORKERS,
+    queue_size=ACTION_QUEUE_SIZE,
+    timeout=ACTION_TIMEOUT,
+    retries=ACTION_RETRIES,
+    overflow=ACTION_OVERFLOW,
+    spill_path=ACTION_SPILL_PATH,
+    client_options=parse_client_options(CLIENT_WEIGHTS, CLIENT_QUOTAS, CLIENT_QUOTA_OVERFLOW),
+    action_options=ACTION_OPTIONS
+)
+
+def _action_settled(action_id, event):
+    # Alerts were never counted: only log events hold their block's checkpoint back
+    if isinstance(event, EventRecord) and event.address is not None:
+        BLOCK_PROGRESS.settled(event.address_key, event.block_number)
+
+ACTION_PIPELINE.on_settled = _action_settled
+
+# --- Metrics (served in Prometheus format by api_server at /metrics) ---
+LOGS_RECEIVED = metrics.counter("listener_logs_received_total", "Logs pushed by the node's log subscriptions", ["contract"])
+LOGS_MATCHED = metrics.counter("listener_logs_matched_total", "Logs decoded as a tracked event and dispatched to actions", ["contract"])
+LOGS_DROPPED = metrics.counter(
+    "listener_logs_dropped_total",
+    "Logs not dispatched, by reason (duplicate, reorged, unknown_contract, untracked_event, quota, decode_error)",
+    ["contract", "reason"]
+)
+STAGE_SECONDS = metrics.histogram("listener_stage_seconds", "Time per log in each handling stage (decode, dispatch, record)", ["stage"])
+EVENT_LAG = metrics.histogram("listener_event_lag_seconds", "Live events: block timestamp to action dispatch", buckets=metrics.LAG_BUCKETS)
+LOG_QUEUE_DEPTH = metrics.gauge("listener_log_queue_depth", "Logs received but not yet decoded")
+metrics.gauge("listener_tracked_contracts", "Contracts tracked by this process", fn=lambda: len(TRACKING_TARGETS))
+metrics.gauge("action_queue_depth", "Actions queued in memory", fn=lambda: ACTION_PIPELINE.queue_depth)
+metrics.gauge("action_spill_pending", "Actions waiting in the on-disk overflow file", fn=lambda: ACTION_PIPELINE.spilled_pending)
+metrics.gauge("journal_pending_events", "Recorded events not yet written to the journal", fn=lambda: EVENT_JOURNAL.pending)
+_DECODE_STAGE = STAGE_SECONDS.labels("decode")
+_DISPATCH_STAGE = STAGE_SECONDS.labels("dispatch")
+_RECORD_STAGE = STAGE_SECONDS.labels("record")
 
 
 # --- Core Listener Logic ---
-async def listen_for_events():
-    # Start background task to persist recent events
-    asyncio.create_task(persist_recent_events_periodically())
-    load_tracking_targets_from_storage()
-    if not BASE_WSS_URL:
-        print("Listener Error: Base WSS URL not configured.")
+@functools.lru_cache(maxsize=1024)
+def _read_abi(path, mtime_ns):
+    # Contracts sharing a content-addressed ABI file parse it once (mtime_ns invalidates rewritten legacy files)
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def load_contract(addr, config):
+    """Loads the ABI for one target and binds it to the shared decoder registry."""
+    full_abi_path = config.get("abi_path")
+    if not full_abi_path or not os.path.exists(full_abi_path):
+        print(f"Warning: ABI file not found for {addr} at {full_abi_path}. Skipping contract.")
+        return None
+    abi = _read_abi(full_abi_path, os.stat(full_abi_path).st_mtime_ns)
+    # Decoders are compiled once per distinct ABI and shared between contracts
+    decoders = DECODER_REGISTRY.register(addr, abi)
+    return {
+        "decoders": decoders,
+        "config": config,
+        "tracked_events": frozenset(config.get("tracked_events", [])),
+    }
+
+
+async def _event_worker(queue, active_contracts, w3):
+    # Decode + dispatch run here, off the socket reader, so a burst of logs
+    # queues up (bounded) instead of stalling the WebSocket receive loop
+    while True:
+        raw_log = await queue.get()
+        try:
+            address = raw_log["address"].lower()
+            LOGS_RECEIVED.labels(address).inc()
+            if await deliver_log(raw_log, active_contracts, w3):
+                _observe_lag(w3, raw_log, time.time())
+            # Subscriptions deliver in block order, so every earlier block has been received
+            # (the checkpoint still waits for the actions of those blocks to settle)
+            if address not in BACKFILLING and not raw_log.get("removed"):
+                BLOCK_PROGRESS.reached(address, raw_log["blockNumber"] - 1)
+        finally:
+            queue.task_done()
+
+
+async def deliver_log(raw_log, active_contracts, w3):
+    """
+    Single entry point for live, replayed and backfilled logs: each log is handled
+    at most once, and logs the node retracts in a reorg are un-recorded.
+    Returns True if the log was dispatched to its actions.
+    """
+    if raw_log.get("removed"):
+        LOGS_DROPPED.labels(raw_log["address"].lower(), "reorged").inc()
+        if DELIVERED_LOGS.retract(raw_log):
+            RECENT_EVENTS.mark_removed(raw_log["transactionHash"], raw_log["logIndex"], raw_log["blockNumber"])
+            _emit("removed", (raw_log["transactionHash"].hex(), raw_log["logIndex"], raw_log["blockNumber"]))
+            print(f"Listener Warning: log {log_key(raw_log).hex()} on {raw_log['address']} removed by chain reorg.")
+        return False
+    if not DELIVERED_LOGS.first_delivery(raw_log):
+        LOGS_DROPPED.labels(raw_log["address"].lower(), "duplicate").inc()
+        return False
+    return await handle_event(raw_log, active_contracts, w3)
+
+
+# Recent block timestamps for the lag metric: one eth_getBlockByNumber per block, not per log
+_BLOCK_TIMES = OrderedDict()
+_BLOCK_TIME_WAITERS = {}
+_BLOCK_TIME_TASKS = set() # In-flight lookups: referenced so they are not collected mid-flight, cancelled on shutdown
+
+def _observe_lag(w3, raw_log, dispatched_at):
+    timestamp = raw_log.get("blockTimestamp") # Included by some nodes, saves the lookup
+    if timestamp is not None:
+        timestamp = int(timestamp, 16) if isinstance(timestamp, str) else timestamp
+    else:
+        timestamp = _BLOCK_TIMES.get(raw_log["blockNumber"])
+    if timestamp is not None:
+        EVENT_LAG.observe(max(0.0, dispatched_at - timestamp))
         return
+    block = raw_log["blockNumber"]
+    waiters = _BLOCK_TIME_WAITERS.get(block)
+    if waiters is None:
+        waiters = _BLOCK_TIME_WAITERS[block] = []
+        task = asyncio.create_task(_fetch_block_time(w3, block))
+        _BLOCK_TIME_TASKS.add(task)
+        task.add_done_callback(_BLOCK_TIME_TASKS.discard)
+    waiters.append(dispatched_at)
 
-    print(f"Connecting to Base network via WebSocket: {BASE_WSS_URL[:30]}...")
-    w3 = Web3(Web3.LegacyWebSocketProvider(BASE_WSS_URL))
-    if not w3.is_connected():
-        print("Listener Error: Failed to connect to WebSocket.")
+async def _fetch_block_time(w3, block):
+    try:
+        timestamp = (await w3.eth.get_block(block))["timestamp"]
+    except Exception:
+        timestamp = None
+    finally:
+        waiters = _BLOCK_TIME_WAITERS.pop(block, []) # Also when cancelled: the next log of the block looks it up again
+    if timestamp is None:
         return
-    print("Connected to WebSocket.")
+    _BLOCK_TIMES[block] = timestamp
+    while len(_BLOCK_TIMES) > 256:
+        _BLOCK_TIMES.popitem(last=False)
+    for dispatched_at in waiters:
+        EVENT_LAG.observe(max(0.0, dispatched_at - timestamp))
 
-    # Prepare contracts and filters (can be updated dynamically via tools)
-    active_contracts = {}
-    all_target_addresses = list(TRACKING_TARGETS.keys())
 
-    if not all_target_addresses:
-         print("Listener Info: No contracts configured for tracking yet.")
-         # Keep listening for config updates? Or exit? For now, just wait.
-         while True: await asyncio.sleep(60)
+async def catch_up_contracts(w3, active_contracts, addresses, to_block=None, rewind_blocks=0):
+    """
+    Backfills `addresses` from their checkpoints (or extra_info start_block) up to
+    `to_block`, through deliver_log, while live events keep flowing. `rewind_blocks`
+    re-scans that many blocks before each checkpoint to pick up reorged logs.
+    """
+    addresses = [a for a in addresses if a in active_contracts]
+    if not addresses:
+        return
+    BACKFILLING.update(addresses) # Counted: overlapping catch-ups (reconnect, new target) each hold it
+    try:
+        # Another shard may have handed these over: resume from its latest saved checkpoints
+        await asyncio.to_thread(BACKFILL_CHECKPOINTS.refresh)
+        await backfill_contracts(
+            w3, active_contracts, BACKFILL_CHECKPOINTS,
+            # Shielded: a cancelled catch-up stops between logs, never after a log was
+            # recorded as delivered but before its actions were queued
+            lambda raw_log: asyncio.shield(deliver_log(raw_log, active_contracts, w3)),
+            to_block=to_block, addresses=addresses, rewind_blocks=rewind_blocks, progress=BLOCK_PROGRESS,
+            concurrency=BACKFILL_CONCURRENCY, chunk_size=BACKFILL_CHUNK_SIZE
+        )
+    except Exception as e:
+        print(f"Listener Error: Backfill failed for {addresses}: {e}")
+    finally:
+        for address in addresses:
+            BACKFILLING[address] -= 1
+            if BACKFILLING[address] <= 0:
+                del BACKFILLING[address]
+
+
+_CATCH_UP_TASKS = set() # Running catch_up_contracts tasks, cancelled on reconnect and shutdown
+
+def _start_catch_up(w3, active_contracts, addresses, **kwargs):
+    task = asyncio.create_task(catch_up_contracts(w3, active_contracts, addresses, **kwargs))
+    _CATCH_UP_TASKS.add(task)
+    task.add_done_callback(_CATCH_UP_TASKS.discard)
+    return task
 
+async def _cancel_catch_ups():
+    tasks = list(_CATCH_UP_TASKS)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
 
-    print(f"Loading ABIs for: {all_target_addresses}")
-    for addr, config in TRACKING_TARGETS.items():
+
+async def save_checkpoints_periodically(interval_seconds=1.0):
+    try:
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                BACKFILL_CHECKPOINTS.save()
+            except Exception as e:
+                print(f"Error saving backfill checkpoints: {e}")
+    finally:
+        BACKFILL_CHECKPOINTS.save()
+
+
+async def reload_tracking_targets(active_contracts, subscriptions):
+    """
+    Re-reads the contract store and applies only the difference: decoders and
+    subscriptions are (re)built for added/changed targets, dropped for removed ones.
+    Returns the (added or changed, removed) address lists.
+    """
+    stored = contract_manager.load_contracts()
+    latest = {
+        addr: _target_from_record(data) for addr, data in stored.items()
+        if SHARD_FILTER is None or SHARD_FILTER(addr)
+    }
+    removed = [addr for addr in TRACKING_TARGETS if addr not in latest]
+    changed = [addr for addr, config in latest.items() if TRACKING_TARGETS.get(addr) != config]
+    if not removed and not changed:
+        return changed, removed
+
+    for addr in removed:
+        del TRACKING_TARGETS[addr]
+        active_contracts.pop(addr, None)
+        DECODER_REGISTRY.unregister(addr)
+        if addr not in stored:
+            _HANDLED_LOGS.pop(addr, None) # Deleted, not handed over to another shard
+        print(f"  - Stopped tracking {addr}")
+    for addr in changed:
+        TRACKING_TARGETS[addr] = latest[addr]
         try:
-            full_abi_path = config.get("abi_path")
-            if not full_abi_path or not os.path.exists(full_abi_path):
-                 print(f"Warning: ABI file not found for {addr} at {full_abi_path}. Skipping contract.")
-                 continue
-            with open(full_abi_path, 'r') as f:
-                abi = json.load(f)
-            contract = w3.eth.contract(address=Web3.to_checksum_address(addr), abi=abi)
-            active_contracts[addr] = {"contract": contract, "config": config}
-            print(f"  - Loaded ABI for {addr}")
+            contract_info = load_contract(addr, latest[addr])
         except Exception as e:
             print(f"Listener Error: Failed to load ABI or create contract for {addr}: {e}")
+            contract_info = None
+        if contract_info:
+            active_contracts[addr] = contract_info
+            print(f"  - Loaded ABI for {addr}")
+        else:
+            active_contracts.pop(addr, None)
+            DECODER_REGISTRY.unregister(addr)
 
-
-    # --- Create Event Filter ---
-    # Subscribe to logs for all configured addresses
-    # Note: Filtering by specific event topics here is more efficient if possible
-    print(f"Subscribing to logs for addresses: {list(active_contracts.keys())}")
     try:
-        event_filter = await w3.eth.subscribe('logs', {
-            'address': [Web3.to_checksum_address(a) for a in active_contracts.keys()]
-        })
+        await subscriptions.sync(active_contracts)
     except Exception as e:
-         print(f"Listener Error: Failed to subscribe to logs: {e}")
-         return
+        print(f"Listener Error: Failed to update subscriptions: {e}")
+    return changed, removed
 
 
-    print("Listener started. Waiting for events...")
+async def watch_tracking_targets(w3, active_contracts, subscriptions, interval=TARGETS_POLL_INTERVAL):
+    """
+    Applies contract store changes while the listener runs. In-process writes
+    (agent tools, api_server) wake the watcher immediately via
+    contract_manager.subscribe_changes; writes from other processes (add_contract.py)
+    are caught by polling the store's version every `interval` seconds.
+    Newly added contracts with a checkpoint or start_block get their history backfilled.
+    """
+    global _force_reload
+    loop = asyncio.get_running_loop()
+    store_changed = asyncio.Event()
+    forced = False
+    applied_callbacks = []
+    def force_reload(on_applied=None):
+        nonlocal forced
+        if on_applied is not None:
+            applied_callbacks.append(on_applied)
+        forced = True
+        loop.call_soon_threadsafe(store_changed.set)
+    _force_reload = force_reload
+    unsubscribe = contract_manager.subscribe_changes(lambda: loop.call_soon_threadsafe(store_changed.set))
+    last_version = contract_manager.contracts_version()
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(store_changed.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            store_changed.clear()
+            version = contract_manager.contracts_version()
+            if version == last_version and not forced:
+                continue
+            last_version = version
+            forced = False
+            callbacks, applied_callbacks[:] = applied_callbacks[:], []
+            changed, removed = await reload_tracking_targets(active_contracts, subscriptions)
+            if changed or removed:
+                print(f"Listener: applied {len(changed) + len(removed)} tracking target change(s), {len(subscriptions)} subscription(s) active.")
+            if removed:
+                # Whoever tracks these next (another shard) resumes from the saved checkpoints
+                await asyncio.to_thread(BACKFILL_CHECKPOINTS.save)
+            if changed:
+                _start_catch_up(w3, active_contracts, changed) # Cancelled with the listener
+            for callback in callbacks:
+                callback()
+    finally:
+        _force_reload = None
+        unsubscribe()
+
+
+async def _watch_subscription_endpoint(pool, endpoint, socket_w3):
+    # Drops the socket once its endpoint falls behind or keeps failing probes, so the
+    # listener reconnects to a healthier one (the stream ends, like a dropped connection)
     while True:
-        try:
-            async for event in event_filter:
-                await handle_event(event, active_contracts, w3) # Pass w3 for decoding help
-                # Add a small sleep to prevent blocking event loop if handling is too fast
-                await asyncio.sleep(0.1)
-        except Exception as e:
-            print(f"Listener Error in main loop: {e}. Reconnecting attempt needed...")
-            # Implement reconnect logic here (e.g., recreate subscription)
-            await asyncio.sleep(10) # Wait before retrying
+        await asyncio.sleep(pool.probe_interval)
+        if pool.stale(endpoint) and pool.best_websocket() is not endpoint:
+            print(f"Listener: {endpoint.name} is lagging or failing, moving subscriptions to {pool.best_websocket().name}.")
+            await socket_w3.provider.disconnect()
+            return
+
+
+async def listen_for_events(wss_url=None, workers=LISTENER_WORKERS, queue_size=LISTENER_QUEUE_SIZE, restore_history=True):
+    """Runs the listener on `wss_url`, or by default on the endpoint pool in RPC_URLS (see agent/rpc_pool.py)."""
+    # Restore recent history; the background journal writer starts once there is an endpoint to listen on
+    if restore_history and not len(RECENT_EVENTS):
+        restore_recent_events()
+    from agent.rpc_pool import RPC_POOL, RpcPool, pooled_web3
+    pool = RpcPool([wss_url]) if wss_url else RPC_POOL
+    if pool.best_websocket() is None:
+        print("Listener Error: no WebSocket RPC endpoint configured (BASE_WSS_URL / RPC_URLS).")
+        return
+    journal_task = asyncio.create_task(EVENT_JOURNAL.run()) if JOURNAL_EVENTS else None
+    from agent.holder_ledger import HOLDER_LEDGERS
+    from agent.transfer_windows import TOKEN_DECIMALS, TRANSFER_WINDOWS
+    ledger_task = asyncio.create_task(HOLDER_LEDGERS.run())
+    TRANSFER_WINDOWS.on_alert = dispatch_alert
+    windows_task = asyncio.create_task(TRANSFER_WINDOWS.run())
+    await ACTION_PIPELINE.start()
+    # web3 is imported here rather than at module level: processes that only read
+    # RECENT_EVENTS (api_server, the REPL attached over the event bus) never load it
+    from web3 import AsyncWeb3, WebSocketProvider
+    from agent.event_decoding import EventDecoderRegistry
+    from agent.subscriptions import SubscriptionManager
+
+    # Reads (catch-up getLogs, block times, decimals) go through the pool; subscriptions
+    # share one socket, pointed at the healthiest WebSocket endpoint on every (re)connect.
+    # Both AsyncWeb3 instances live as long as the listener, so decoders, queue and
+    # workers survive connection drops and failovers
+    w3 = pooled_web3(pool)
+    socket_w3 = AsyncWeb3(WebSocketProvider(
+        pool.best_websocket().url,
+        websocket_kwargs={"max_size": WSS_MAX_MESSAGE_SIZE}, # Large eth_getLogs replies during catch-up
+        subscription_response_queue_size=queue_size
+    ))
+    probe_task = asyncio.create_task(pool.run())
+    global DECODER_REGISTRY
+    DECODER_REGISTRY = EventDecoderRegistry(w3)
+    TOKEN_DECIMALS.w3 = w3
+    TRACKING_TARGETS.clear()
+    active_contracts = {}
+    subscriptions = SubscriptionManager(socket_w3, MAX_ADDRESSES_PER_FILTER)
+    queue = asyncio.Queue(maxsize=queue_size)
+    LOG_QUEUE_DEPTH.set_function(queue.qsize)
+    background_tasks = []
+    attempt = 0
+    endpoint = None
+    watchdog = None
+
+    try:
+        while True:
+            try:
+                endpoint = pool.best_websocket()
+                socket_w3.provider.endpoint_uri = endpoint.url
+                print(f"Connecting to Base network via WebSocket: {endpoint.name}...")
+                await socket_w3.provider.connect()
+                print("Connected to WebSocket.")
+
+                if not background_tasks:
+                    # First connection: contracts, decoders and subscriptions are filled
+                    # from the store; later store changes are applied by watch_tracking_targets
+                    await reload_tracking_targets(active_contracts, subscriptions)
+                    print(f"Loaded {len(TRACKING_TARGETS)} contract(s) from persistent storage.")
+                    if not active_contracts:
+                        print("Listener Info: No contracts configured for tracking yet. Waiting for new targets...")
+                    background_tasks = [
+                        asyncio.create_task(_event_worker(queue, active_contracts, w3))
+                        for _ in range(workers)
+                    ]
+                    background_tasks.append(asyncio.create_task(watch_tracking_targets(w3, active_contracts, subscriptions)))
+                    background_tasks.append(asyncio.create_task(save_checkpoints_periodically()))
+                    rewind = 0
+                else:
+                    # The old socket's subscriptions died with it
+                    subscriptions.reset()
+                    await subscriptions.sync(active_contracts)
+                    rewind = REORG_REPLAY_DEPTH
+                # The subscribed node's head is the hand-over point (the pool only sends the
+                # catch-up getLogs to endpoints that have reached it)
+                head_block = await socket_w3.eth.block_number
+                endpoint.observe_head(head_block)
+
+                # Replay whatever was emitted while disconnected (subscriptions are
+                # already open, so the head block is the hand-over point to live events);
+                # deliver_log drops anything seen both ways. A replay still running from an
+                # earlier connection is stopped first: this one covers every contract again
+                await _cancel_catch_ups()
+                _start_catch_up(w3, active_contracts, list(active_contracts), to_block=head_block, rewind_blocks=rewind)
+
+                print(f"Listener started with {len(subscriptions)} subscription(s), {workers} worker(s). Waiting for events...")
+                attempt = 0
+                watchdog = asyncio.create_task(_watch_subscription_endpoint(pool, endpoint, socket_w3))
+                # All subscriptions share one persistent socket; messages arrive already
+                # formatted as log receipts and are handed to the worker pool
+                async for message in socket_w3.socket.process_subscriptions():
+                    await queue.put(message["result"])
+                raise ConnectionError("subscription stream closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if watchdog is not None:
+                    watchdog.cancel()
+                if endpoint is not None and not pool.stale(endpoint):
+                    endpoint.record_failure() # A dropped subscription counts against the endpoint
+                best = pool.best_websocket()
+                if best is not endpoint and not pool.stale(best):
+                    delay = 0.0 # Another endpoint is ready: fail over right away
+                else:
+                    delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1.0)
+                    attempt += 1
+                print(f"Listener Error: {e}. Reconnecting in {delay:.1f}s (attempt {attempt})...")
+                try:
+                    await socket_w3.provider.disconnect()
+                except Exception:
+                    pass
+                await asyncio.sleep(delay)
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        if watchdog is not None:
+            watchdog.cancel()
+        await _cancel_catch_ups()
+        for task in list(_BLOCK_TIME_TASKS):
+            task.cancel()
+        await ACTION_PIPELINE.close()
+        BACKFILL_CHECKPOINTS.save() # Queued actions were settled by spilling them
+        windows_task.cancel()
+        if journal_task is not None:
+            journal_task.cancel()
+        ledger_task.cancel()
+        probe_task.cancel()
+        await socket_w3.provider.disconnect()
 
 
 async def handle_event(raw_log, active_contracts, w3):
-    """Decodes and processes a single log event."""
+    """Decodes and processes a single log event. Returns True if it was dispatched to its actions."""
     event_address_lower = raw_log.address.lower()
 
-    if event_address_lower not in active_contracts:
-        return # Should not happen if filter is correct, but good check
+    contract_info = active_contracts.get(event_address_lower)
+    if contract_info is None:
+        LOGS_DROPPED.labels(event_address_lower, "unknown_contract").inc()
+        return False # Should not happen if filter is correct, but good check
+    if SHARD_FILTER is not None:
+        _remember_handled(event_address_lower, raw_log)
 
-    contract_info = active_contracts[event_address_lower]
-    contract_obj = contract_info["contract"]
     config = contract_info["config"]
 
     try:
-        # Attempt to decode the log using the contract's ABI
-        # Note: contract_obj.events is a list/iterable of event types defined in ABI
-        # Need to find the matching event type based on log topics
-        matched_event_types = [e for e in contract_obj.events if hasattr(e, 'abi') and e.abi.get('name') in config.get('tracked_events', [])]
+        # topics[0] is the event signature hash: one dict lookup picks the decoder,
+        # unknown or untracked signatures are dropped without attempting a decode
+        started = time.perf_counter()
+        decoder = DECODER_REGISTRY.lookup(event_address_lower, raw_log)
+        if decoder is None or decoder.name not in contract_info["tracked_events"]:
+            LOGS_DROPPED.labels(event_address_lower, "untracked_event").inc()
+            return False
+        # Per-client event quota, checked before paying for the decode
+        admission = ACTION_PIPELINE.admit(config.get('client_id'))
+        if admission == "drop":
+            LOGS_DROPPED.labels(event_address_lower, "quota").inc()
+            return False
 
-        decoded_event = None
-        for event_type in matched_event_types:
-            try:
-                 # process_log decodes based on topics and data
-                 event_data = event_type().process_log(raw_log)
-                 # Success!
-                 decoded_event = { # Standardize output
-                  'address': event_data.address,
-                  'event': event_data.event,
-                  'args': dict(event_data.args), # Convert AttributeDict to dict
-                  'logIndex': event_data.logIndex,
-                  'transactionIndex': event_data.transactionIndex,
-                  'transactionHash': event_data.transactionHash.hex(),
-                  'blockHash': event_data.blockHash.hex(),
-                  'blockNumber': event_data.blockNumber,
-                  'client_id': config.get('client_id')
-              }
-                 break # Found matching decoder
-            except (ContractLogicError, ValueError, Exception):
-                 # This event type didn't match, try next
-                 continue
-
-        if decoded_event:
-            print(f"\n--- Event Detected on {event_address_lower} ---")
-            # Trigger configured actions
-            for action_id in config.get("actions", []):
-                action_func = ACTION_DISPATCHER.get(action_id)
-                if action_func:
-                    try:
-                        action_func(decoded_event)
-                    except Exception as e:
-                        print(f"  ACTION ERROR ({action_id}): {e}")
-                else:
-                    print(f"  Warning: Unknown action '{action_id}' configured.")
+        # Raw bytes and ints; hex strings and checksums are only built when the event is rendered
+        decoded_event = decoder.decode_record(raw_log, config.get('client_id'))
+        decoded_at = time.perf_counter()
+        _DECODE_STAGE.observe(decoded_at - started)
+
+        print(f"\n--- Event Detected on {event_address_lower} ---")
+        # Trigger configured actions: queued for the action pipeline, never run inline.
+        # Counted first, as submit() may already settle one (spilled or dropped)
+        actions = config.get("actions", [])
+        pending = sum(1 for action_id in actions if action_id in ACTION_DISPATCHER)
+        if pending:
+            BLOCK_PROGRESS.submitted(event_address_lower, decoded_event.block_number, pending)
+        for action_id in actions:
+            if action_id in ACTION_DISPATCHER:
+                await ACTION_PIPELINE.submit(action_id, decoded_event, deferred=admission == "defer")
+            else:
+                print(f"  Warning: Unknown action '{action_id}' configured.")
+        _DISPATCH_STAGE.observe(time.perf_counter() - decoded_at)
+        LOGS_MATCHED.labels(event_address_lower).inc()
+        return True
 
     except Exception as e:
         # Broad exception catch during decoding/handling
+        LOGS_DROPPED.labels(event_address_lower, "decode_error").inc()
         print(f"Listener Error handling event for {event_address_lower} (Tx: {raw_log.transactionHash.hex()}): {e}")
+        return False
+
+
+def get_decode_stats():
+    """Per event type decode counts and average cost, for diagnostics."""
+    if DECODER_REGISTRY is None:
+        return {}
+    return DECODER_REGISTRY.stats()
+
+
+def get_action_stats():
+    """Action queue depth, overflow counters, per-action latency and per-client queues, drops and latency."""
+    return ACTION_PIPELINE.stats()
+
+
+def get_transfer_stats():
+    """Transfer window sizes, counters and alerts fired (empty until a check_value action ran)."""
+    windows = sys.modules.get("agent.transfer_windows") # Not imported just to report that nothing happened
+    return windows.TRANSFER_WINDOWS.stats() if windows is not None else {}
+
+
+def get_rpc_stats():
+    """Health of each RPC endpoint, hedges and failovers (empty until the listener or backfill used the pool)."""
+    rpc_pool = sys.modules.get("agent.rpc_pool")
+    return rpc_pool.RPC_POOL.stats() if rpc_pool is not None else {}
+
+
+def start_event_bus(stats_provider=None, on_reload=None, metrics_provider=None):
+    """
+    Serves RECENT_EVENTS, stats, metrics and config commands to other local processes
+    (api_server, a separately started REPL) over EVENT_BUS_PATH. Returns the server, or None if disabled.
+    """
+    if not EVENT_BUS_PATH:
+        return None
+    server = EventBusServer(
+        EVENT_BUS_PATH, RECENT_EVENTS,
+        stats_provider=stats_provider or (lambda: {"actions": get_action_stats(), "decoding": get_decode_stats(), "transfers": get_transfer_stats(), "rpc": get_rpc_stats()}),
+        on_reload=on_reload or request_target_reload,
+        metrics_provider=metrics_provider or metrics.REGISTRY.render
+    )
+    server.start()
+    return server
 
 
-def run_listener():
+def run_listener(wss_url=None):
     # This function is intended to be run separately or in a background thread/process
+    bus = start_event_bus()
     try:
-        asyncio.run(listen_for_events())
+        asyncio.run(listen_for_events(wss_url))
     except KeyboardInterrupt:
         print("\nListener stopped by user.")
+    finally:
+        if bus is not None:
+            bus.stop()
 
-# Example of how to run directly (for testing)
-# if __name__ == "__main__":
-#    run_listener()
+# Run the listener as its own process; api_server and the REPL attach over the event bus:
+#    python -m agent.background_listener
+if __name__ == "__main__":
+    run_listener()
 
@@ -1,13 +1,15 @@
 # config.py
 import os
 from dotenv import load_dotenv
-import tweepy
 # from coinbase.rest import RESTClient # If using Coinbase
 
 load_dotenv()
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 BASESCAN_API_KEY = os.getenv("BASESCAN_API_KEY")
+BASESCAN_API_URL = os.getenv("BASESCAN_API_URL", "https://api.basescan.org/api") # Point at a local mock for testing
+BASESCAN_RATE_LIMIT = float(os.getenv("BASESCAN_RATE_LIMIT", "5")) # Requests per second allowed by the API key
+BASESCAN_CONCURRENCY = int(os.getenv("BASESCAN_CONCURRENCY", os.getenv("ABI_FETCH_CONCURRENCY", "4"))) # Parallel requests (ABI downloads, balance batches)
 X_BEARER_TOKEN = os.getenv("X_BEARER_TOKEN")
 COINBASE_API_KEY = os.getenv("COINBASE_API_KEY") # If using
 COINBASE_API_SECRET = os.getenv("COINBASE_API_SECRET") # If using
@@ -15,19 +17,93 @@ COINBASE_API_SECRET = os.getenv("COINBASE_API_SECRET") # If using
 YOUR_SITE_URL = os.getenv("YOUR_SITE_URL", "http://unknown")
 YOUR_APP_NAME = os.getenv("YOUR_APP_NAME", "CamelSean")
 
-# Initialize clients (optional - could also be done when tools are loaded)
-x_client = None
-if X_BEARER_TOKEN:
-    try:
-        x_client = tweepy.Client(bearer_token=X_BEARER_TOKEN)
-        print("X client initialized in config.")
-    except Exception as e:
-        print(f"Warning: Failed to init X client in config: {e}")
+# API clients are created on first use, so importing config stays cheap
+_x_client = None
+
+def get_x_client():
+    """tweepy client for the X API, or None when X_BEARER_TOKEN is missing or the client cannot be built."""
+    global _x_client
+    if _x_client is None and X_BEARER_TOKEN:
+        try:
+            import tweepy
+            _x_client = tweepy.Client(bearer_token=X_BEARER_TOKEN)
+            print("X client initialized.")
+        except Exception as e:
+            print(f"Warning: Failed to init X client: {e}")
+    return _x_client
 
 cb_client = None # Initialize Coinbase client if using
 
 BASE_WSS_URL = os.getenv("BASE_WSS_URL")
+BASE_RPC_URL = os.getenv("BASE_RPC_URL") # HTTP endpoint, preferred for eth_getLogs backfills
+# Every RPC endpoint the listener and backfill may use (ws:// for subscriptions, http(s):// for reads only)
+RPC_URLS = [u.strip() for u in os.getenv("RPC_URLS", f"{BASE_WSS_URL or ''},{BASE_RPC_URL or ''}").split(",") if u.strip()]
+RPC_REQUEST_TIMEOUT = float(os.getenv("RPC_REQUEST_TIMEOUT", "10.0")) # Seconds before a request fails over to the next endpoint
+RPC_HEDGE_MIN_DELAY = float(os.getenv("RPC_HEDGE_MIN_DELAY", "0.1")) # Seconds a read waits at least before being hedged
+RPC_PROBE_INTERVAL = float(os.getenv("RPC_PROBE_INTERVAL", "5.0")) # Seconds between eth_blockNumber health probes
+RPC_MAX_LAG_BLOCKS = int(os.getenv("RPC_MAX_LAG_BLOCKS", "5")) # Blocks an endpoint may trail the best head before it is avoided
+RPC_COOLDOWN_MAX = float(os.getenv("RPC_COOLDOWN_MAX", "60.0")) # Seconds, cap of the doubling pause between probes of a failing endpoint
 ABI_DIR = os.getenv("ABI_DIR", "abi/") # Default to 'abi/' subdirectory
+LISTENER_WORKERS = int(os.getenv("LISTENER_WORKERS", "8")) # Concurrent decode/dispatch tasks
+LISTENER_QUEUE_SIZE = int(os.getenv("LISTENER_QUEUE_SIZE", "10000")) # Logs buffered ahead of the workers
+RECENT_EVENTS_MAX_SIZE = int(os.getenv("RECENT_EVENTS_MAX_SIZE", "10000")) # Events kept in memory for queries
+EVENT_JOURNAL_PATH = os.getenv("EVENT_JOURNAL_PATH", os.path.join(os.path.dirname(__file__), "events.db"))
+EVENT_JOURNAL_FLUSH_INTERVAL = float(os.getenv("EVENT_JOURNAL_FLUSH_INTERVAL", "1.0")) # Seconds between batched writes
+EVENT_JOURNAL_FLUSH_SIZE = int(os.getenv("EVENT_JOURNAL_FLUSH_SIZE", "500")) # Pending events that force an early write
+EVENT_JOURNAL_RETENTION_DAYS = float(os.getenv("EVENT_JOURNAL_RETENTION_DAYS", "30"))
+EVENT_JOURNAL_MAX_PENDING = int(os.getenv("EVENT_JOURNAL_MAX_PENDING", "100000")) # Unwritten events kept while writes fail; oldest dropped past it
+EVENT_JOURNAL_BUSY_TIMEOUT = float(os.getenv("EVENT_JOURNAL_BUSY_TIMEOUT", "10.0")) # Seconds a write waits on another writer's lock
+BACKFILL_CHECKPOINT_FILE = os.getenv("BACKFILL_CHECKPOINT_FILE", os.path.join(os.path.dirname(__file__), "backfill_checkpoints.json"))
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "4")) # getLogs ranges in flight
+BACKFILL_CHUNK_SIZE = int(os.getenv("BACKFILL_CHUNK_SIZE", "2000")) # Initial blocks per getLogs (adapts)
+WSS_MAX_MESSAGE_SIZE = int(os.getenv("WSS_MAX_MESSAGE_SIZE", str(32 * 1024 * 1024))) # Bytes per WebSocket message
+DEDUP_CAPACITY = int(os.getenv("DEDUP_CAPACITY", "200000")) # Recently delivered logs remembered for de-duplication
+RECONNECT_BASE_DELAY = float(os.getenv("RECONNECT_BASE_DELAY", "1.0")) # Seconds, doubled per failed attempt
+RECONNECT_MAX_DELAY = float(os.getenv("RECONNECT_MAX_DELAY", "60.0"))
+REORG_REPLAY_DEPTH = int(os.getenv("REORG_REPLAY_DEPTH", "12")) # Blocks re-scanned before each checkpoint after a reconnect
+TARGETS_POLL_INTERVAL = float(os.getenv("TARGETS_POLL_INTERVAL", "0.25")) # Seconds between contract store checks
+MAX_ADDRESSES_PER_FILTER = int(os.getenv("MAX_ADDRESSES_PER_FILTER", "1000")) # Provider cap on addresses per log subscription
+LISTENER_SHARDS = int(os.getenv("LISTENER_SHARDS", "1")) # Listener processes; 1 runs the listener in a thread of the main process
+LISTENER_CONTRACTS_PER_SHARD = int(os.getenv("LISTENER_CONTRACTS_PER_SHARD", "0")) # Add shards as the registry grows (0 = fixed count)
+LISTENER_MAX_SHARDS = int(os.getenv("LISTENER_MAX_SHARDS", str(os.cpu_count() or 1)))
+ACTION_WORKERS = int(os.getenv("ACTION_WORKERS", "16")) # Concurrent action runs (async tasks + thread pool)
+ACTION_QUEUE_SIZE = int(os.getenv("ACTION_QUEUE_SIZE", "10000")) # Actions buffered in memory before the overflow policy applies
+ACTION_TIMEOUT = float(os.getenv("ACTION_TIMEOUT", "10.0")) # Seconds per action attempt
+ACTION_RETRIES = int(os.getenv("ACTION_RETRIES", "2")) # Extra attempts after a failure or timeout
+ACTION_OVERFLOW = os.getenv("ACTION_OVERFLOW", "spill").lower() # "block", "drop_oldest" or "spill"
+ACTION_SPILL_PATH = os.getenv("ACTION_SPILL_PATH", os.path.join(os.path.dirname(__file__), "action_spill.bin")) # Listener shards use <name>.shard<N>.bin
+CLIENT_WEIGHTS = os.getenv("CLIENT_WEIGHTS", "") # Share of action workers per client_id, e.g. "acme=3,beta=1" (default 1)
+CLIENT_QUOTAS = os.getenv("CLIENT_QUOTAS", "") # Events/s per client_id as rate[:burst[:defer|drop]], e.g. "beta=50:200:drop,*=500"
+CLIENT_QUOTA_OVERFLOW = os.getenv("CLIENT_QUOTA_OVERFLOW", "defer").lower() # Events over quota: "defer" (run when idle) or "drop"
+STREAM_BUFFER_SIZE = int(os.getenv("STREAM_BUFFER_SIZE", "1000")) # Events buffered per streaming subscriber before it is cut off
+STREAM_KEEPALIVE_SECONDS = float(os.getenv("STREAM_KEEPALIVE_SECONDS", "15")) # Idle interval between SSE keepalive comments
+EVENT_BUS_PATH = os.getenv("EVENT_BUS_PATH", os.path.join(os.path.dirname(__file__), "event_bus.sock")) # Unix socket shared by listener, API and REPL ("" disables)
+START_LISTENER = os.getenv("START_LISTENER", "1").lower() not in ("0", "false", "no") # 0: the REPL attaches to a separately running listener
+TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "1024")) # Tool results kept in memory (least recently used are evicted)
+BALANCE_CACHE_TTL = float(os.getenv("BALANCE_CACHE_TTL", "15")) # Seconds a native balance lookup is reused (0 disables)
+TWEETS_CACHE_TTL = float(os.getenv("TWEETS_CACHE_TTL", "60")) # Seconds the tweet tool serves cached tweets before polling the account (0: always poll)
+X_ACCOUNTS = [u.strip().lstrip("@") for u in os.getenv("X_ACCOUNTS", "").split(",") if u.strip()] # Accounts polled in the background
+X_TWEETS_DB = os.getenv("X_TWEETS_DB", os.path.join(os.path.dirname(__file__), "tweets.db"))
+X_POLL_MIN_INTERVAL = float(os.getenv("X_POLL_MIN_INTERVAL", "60")) # Seconds between polls of an account that keeps tweeting
+X_POLL_MAX_INTERVAL = float(os.getenv("X_POLL_MAX_INTERVAL", "1800")) # Seconds between polls of an account that has gone quiet
+X_USER_CACHE_TTL = float(os.getenv("X_USER_CACHE_TTL", str(7 * 24 * 3600))) # Seconds a username -> user ID resolution is reused
+X_INITIAL_TWEETS = int(os.getenv("X_INITIAL_TWEETS", "20")) # Tweets fetched on an account's first poll (5-100)
+X_MAX_PAGES = int(os.getenv("X_MAX_PAGES", "5")) # Timeline pages fetched per poll when catching up
+X_TWEETS_KEPT = int(os.getenv("X_TWEETS_KEPT", "200")) # Newest tweets cached per account
+LEDGER_DIR = os.getenv("LEDGER_DIR", os.path.join(os.path.dirname(__file__), "ledgers")) # Holder ledgers, one directory per token
+LEDGER_FLUSH_INTERVAL = float(os.getenv("LEDGER_FLUSH_INTERVAL", "1.0")) # Seconds between batched ledger writes
+LEDGER_CHECKPOINT_BLOCKS = int(os.getenv("LEDGER_CHECKPOINT_BLOCKS", "1800")) # Blocks between balance checkpoints (1h on Base)
+LEDGER_CHECKPOINTS_KEPT = int(os.getenv("LEDGER_CHECKPOINTS_KEPT", "24")) # Newest checkpoints kept per token
+BLOCK_TIME = float(os.getenv("BLOCK_TIME", "2.0")) # Seconds per block on Base; window lengths are converted to blocks
+TRANSFER_WINDOW_SPECS = os.getenv("TRANSFER_WINDOW_SPECS", "5m:5,1h:12,1d:1") # length:slots (1 slot = tumbling); spikes compare the first to the second
+TRANSFER_WINDOW_FLUSH_INTERVAL = float(os.getenv("TRANSFER_WINDOW_FLUSH_INTERVAL", "0.25")) # Seconds between batched window updates
+WHALE_PERCENTILE = float(os.getenv("WHALE_PERCENTILE", "0.999")) # Transfers above this size percentile of a token are whales
+WHALE_MIN_SAMPLES = int(os.getenv("WHALE_MIN_SAMPLES", "1000")) # Transfers in the window before percentile whale alerts start
+VOLUME_SPIKE_FACTOR = float(os.getenv("VOLUME_SPIKE_FACTOR", "5.0")) # Short-window volume vs. the long window's rate
+VOLUME_SPIKE_MIN_COUNT = int(os.getenv("VOLUME_SPIKE_MIN_COUNT", "20")) # Transfers in the short window before a spike counts
+ALERT_COOLDOWN = float(os.getenv("ALERT_COOLDOWN", "300")) # Seconds between alerts of one kind for the same token/client
+ALERT_ACTIONS = [a.strip() for a in os.getenv("ALERT_ACTIONS", "log_event").split(",") if a.strip()] # Actions run on every alert
+TOKEN_DECIMALS_FILE = os.getenv("TOKEN_DECIMALS_FILE", os.path.join(os.path.dirname(__file__), "token_decimals.json"))
 
-if not BASE_WSS_URL:
-    print("Warning: BASE_WSS_URL not found in .env. Background listener cannot run.")
+if not any(url.startswith("ws") for url in RPC_URLS):
+    print("Warning: no WebSocket RPC endpoint (BASE_WSS_URL / RPC_URLS) in .env. Background listener cannot run.")
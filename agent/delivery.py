@@ -0,0 +1,60 @@
+# delivery.py
+from collections import OrderedDict
+
+
+def _to_bytes(value) -> bytes:
+    if isinstance(value, str):
+        return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+    return bytes(value)
+
+
+def log_key(raw_log) -> bytes:
+    """36-byte identity of a log: transaction hash + log index."""
+    return _to_bytes(raw_log["transactionHash"]) + int(raw_log["logIndex"]).to_bytes(4, "big")
+
+
+class DeliveryDeduplicator:
+    """
+    Bounded set of recently delivered log keys (FIFO eviction), so the same log
+    seen from a live subscription, a reconnect replay and a backfill fires its
+    actions once. Keys are packed 36-byte strings; capacity bounds memory to
+    roughly 200 bytes per remembered log.
+    """
+
+    def __init__(self, capacity: int = 200000):
+        self.capacity = capacity
+        # popitem(last=False) evicts in O(1); deleting a plain dict's first key leaves dummy
+        # slots that every later next(iter(...)) walks over until the dict is resized
+        self._keys: "OrderedDict[bytes, None]" = OrderedDict()
+        self.duplicates = 0
+        self.retracted = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def first_delivery(self, raw_log) -> bool:
+        """Records the log and returns True if it has not been delivered before."""
+        return self.first_seen(log_key(raw_log))
+
+    def first_seen(self, key: bytes) -> bool:
+        """Same as first_delivery() for a key of something other than a log (e.g. an alert id)."""
+        if key in self._keys:
+            self.duplicates += 1
+            return False
+        self._keys[key] = None
+        if len(self._keys) > self.capacity:
+            self._keys.popitem(last=False)
+        return True
+
+    def retract(self, raw_log) -> bool:
+        """
+        Forgets a log the node flagged `removed` (chain reorg), so that its
+        re-inclusion in the canonical chain is delivered again. Returns True if it
+        had been delivered.
+        """
+        key = log_key(raw_log)
+        if key not in self._keys:
+            return False
+        del self._keys[key]
+        self.retracted += 1
+        return True
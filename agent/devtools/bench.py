@@ -0,0 +1,447 @@
+# devtools/bench.py
+"""
+Synthetic load benchmark for the event pipeline (no network needed).
+
+Usage:
+    python -m agent.devtools.bench                                    # 100 contracts, 20000 logs, unpaced
+    python -m agent.devtools.bench --contracts 5000 --events 50000 --rate 2000
+    python -m agent.devtools.bench --save bench_baseline.json         # record a baseline
+    python -m agent.devtools.bench --check bench_baseline.json        # exit status 1 on a regression
+    python -m agent.devtools.bench --contracts 50 --events 100000 --record logs.jsonl  # input for fake_ws_node
+
+ERC20 Transfer/Approval logs (4:1) are generated for --contracts tokens and pushed,
+formatted as web3's log subscription delivers them, through deliver_log ->
+handle_event -> ACTION_PIPELINE with the listener's own log_event/check_value
+actions, at --rate logs per second (0 = as fast as possible). The journal, spill
+file and stores are fresh ones in a temporary directory, and the listener's
+per-event prints go to /dev/null. Then the /get_events query path is replayed
+against the filled RECENT_EVENTS. Reported:
+
+    ingest      logs/s through decode + dispatch, per-log latency (p50/p99)
+    end_to_end  logs/s until every action ran, arrival -> event recorded latency
+    query       /get_events queries/s (by contract, event, client, cursor pages) incl. JSON encoding
+    records     decode cost, retained bytes and live objects per stored event, and
+                serialization: EventRecords vs the decoded-event dicts they replaced
+    memory      peak RSS of the process
+
+--check compares against a baseline saved with the same parameters: throughput
+more than --tolerance below it, or latency/memory more than --tolerance above it,
+fails the run. Every metric is the median of --runs repetitions.
+
+agent/devtools/bench_baseline.json is the baseline at the default parameters; CI
+runs the check through the opt-in test (RUN_BENCH=1 python -m pytest tests/test_bench.py),
+and a change that moves the numbers on purpose re-records it with --save on the CI machine.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+
+ERC20_EVENTS_ABI = [
+    {"anonymous": False, "name": "Transfer", "type": "event", "inputs": [
+        {"indexed": True, "name": "from", "type": "address"},
+        {"indexed": True, "name": "to", "type": "address"},
+        {"indexed": False, "name": "value", "type": "uint256"}]},
+    {"anonymous": False, "name": "Approval", "type": "event", "inputs": [
+        {"indexed": True, "name": "owner", "type": "address"},
+        {"indexed": True, "name": "spender", "type": "address"},
+        {"indexed": False, "name": "value", "type": "uint256"}]},
+]
+CLIENTS = 10 # Contracts are spread over this many client_ids
+BLOCK_TIME = 2 # Seconds, as on Base
+QUERY_LIMIT = 100 # /get_events default page size
+
+# Metric -> direction checked by --check ("higher" or "lower" is better)
+CHECKED_METRICS = {
+    "ingest_logs_per_s": "higher",
+    "ingest_p50_us": "lower",
+    "ingest_p99_us": "lower",
+    "e2e_logs_per_s": "higher",
+    "e2e_p50_ms": "lower",
+    "e2e_p99_ms": "lower",
+    "query_per_s": "higher",
+    "query_p50_us": "lower",
+    "query_p99_us": "lower",
+    "record_bytes_per_event": "lower",
+    "rss_peak_mb": "lower",
+}
+
+
+# --- Load generation ---
+def _address(seed: int, index: int) -> str:
+    return "0x" + f"{seed:04x}{index:036x}"
+
+def _topic(address: str) -> str:
+    return "0x" + "0" * 24 + address[2:]
+
+def generate_logs(contracts: int, events: int, rate: float = 0, holders: int = 1000, seed: int = 1) -> List[dict]:
+    """
+    ERC20 logs in JSON-RPC form (hex fields, as eth_getLogs returns them), in block
+    order: 4 Transfers per Approval, random holders and amounts, token activity skewed
+    towards the first contracts. Blocks hold 2s worth of --rate (or 200 logs when unpaced).
+    """
+    from web3 import Web3
+    transfer = Web3.keccak(text="Transfer(address,address,uint256)").hex()
+    approval = Web3.keccak(text="Approval(address,address,uint256)").hex()
+    transfer, approval = ["0x" + t.removeprefix("0x") for t in (transfer, approval)]
+    rng = random.Random(seed)
+    tokens = [_address(0xc0, i) for i in range(contracts)]
+    wallets = [_address(0xa0, i) for i in range(holders)]
+    per_block = max(1, int(rate * BLOCK_TIME)) if rate else 200
+    logs = []
+    for n in range(events):
+        block, log_index = divmod(n, per_block)
+        token = tokens[min(contracts - 1, int(rng.paretovariate(1.2)) - 1)] if rng.random() < 0.5 else rng.choice(tokens)
+        topic0 = approval if rng.random() < 0.2 else transfer
+        logs.append({
+            "address": token,
+            "topics": [topic0, _topic(rng.choice(wallets)), _topic(rng.choice(wallets))],
+            "data": "0x" + rng.randrange(10 ** 24).to_bytes(32, "big").hex(),
+            "blockNumber": hex(1_000_000 + block),
+            "blockHash": "0x" + (1_000_000 + block).to_bytes(32, "big").hex(),
+            "transactionHash": "0x" + rng.getrandbits(256).to_bytes(32, "big").hex(),
+            "transactionIndex": hex(log_index),
+            "logIndex": hex(log_index),
+            "removed": False,
+        })
+    return logs
+
+def format_logs(logs: List[dict]) -> list:
+    """JSON-RPC logs -> the AttributeDicts web3's subscription hands to the listener."""
+    from hexbytes import HexBytes
+    from web3 import Web3
+    from web3.datastructures import AttributeDict
+    checksums: Dict[str, str] = {}
+    formatted = []
+    for log in logs:
+        address = log["address"]
+        if address not in checksums:
+            checksums[address] = Web3.to_checksum_address(address)
+        formatted.append(AttributeDict({
+            "address": checksums[address],
+            "topics": [HexBytes(t) for t in log["topics"]],
+            "data": HexBytes(log["data"]),
+            "blockNumber": int(log["blockNumber"], 16),
+            "blockHash": HexBytes(log["blockHash"]),
+            "transactionHash": HexBytes(log["transactionHash"]),
+            "transactionIndex": int(log["transactionIndex"], 16),
+            "logIndex": int(log["logIndex"], 16),
+            "removed": log["removed"],
+        }))
+    return formatted
+
+
+# --- Measurement helpers ---
+def _percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+def _rss_peak_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024 # bytes on macOS, KiB on Linux
+
+
+# --- Benchmarks ---
+def _setup_listener(workdir: str, contracts: List[str]):
+    """Points the listener's module globals at fresh, temporary state and registers `contracts`."""
+    from web3 import Web3
+    from agent import background_listener as bl
+    from agent.action_pipeline import ActionPipeline
+    from agent.backfill import BackfillCheckpoints, BlockProgress
+    from agent.config import ACTION_OVERFLOW, ACTION_QUEUE_SIZE, ACTION_WORKERS, RECENT_EVENTS_MAX_SIZE
+    from agent.delivery import DeliveryDeduplicator
+    from agent.event_decoding import EventDecoderRegistry
+    from agent.event_journal import EventJournal
+    from agent.event_store import RecentEventStore
+    from agent import transfer_windows
+
+    abi_path = os.path.join(workdir, "erc20.json")
+    with open(abi_path, "w") as f:
+        json.dump(ERC20_EVENTS_ABI, f)
+    bl.DECODER_REGISTRY = EventDecoderRegistry(Web3())
+    bl.RECENT_EVENTS = RecentEventStore(RECENT_EVENTS_MAX_SIZE)
+    bl.EVENT_JOURNAL = EventJournal(os.path.join(workdir, "events.db"))
+    bl.DELIVERED_LOGS = DeliveryDeduplicator(max(len(contracts), 100000))
+    bl.BACKFILL_CHECKPOINTS = BackfillCheckpoints(os.path.join(workdir, "checkpoints.json"))
+    bl.BLOCK_PROGRESS = BlockProgress(bl.BACKFILL_CHECKPOINTS)
+    transfer_windows.TOKEN_DECIMALS = transfer_windows.TokenDecimals(os.path.join(workdir, "token_decimals.json"))
+    transfer_windows.TRANSFER_WINDOWS = transfer_windows.TransferWindows(on_alert=bl.dispatch_alert)
+    active_contracts = {}
+    for i, address in enumerate(contracts):
+        config = {
+            "abi_path": abi_path,
+            "tracked_events": ["Transfer", "Approval"],
+            "actions": ["log_event", "check_value"],
+            "client_id": f"client-{i % CLIENTS}",
+        }
+        active_contracts[address] = bl.load_contract(address, config)
+    return bl, active_contracts, ActionPipeline, dict(
+        workers=ACTION_WORKERS, queue_size=ACTION_QUEUE_SIZE, overflow=ACTION_OVERFLOW,
+        spill_path=os.path.join(workdir, "action_spill.bin"), action_options=bl.ACTION_OPTIONS
+    )
+
+async def _run_pipeline(logs: list, rate: float, workdir: str, contracts: List[str]) -> dict:
+    bl, active_contracts, ActionPipeline, options = _setup_listener(workdir, contracts)
+    arrivals: Dict[str, float] = {}
+    completions: List[float] = []
+    log_event = bl.log_event_action
+
+    def timed_log_event(event_data):
+        log_event(event_data)
+        arrival = arrivals.get(event_data["transactionHash"])
+        if arrival is not None and "alert" not in event_data: # Window alerts are logged too, but not timed
+            completions.append(time.perf_counter() - arrival)
+
+    dispatcher = dict(bl.ACTION_DISPATCHER, log_event=timed_log_event)
+    bl.ACTION_PIPELINE = pipeline = ActionPipeline(dispatcher, **options)
+    pipeline.on_settled = bl._action_settled
+    await pipeline.start()
+    journal_task = asyncio.create_task(bl.EVENT_JOURNAL.run())
+    from agent.transfer_windows import TRANSFER_WINDOWS
+    windows_task = asyncio.create_task(TRANSFER_WINDOWS.run())
+
+    ingest: List[float] = []
+    started = time.perf_counter()
+    for n, raw_log in enumerate(logs):
+        if rate:
+            due = started + n / rate
+            now = time.perf_counter()
+            if due > now:
+                await asyncio.sleep(due - now)
+            arrival = due # Time spent behind schedule counts towards latency
+        else:
+            arrival = time.perf_counter()
+        arrivals["0x" + raw_log["transactionHash"].hex()] = arrival
+        begin = time.perf_counter()
+        bl.LOGS_RECEIVED.labels(raw_log["address"].lower()).inc() # As _event_worker does
+        await bl.deliver_log(raw_log, active_contracts, None)
+        ingest.append(time.perf_counter() - begin)
+    ingested = time.perf_counter() - started
+    windows_task.cancel() # Applies the last batch; alerts it raises on the way out are dropped
+    await asyncio.gather(windows_task, return_exceptions=True)
+    await pipeline.join()
+    finished = time.perf_counter() - started
+    await pipeline.close()
+    journal_task.cancel()
+    await asyncio.gather(journal_task, return_exceptions=True)
+
+    return {
+        "ingest_logs_per_s": len(logs) / ingested,
+        "ingest_p50_us": _percentile(ingest, 0.50) * 1e6,
+        "ingest_p99_us": _percentile(ingest, 0.99) * 1e6,
+        "e2e_logs_per_s": len(completions) / finished,
+        "e2e_p50_ms": _percentile(completions, 0.50) * 1e3,
+        "e2e_p99_ms": _percentile(completions, 0.99) * 1e3,
+        "events_recorded": len(completions),
+        "actions_dropped": pipeline.dropped,
+        "actions_spilled": pipeline.spilled,
+        "journal_rows": bl.EVENT_JOURNAL.count(),
+    }
+
+def run_queries(store, contracts: List[str], queries: int, seed: int = 2) -> dict:
+    """Replays /get_events against `store`: the same query + JSON encoding the endpoint does."""
+    from agent.event_record import records_json
+    rng = random.Random(seed)
+    latencies: List[float] = []
+    returned = 0
+    started = time.perf_counter()
+    for _ in range(queries):
+        kind = rng.random()
+        if kind < 0.4:
+            filters = {"address": rng.choice(contracts)}
+        elif kind < 0.6:
+            filters = {"event": rng.choice(["Transfer", "Approval"])}
+        elif kind < 0.8:
+            filters = {"client_id": f"client-{rng.randrange(CLIENTS)}"}
+        else:
+            filters = {} # Unfiltered feed, three pages deep
+        begin = time.perf_counter()
+        cursor = None
+        for _ in range(3 if not filters else 1):
+            events, cursor = store.query(cursor=cursor, limit=QUERY_LIMIT, **filters)
+            f'{{"events":{records_json(events)},"next_cursor":{json.dumps(cursor)}}}'
+            returned += len(events)
+            if cursor is None:
+                break
+        latencies.append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - started
+    return {
+        "query_per_s": queries / elapsed,
+        "query_p50_us": _percentile(latencies, 0.50) * 1e6,
+        "query_p99_us": _percentile(latencies, 0.99) * 1e6,
+        "query_events_returned": returned,
+    }
+
+def _legacy_entry(event_data, client_id) -> dict:
+    # The decoded-event dict handle_event built before EventRecords, as RecentEventStore kept it
+    from agent.event_record import _json_safe
+    return _json_safe({
+        'address': event_data.address, 'event': event_data.event, 'args': dict(event_data.args),
+        'logIndex': event_data.logIndex, 'transactionIndex': event_data.transactionIndex,
+        'transactionHash': event_data.transactionHash.hex(), 'blockHash': event_data.blockHash.hex(),
+        'blockNumber': event_data.blockNumber, 'client_id': client_id, 'detected_at': time.time(), 'seq': 0,
+    })
+
+def _measure_retained(build, logs: list) -> tuple:
+    """(seconds, retained bytes, live objects) for the list `build` makes from `logs`."""
+    import gc
+    gc.collect()
+    started = time.perf_counter()
+    build(logs) # Timed on its own: tracing slows allocation down
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    entries = build(logs)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return entries, elapsed, retained, sys.getallocatedblocks() - blocks
+
+def run_records(logs: list) -> dict:
+    """Decode -> stored form for `logs`, once as EventRecords and once as the former dicts."""
+    from web3 import Web3
+    from agent.event_decoding import AbiDecoders
+    from agent.event_record import EventRecord
+    decoders = AbiDecoders(Web3(), ERC20_EVENTS_ABI)
+    pairs = [(decoders.lookup(log), log) for log in logs]
+    records, record_s, record_bytes, record_blocks = _measure_retained(
+        lambda logs: [d.decode_record(log, "client-0") for d, log in pairs], logs)
+    for record in records:
+        record.detected_at, record.seq = time.time(), 0 # As RecentEventStore.append sets them
+    dicts, dict_s, dict_bytes, dict_blocks = _measure_retained(
+        lambda logs: [_legacy_entry(d.decode(log), "client-0") for d, log in pairs], logs)
+
+    for record in records:
+        record.to_json() # Warms the address checksum cache, as a running API's would be
+    started = time.perf_counter()
+    json_size = sum(len(record.to_json()) for record in records)
+    json_s = time.perf_counter() - started
+    started = time.perf_counter()
+    blobs = [record.to_bytes() for record in records]
+    bytes_s = time.perf_counter() - started
+    started = time.perf_counter()
+    for blob in blobs:
+        EventRecord.from_bytes(blob)
+    from_bytes_s = time.perf_counter() - started
+    started = time.perf_counter()
+    dict_json_size = sum(len(json.dumps(entry, separators=(",", ":"))) for entry in dicts)
+    dict_json_s = time.perf_counter() - started
+    n = len(logs)
+    return {
+        "record_decode_us": record_s / n * 1e6,
+        "dict_decode_us": dict_s / n * 1e6,
+        "record_bytes_per_event": record_bytes / n,
+        "dict_bytes_per_event": dict_bytes / n,
+        "record_objects_per_event": record_blocks / n,
+        "dict_objects_per_event": dict_blocks / n,
+        "record_json_us": json_s / n * 1e6,
+        "dict_json_us": dict_json_s / n * 1e6,
+        "record_json_size": json_size / n,
+        "dict_json_size": dict_json_size / n,
+        "record_binary_us": bytes_s / n * 1e6,
+        "record_from_binary_us": from_bytes_s / n * 1e6,
+        "record_binary_size": sum(map(len, blobs)) / n,
+    }
+
+def run(contracts: int, events: int, rate: float = 0, queries: int = 2000, seed: int = 1) -> dict:
+    logs = format_logs(generate_logs(contracts, events, rate, seed=seed))
+    tokens = [_address(0xc0, i) for i in range(contracts)]
+    with tempfile.TemporaryDirectory(prefix="agent-bench-") as workdir:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results = asyncio.run(_run_pipeline(logs, rate, workdir, tokens))
+            from agent import background_listener as bl
+            results.update(run_queries(bl.RECENT_EVENTS, tokens, queries))
+    results.update(run_records(logs))
+    results["rss_peak_mb"] = _rss_peak_mb()
+    return results
+
+def run_median(runs: int, *args, **kwargs) -> dict:
+    """run() `runs` times; every metric is the median over the runs, to keep --check stable on noisy machines."""
+    samples = [run(*args, **kwargs) for _ in range(runs)]
+    return {k: round(statistics.median(s[k] for s in samples), 3) for k in samples[0]}
+
+
+# --- Baselines ---
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regression messages for every checked metric worse than `baseline` by more than `tolerance`."""
+    failures = []
+    for name, better in CHECKED_METRICS.items():
+        old, new = baseline.get(name), results.get(name)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if (better == "higher" and change < -tolerance) or (better == "lower" and change > tolerance):
+            failures.append(f"{name}: {new:g} vs baseline {old:g} ({change:+.0%})")
+    return failures
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--contracts", type=int, default=100, help="Tracked ERC20 contracts")
+    parser.add_argument("--events", type=int, default=20000, help="Logs to replay")
+    parser.add_argument("--rate", type=float, default=0, help="Logs per second (0 = as fast as possible)")
+    parser.add_argument("--queries", type=int, default=2000, help="/get_events queries to replay")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=3, help="Repetitions (the median of each metric is reported)")
+    parser.add_argument("--record", metavar="PATH", help="Only write the generated logs as JSONL (fake_ws_node input)")
+    parser.add_argument("--save", metavar="PATH", help="Write the results as a baseline")
+    parser.add_argument("--check", metavar="PATH", help="Fail if results regressed against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression for --check")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        with open(args.record, "w") as f:
+            for log in generate_logs(args.contracts, args.events, args.rate, seed=args.seed):
+                f.write(json.dumps(log) + "\n")
+        print(f"Wrote {args.events} log(s) for {args.contracts} contract(s) to {args.record}.")
+        return 0
+
+    params = {"contracts": args.contracts, "events": args.events, "rate": args.rate,
+              "queries": args.queries, "seed": args.seed}
+    results = run_median(args.runs, args.contracts, args.events, args.rate, args.queries, args.seed)
+    print(f"{args.events} logs, {args.contracts} contracts, rate {'unpaced' if not args.rate else f'{args.rate:g}/s'}, median of {args.runs} run(s)")
+    print(f"  ingest      {results['ingest_logs_per_s']:10.0f} logs/s   p50 {results['ingest_p50_us']:9.1f} us   p99 {results['ingest_p99_us']:9.1f} us")
+    print(f"  end_to_end  {results['e2e_logs_per_s']:10.0f} logs/s   p50 {results['e2e_p50_ms']:9.2f} ms   p99 {results['e2e_p99_ms']:9.2f} ms")
+    print(f"  query       {results['query_per_s']:10.0f} q/s      p50 {results['query_p50_us']:9.1f} us   p99 {results['query_p99_us']:9.1f} us")
+    print(f"  records     decode {results['record_decode_us']:6.1f} us (dicts {results['dict_decode_us']:.1f})   "
+          f"{results['record_bytes_per_event']:6.0f} B / {results['record_objects_per_event']:.1f} objects per event "
+          f"(dicts {results['dict_bytes_per_event']:.0f} B / {results['dict_objects_per_event']:.1f})")
+    print(f"              json {results['record_json_us']:6.1f} us, {results['record_json_size']:.0f} B (dicts {results['dict_json_us']:.1f} us, "
+          f"{results['dict_json_size']:.0f} B)   binary {results['record_binary_us']:.1f} us out, "
+          f"{results['record_from_binary_us']:.1f} us in, {results['record_binary_size']:.0f} B")
+    print(f"  memory      {results['rss_peak_mb']:10.1f} MB peak RSS")
+    print(f"  recorded {results['events_recorded']} event(s), journal {results['journal_rows']} row(s), "
+          f"actions dropped {results['actions_dropped']}, spilled {results['actions_spilled']}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"params": params, "results": results}, f, indent=2)
+        print(f"Saved baseline to {args.save}.")
+    if args.check:
+        with open(args.check, "r") as f:
+            baseline = json.load(f)
+        if baseline.get("params") != params:
+            print(f"Baseline {args.check} was recorded with {baseline.get('params')}; rerun with the same parameters.")
+            return 2
+        failures = compare(results, baseline["results"], args.tolerance)
+        for failure in failures:
+            print(f"  REGRESSION {failure}")
+        if failures:
+            return 1
+        print(f"No regression against {args.check} (tolerance {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
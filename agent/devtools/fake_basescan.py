@@ -0,0 +1,115 @@
+# devtools/fake_basescan.py
+"""
+Minimal stand-in for the Basescan API: module=contract&action=getabi and
+module=account&action=balance / balancemulti.
+
+Usage:
+    python -m agent.devtools.fake_basescan erc20_abi.json --port 8547 --rate 5
+    BASESCAN_API_URL=http://127.0.0.1:8547/api python agent/add_contract.py --file addresses.txt
+
+Every address gets the given ABI, except addresses listed with --unverified, which
+get Basescan's "Contract source code not verified" error. Requests beyond --rate per
+second are answered with Basescan's rate-limit error, so client-side throttling and
+retries can be exercised without a real API key. Balances are derived from the
+address (its last 6 hex digits, in gwei) so results can be checked; balancemulti
+rejects more than 20 addresses, like Basescan.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeBasescan:
+    def __init__(self, abi, rate=0.0, unverified=()):
+        self.abi_json = json.dumps(abi)
+        self.rate = rate
+        self.unverified = {a.lower() for a in unverified}
+        self.requests = 0
+        self.rate_limited = 0
+        self.addresses_per_request = []
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._lock = threading.Lock()
+
+    def _over_rate(self):
+        if not self.rate:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start, self._window_count = now, 0
+            self._window_count += 1
+            return self._window_count > self.rate
+
+    def respond(self, query):
+        self.requests += 1
+        if self._over_rate():
+            self.rate_limited += 1
+            return {"status": "0", "message": "NOTOK", "result": "Max rate limit reached"}
+        if query.get("module") == "account":
+            return self._account(query)
+        if query.get("module") != "contract" or query.get("action") != "getabi":
+            return {"status": "0", "message": "NOTOK", "result": "Error! Missing Or invalid Module name"}
+        if (query.get("address") or "").lower() in self.unverified:
+            return {"status": "0", "message": "NOTOK", "result": "Contract source code not verified"}
+        return {"status": "1", "message": "OK", "result": self.abi_json}
+
+    @staticmethod
+    def balance_of(address):
+        return int(address[-6:], 16) * 10 ** 9
+
+    def _account(self, query):
+        addresses = [a.strip().lower() for a in (query.get("address") or "").split(",") if a.strip()]
+        if query.get("action") == "balance" and len(addresses) == 1:
+            self.addresses_per_request.append(1)
+            return {"status": "1", "message": "OK", "result": str(self.balance_of(addresses[0]))}
+        if query.get("action") != "balancemulti" or not addresses:
+            return {"status": "0", "message": "NOTOK", "result": "Error! Invalid action or address"}
+        if len(addresses) > 20:
+            return {"status": "0", "message": "NOTOK", "result": "Error! Maximum 20 addresses allowed"}
+        self.addresses_per_request.append(len(addresses))
+        result = [{"account": a, "balance": str(self.balance_of(a))} for a in addresses]
+        return {"status": "1", "message": "OK", "result": result}
+
+    def server(self, host="127.0.0.1", port=8547):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                body = json.dumps(api.respond(query)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return ThreadingHTTPServer((host, port), Handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("abi", help="ABI JSON file returned for every address")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8547)
+    parser.add_argument("--rate", type=float, default=0.0, help="Requests per second before rate-limit errors (0 = unlimited)")
+    parser.add_argument("--unverified", action="append", default=[], help="Address answered as not verified (repeatable)")
+    args = parser.parse_args()
+    with open(args.abi, "r") as f:
+        abi = json.load(f)
+    server = FakeBasescan(abi, args.rate, args.unverified).server(args.host, args.port)
+    print(f"Fake Basescan serving on http://{args.host}:{args.port}/api")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
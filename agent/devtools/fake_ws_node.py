@@ -0,0 +1,278 @@
+# devtools/fake_ws_node.py
+"""
+Minimal JSON-RPC WebSocket node that replays recorded logs to eth_subscribe('logs') clients.
+
+Usage:
+    python -m agent.devtools.fake_ws_node recorded_logs.jsonl --port 8546 --rate 5000
+    BASE_WSS_URL=ws://127.0.0.1:8546 python -m agent.main
+
+The recording is one JSON-RPC log object per line (hex-encoded fields, exactly as
+returned by eth_getLogs). Logs are delivered to every subscription whose address /
+topic0 filter matches, at --rate logs per second (0 = as fast as possible).
+eth_getLogs is answered from the same recording, eth_getBlockByNumber with a
+header stamped one second ago, and --drop-after closes each
+connection after that many pushed logs to exercise reconnect/replay handling.
+
+Several nodes with injected faults stand in for an RPC provider pool:
+
+    python -m agent.devtools.fake_ws_node logs.jsonl --port 8546 --http-port 8545
+    python -m agent.devtools.fake_ws_node logs.jsonl --port 8547 --latency 0.5 --jitter 0.5
+    python -m agent.devtools.fake_ws_node logs.jsonl --port 8548 --error-rate 0.3 --lag-blocks 20
+    RPC_URLS=ws://127.0.0.1:8546,http://127.0.0.1:8545,ws://127.0.0.1:8547,ws://127.0.0.1:8548 python -m agent.main
+
+--latency/--jitter delay every reply, --error-rate answers that share of requests
+with a rate limit error (HTTP 429 over HTTP), --lag-blocks reports a head that many
+blocks behind and --stall-after stops answering and pushing after that many seconds.
+--max-logs rejects eth_getLogs ranges holding more logs than that, as providers
+cap result sizes (the backfill splits the range and shrinks its chunks).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+import websockets
+
+CHAIN_ID = "0x2105" # Base mainnet
+
+
+def load_recording(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _block(value):
+    if value is None or value in ("latest", "safe", "finalized", "pending"):
+        return None
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+def _matches(log, log_filter):
+    block = int(log["blockNumber"], 16)
+    from_block, to_block = _block(log_filter.get("fromBlock")), _block(log_filter.get("toBlock"))
+    if (from_block is not None and block < from_block) or (to_block is not None and block > to_block):
+        return False
+    addresses = log_filter.get("address")
+    if addresses:
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        if log["address"].lower() not in {a.lower() for a in addresses}:
+            return False
+    topics = log_filter.get("topics") or []
+    for position, wanted in enumerate(topics):
+        if wanted is None:
+            continue
+        if position >= len(log["topics"]):
+            return False
+        wanted = [wanted] if isinstance(wanted, str) else wanted
+        if log["topics"][position].lower() not in {t.lower() for t in wanted}:
+            return False
+    return True
+
+
+class RpcError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeNode:
+    def __init__(self, logs, rate=0.0, loop_forever=False, drop_after=0,
+                 latency=0.0, jitter=0.0, error_rate=0.0, lag_blocks=0, stall_after=0.0, max_logs=0):
+        self.logs = logs
+        self.rate = rate
+        self.loop_forever = loop_forever
+        self.drop_after = drop_after
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.lag_blocks = lag_blocks
+        self.stall_after = stall_after
+        self.max_logs = max_logs
+        self.started = time.monotonic()
+        self.sent = 0
+        self.answered = 0
+        self._ids = itertools.count(1)
+
+    def _stalled(self):
+        return self.stall_after and time.monotonic() - self.started >= self.stall_after
+
+    async def _delay(self):
+        if self._stalled():
+            await asyncio.Future() # Never answers
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def _answer(self, method, params, subscriptions):
+        if method == "eth_subscribe" and params and params[0] == "logs":
+            sub_id = hex(next(self._ids))
+            subscriptions[sub_id] = params[1] if len(params) > 1 else {}
+            return sub_id
+        if method == "eth_unsubscribe":
+            return subscriptions.pop(params[0], None) is not None
+        if method == "eth_chainId":
+            return CHAIN_ID
+        if method == "eth_blockNumber":
+            return hex(self._head())
+        if method == "eth_getBlockByNumber":
+            return self._block_header(params[0])
+        if method == "eth_getLogs":
+            head = self._head()
+            logs = [log for log in self.logs if _matches(log, params[0]) and int(log["blockNumber"], 16) <= head]
+            if self.max_logs and len(logs) > self.max_logs:
+                raise RpcError(-32005, f"query returned more than {self.max_logs} results")
+            return logs
+        return None
+
+    def _head(self):
+        return max(0, max((int(l["blockNumber"], 16) for l in self.logs), default=0) - self.lag_blocks)
+
+    def _rate_limited(self):
+        return random.random() < self.error_rate
+
+    async def _reply(self, websocket, request, subscriptions):
+        await self._delay()
+        method, params = request.get("method"), request.get("params") or []
+        reply = {"jsonrpc": "2.0", "id": request.get("id")}
+        if method != "eth_subscribe" and self._rate_limited():
+            reply["error"] = {"code": -32005, "message": "rate limit exceeded"}
+        else:
+            try:
+                reply["result"] = self._answer(method, params, subscriptions)
+            except RpcError as e:
+                reply["error"] = {"code": e.code, "message": str(e)}
+        self.answered += 1
+        await websocket.send(json.dumps(reply))
+
+    async def handler(self, websocket):
+        subscriptions = {}
+        replay_task = None
+        pending = set()
+        try:
+            async for raw in websocket:
+                request = json.loads(raw)
+                if request.get("method") == "eth_subscribe":
+                    # Answered in order, before any log is pushed for it
+                    await self._reply(websocket, request, subscriptions)
+                    if replay_task is None:
+                        replay_task = asyncio.create_task(self._replay(websocket, subscriptions))
+                    continue
+                # Other requests are answered concurrently, like a real node (slow ones don't block the socket)
+                task = asyncio.create_task(self._reply(websocket, request, subscriptions))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        finally:
+            for task in list(pending) + ([replay_task] if replay_task else []):
+                task.cancel()
+
+    async def http_handler(self, request):
+        from aiohttp import web
+        body = await request.json()
+        await self._delay()
+        if self._rate_limited():
+            return web.Response(status=429, text="Too Many Requests")
+        self.answered += 1
+        reply = {"jsonrpc": "2.0", "id": body.get("id")}
+        try:
+            reply["result"] = self._answer(body.get("method"), body.get("params") or [], {})
+        except RpcError as e:
+            reply["error"] = {"code": e.code, "message": str(e)}
+        return web.json_response(reply)
+
+    def _block_header(self, number):
+        # Enough of a block for timestamp lookups; recorded blocks are treated as just mined
+        block = _block(number)
+        if block is None:
+            block = max((int(l["blockNumber"], 16) for l in self.logs), default=0)
+        return {
+            "number": hex(block),
+            "hash": "0x" + block.to_bytes(32, "big").hex(),
+            "parentHash": "0x" + max(block - 1, 0).to_bytes(32, "big").hex(),
+            "timestamp": hex(int(time.time()) - 1),
+            "transactions": [],
+        }
+
+    async def _replay(self, websocket, subscriptions):
+        # Give the client a moment to finish issuing its other subscriptions
+        await asyncio.sleep(0.2)
+        delay = 1.0 / self.rate if self.rate else 0
+        pushed = 0
+        while True:
+            for log in self.logs:
+                if self._stalled():
+                    await asyncio.Future() # Socket stays open, nothing arrives
+                for sub_id, log_filter in list(subscriptions.items()):
+                    if _matches(log, log_filter):
+                        await websocket.send(json.dumps({
+                            "jsonrpc": "2.0",
+                            "method": "eth_subscription",
+                            "params": {"subscription": sub_id, "result": log},
+                        }))
+                        self.sent += 1
+                        pushed += 1
+                        if self.drop_after and pushed >= self.drop_after:
+                            await websocket.close()
+                            return
+                await asyncio.sleep(delay)
+            if not self.loop_forever:
+                return
+
+
+async def start_http(node, host="127.0.0.1", port=0):
+    """Answers JSON-RPC over HTTP for `node` (port 0 picks a free one). Returns (runner, url); cleanup() the runner."""
+    from aiohttp import web # Installed with web3
+    app = web.Application(client_max_size=0)
+    app.router.add_post("/", node.http_handler)
+    runner = web.AppRunner(app, shutdown_timeout=0.1) # Stalled requests never finish
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+async def serve(logs, host="127.0.0.1", port=8546, rate=0.0, loop_forever=False, drop_after=0, http_port=0, **faults):
+    node = FakeNode(logs, rate, loop_forever, drop_after, **faults)
+    runner = None
+    if http_port:
+        runner, url = await start_http(node, host, http_port)
+        print(f"Fake node answering JSON-RPC on {url}")
+    try:
+        async with websockets.serve(node.handler, host, port, max_size=None):
+            print(f"Fake node replaying {len(logs)} log(s) on ws://{host}:{port}")
+            await asyncio.Future()
+    finally:
+        if runner:
+            await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("recording", help="JSONL file of recorded eth_getLogs entries")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8546)
+    parser.add_argument("--rate", type=float, default=0.0, help="Logs per second (0 = unthrottled)")
+    parser.add_argument("--loop", action="store_true", help="Replay the recording forever")
+    parser.add_argument("--drop-after", type=int, default=0, help="Close each connection after N pushed logs")
+    parser.add_argument("--http-port", type=int, default=0, help="Also answer JSON-RPC over HTTP on this port")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra seconds per reply, at random")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a rate limit error")
+    parser.add_argument("--lag-blocks", type=int, default=0, help="Report a head this many blocks behind the recording")
+    parser.add_argument("--stall-after", type=float, default=0.0, help="Stop answering and pushing after N seconds")
+    parser.add_argument("--max-logs", type=int, default=0, help="Reject eth_getLogs ranges with more logs than this")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(
+            load_recording(args.recording), args.host, args.port, args.rate, args.loop, args.drop_after, args.http_port,
+            latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+            lag_blocks=args.lag_blocks, stall_after=args.stall_after, max_logs=args.max_logs
+        ))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# devtools/importtime.py
+"""
+Import-time (cold start) benchmark for the agent's entry points.
+
+Usage:
+    python -m agent.devtools.importtime                       # default entry points
+    python -m agent.devtools.importtime agent.api_server --runs 9 --top 15
+    python -m agent.devtools.importtime agent.add_contract --forbid langchain --forbid web3
+
+Each module is imported in a fresh interpreter under `python -X importtime`, so
+caches from earlier imports never flatter the numbers. For every module the
+report shows the median cumulative import time over --runs and the heaviest
+packages it pulled in. --forbid PKG exits with status 1 if any measured module
+loads PKG (e.g. to keep the CLI free of the LLM stack).
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+DEFAULT_MODULES = [
+    "agent.config",
+    "agent.add_contract",
+    "agent.tools.monitoring_tools",
+    "agent.background_listener",
+    "agent.api_server",
+    "agent.main",
+]
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def measure_once(module: str) -> Tuple[float, Dict[str, float]]:
+    """Returns (cumulative ms for `module`, cumulative ms per top-level package it loaded)."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [_REPO_ROOT, os.environ.get("PYTHONPATH")])))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=_REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit status {proc.returncode}"
+        raise RuntimeError(f"import {module} failed: {error}")
+    total, packages = 0.0, {}
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        cumulative_ms = int(match.group(2)) / 1000
+        name = match.group(4)
+        if name == module:
+            total = cumulative_ms
+        root = name.split(".")[0]
+        packages[root] = max(packages.get(root, 0.0), cumulative_ms)
+    return total, packages
+
+
+def measure(module: str, runs: int) -> Tuple[float, Dict[str, float]]:
+    totals, merged = [], {}
+    for _ in range(runs):
+        total, packages = measure_once(module)
+        totals.append(total)
+        for name, ms in packages.items():
+            merged.setdefault(name, []).append(ms)
+    return statistics.median(totals), {name: statistics.median(v) for name, v in merged.items()}
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module (median is reported)")
+    parser.add_argument("--top", type=int, default=8, help="Heaviest packages listed per module")
+    parser.add_argument("--forbid", action="append", default=[], help="Fail if a module loads this package (repeatable)")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules:
+        try:
+            total, packages = measure(module, args.runs)
+        except RuntimeError as e:
+            print(f"{module:<32} ERROR: {e}")
+            failed = True
+            continue
+        print(f"{module:<32} {total:8.1f} ms")
+        own_root = module.split(".")[0]
+        heaviest = sorted(((ms, name) for name, ms in packages.items() if name != own_root), reverse=True)
+        for ms, name in heaviest[:args.top]:
+            print(f"    {name:<28} {ms:8.1f} ms")
+        loaded = [pkg for pkg in args.forbid if pkg in packages]
+        if loaded:
+            print(f"    FORBIDDEN: {module} loads {', '.join(loaded)}")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,379 @@
+# event_bus.py
+"""
+Local event bus over a Unix domain socket, so the listener, api_server and the
+agent REPL can run as separate processes and still share live state.
+
+The process that owns RECENT_EVENTS (the listener, or the shard supervisor) runs
+an EventBusServer. Other processes run an EventBusClient, which mirrors every
+recorded event into their own RECENT_EVENTS store; existing readers (the
+/get_events and /events/stream endpoints, the agent tools) work unchanged.
+
+Wire format: one JSON object per line in both directions.
+  server -> client   {"type": "hello", "entry": {"epoch": e}} first reply to a subscribe: seqs are only comparable within an epoch
+                     {"type": "event", "entry": {...}}        a recorded event (entry["seq"] is the server's seq)
+                     {"type": "removed", "entry": {...}}      an event flagged by a chain reorg
+                     {"type": "gap", "entry": {...}}          events after the client's cursor were evicted
+                     {"type": "reply", "id": n, "result": ...} / {"type": "error", "id": n, "error": "..."}
+  client -> server   {"cmd": "subscribe", "cursor": seq|null, "epoch": e|null, "backlog": n}
+                     {"cmd": "reload_targets"}  {"cmd": "stats"}  {"cmd": "metrics"}  {"cmd": "ping"}
+                     (with an optional "id"; "metrics" replies with Prometheus text)
+"""
+import asyncio
+import itertools
+import json
+import os
+import socket
+import threading
+from typing import Callable, Dict, Optional
+
+from agent.event_record import json_default
+from agent.event_store import RecentEventStore
+
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, separators=(",", ":"), default=json_default).encode() + b"\n"
+
+
+class _Connection:
+    __slots__ = ("writer", "last_seq", "subscribed")
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.last_seq = 0
+        self.subscribed = False
+
+
+class EventBusServer:
+    """
+    Serves the event bus from its own thread and event loop. Each event is
+    serialized once and written to every subscriber; a subscriber whose unsent
+    output exceeds `max_client_buffer` bytes is disconnected and catches up from
+    its cursor when it reconnects.
+    """
+
+    def __init__(self, path: str, store: RecentEventStore,
+                 stats_provider: Optional[Callable[[], dict]] = None,
+                 on_reload: Optional[Callable[[], None]] = None,
+                 metrics_provider: Optional[Callable[[], str]] = None,
+                 max_client_buffer: int = 8 * 1024 * 1024):
+        self.path = path
+        self.store = store
+        self.stats_provider = stats_provider
+        self.on_reload = on_reload
+        self.metrics_provider = metrics_provider
+        self.max_client_buffer = max_client_buffer
+        self._connections = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._remove_listener = None
+        self._ready = threading.Event()
+        self.published = 0
+        self.disconnected_slow = 0
+
+    # --- Lifecycle ---
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="event-bus", daemon=True).start()
+        self._ready.wait(timeout=5)
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._open())
+        except OSError as e:
+            print(f"Event bus Error: cannot listen on {self.path}: {e}")
+            self._ready.set()
+            return
+        self._remove_listener = self.store.add_listener(self._publish)
+        print(f"Event bus listening on {self.path}")
+        self._ready.set()
+        self._loop.run_forever()
+        # Let connection handlers finish their cleanup before the loop is closed
+        pending = asyncio.all_tasks(self._loop)
+        for task in pending:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self._loop.close()
+
+    async def _open(self) -> None:
+        if os.path.exists(self.path):
+            # A socket file left by a crashed process: only replace it if nothing answers
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)
+            else:
+                raise OSError("another process is already serving the event bus")
+            finally:
+                probe.close()
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        os.chmod(self.path, 0o600) # Same-user processes only
+
+    def stop(self) -> None:
+        if self._remove_listener is not None:
+            self._remove_listener()
+            self._remove_listener = None
+        loop = self._loop
+        if loop is None or not loop.is_running():
+            return
+
+        async def shutdown():
+            self._server.close()
+            for connection in list(self._connections):
+                connection.writer.close()
+            loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop)
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    # --- Fan-out ---
+    def _publish(self, kind: str, entry) -> None:
+        # Called on the writer's thread: serialize here, hop to the bus loop once
+        line = _encode({"type": kind, "entry": entry})
+        seq = entry.seq if kind == "event" else 0
+        try:
+            self._loop.call_soon_threadsafe(self._broadcast, seq, line)
+        except RuntimeError: # Loop closed during shutdown
+            pass
+
+    def _broadcast(self, seq: int, line: bytes) -> None:
+        self.published += 1
+        for connection in list(self._connections):
+            if not connection.subscribed or (seq and seq <= connection.last_seq):
+                continue # Not subscribed yet, or already sent as part of its backlog
+            transport = connection.writer.transport
+            if transport.get_write_buffer_size() > self.max_client_buffer:
+                self.disconnected_slow += 1
+                print("Event bus Warning: disconnecting a slow subscriber (it will resume from its cursor).")
+                self._connections.discard(connection)
+                connection.writer.close()
+                continue
+            connection.writer.write(line)
+            if seq:
+                connection.last_seq = seq
+
+    def _subscribe(self, connection: _Connection, cursor: Optional[int], backlog: int, epoch: Optional[str] = None) -> None:
+        if cursor is not None and epoch is not None and epoch != self.store.epoch:
+            cursor = 0 # The cursor is a seq of the previous listener process: send everything held
+        connection.writer.write(_encode({"type": "hello", "entry": {"epoch": self.store.epoch}}))
+        if cursor is None:
+            entries = self.store.tail(backlog) if backlog else []
+        else:
+            if cursor + 1 < self.store.first_seq:
+                connection.writer.write(_encode({"type": "gap", "entry": {"cursor": cursor, "first_seq": self.store.first_seq}}))
+            entries = self.store.after(cursor, limit=self.store.maxlen)
+        connection.writer.write(b"".join(_encode({"type": "event", "entry": entry}) for entry in entries))
+        connection.last_seq = entries[-1].seq if entries else (self.store.last_seq if cursor is None else cursor)
+        connection.subscribed = True
+
+    # --- Commands ---
+    async def _handle(self, reader, writer) -> None:
+        connection = _Connection(writer)
+        self._connections.add(connection)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    reply = self._command(connection, message)
+                except Exception as e:
+                    writer.write(_encode({"type": "error", "id": None, "error": str(e)}))
+                    continue
+                if reply is not None:
+                    writer.write(_encode(reply))
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(connection)
+            writer.close()
+
+    def _command(self, connection: _Connection, message: dict) -> Optional[dict]:
+        cmd, request_id = message.get("cmd"), message.get("id")
+        if cmd == "subscribe":
+            self._subscribe(connection, message.get("cursor"), int(message.get("backlog") or 0), message.get("epoch"))
+            return None
+        if cmd == "reload_targets":
+            if self.on_reload is not None:
+                self.on_reload()
+            result = True
+        elif cmd == "stats":
+            result = dict(self.stats_provider() if self.stats_provider else {}, bus=self.stats())
+        elif cmd == "metrics":
+            result = self.metrics_provider() if self.metrics_provider else ""
+        elif cmd == "ping":
+            result = "pong"
+        else:
+            return {"type": "error", "id": request_id, "error": f"unknown command '{cmd}'"}
+        return {"type": "reply", "id": request_id, "result": result}
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self._connections),
+            "published": self.published,
+            "disconnected_slow": self.disconnected_slow,
+        }
+
+
+class EventBusClient:
+    """
+    Connects to an EventBusServer from another process and mirrors its events into
+    `store`, reconnecting with backoff and resuming from the last seen seq. When the
+    listener restarted (a new epoch) it re-reads from seq 0, skipping the events it
+    restored from its journal that are already mirrored. Requests (stats,
+    reload_targets) can be sent from any thread.
+    """
+
+    def __init__(self, path: str, store: RecentEventStore, backlog: Optional[int] = None,
+                 reconnect_base_delay: float = 0.5, reconnect_max_delay: float = 10.0):
+        self.path = path
+        self.store = store
+        self.backlog = store.maxlen if backlog is None else backlog
+        self.reconnect_base_delay = reconnect_base_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.last_seq: Optional[int] = None # Server-side seq of the last mirrored event
+        self.epoch: Optional[str] = None # Server store's epoch that last_seq belongs to
+        self._last_detected_at: Optional[float] = None # Newest mirrored event
+        self._skip_until: Optional[float] = None # After a listener restart: events detected up to here are mirrored already
+        self.received = 0
+        self._sock: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, list] = {}
+        self._connected = threading.Event()
+        self._stopping = threading.Event()
+        self._unsubscribe_changes = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def start(self, forward_config_changes: bool = True) -> None:
+        """Starts the reader thread. With `forward_config_changes`, local contract store writes
+        ask the listener to reload its targets right away instead of at its next poll."""
+        threading.Thread(target=self._run, name="event-bus-client", daemon=True).start()
+        if forward_config_changes:
+            from agent.tools import contract_manager
+            self._unsubscribe_changes = contract_manager.subscribe_changes(lambda: self.send("reload_targets"))
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._unsubscribe_changes is not None:
+            self._unsubscribe_changes()
+            self._unsubscribe_changes = None
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def wait_connected(self, timeout: float) -> bool:
+        return self._connected.wait(timeout)
+
+    def _run(self) -> None:
+        attempt = 0
+        while not self._stopping.is_set():
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                delay = min(self.reconnect_max_delay, self.reconnect_base_delay * 2 ** attempt)
+                attempt += 1
+                if attempt == 1:
+                    print(f"Event bus: listener not reachable at {self.path}, retrying in the background...")
+                self._stopping.wait(delay)
+                continue
+            attempt = 0
+            self._sock = sock
+            try:
+                self._write({"cmd": "subscribe", "cursor": self.last_seq, "epoch": self.epoch, "backlog": self.backlog})
+                self._connected.set()
+                print(f"Event bus: connected to {self.path}")
+                for line in sock.makefile("rb"):
+                    self._dispatch(json.loads(line))
+            except (OSError, ValueError) as e:
+                if not self._stopping.is_set():
+                    print(f"Event bus: connection lost ({e}), reconnecting...")
+            finally:
+                self._connected.clear()
+                self._sock = None
+                sock.close()
+                for waiter in list(self._pending.values()):
+                    waiter[0].set() # Fail pending requests instead of letting them time out
+            if not self._stopping.is_set():
+                self._stopping.wait(self.reconnect_base_delay)
+
+    def _dispatch(self, message: dict) -> None:
+        kind = message.get("type")
+        if kind == "event":
+            entry = message["entry"]
+            seq = entry.get("seq")
+            if self.last_seq is not None and seq is not None and seq <= self.last_seq:
+                return
+            self.last_seq = seq
+            detected_at = entry.get("detected_at")
+            if self._skip_until is not None and detected_at is not None and detected_at <= self._skip_until:
+                return
+            self._last_detected_at = detected_at
+            self.received += 1
+            self.store.append(entry) # The mirror assigns its own contiguous seqs
+        elif kind == "hello":
+            epoch = message["entry"].get("epoch")
+            if self.epoch is not None and epoch != self.epoch:
+                print("Event bus: the listener restarted, re-reading its events from the start.")
+                self.last_seq = 0
+                self._skip_until = self._last_detected_at
+            self.epoch = epoch
+        elif kind == "removed":
+            entry = message["entry"]
+            self.store.mark_removed(entry.get("transactionHash"), entry.get("logIndex"), entry.get("blockNumber"))
+        elif kind == "gap":
+            print(f"Event bus Warning: events after seq {message['entry']['cursor']} were evicted before they could be mirrored.")
+        elif kind in ("reply", "error"):
+            waiter = self._pending.get(message.get("id"))
+            if waiter is not None:
+                waiter[1] = message
+                waiter[0].set()
+
+    def _write(self, message: dict) -> None:
+        sock = self._sock
+        if sock is None:
+            raise ConnectionError("event bus not connected")
+        with self._send_lock:
+            sock.sendall(_encode(message))
+
+    def send(self, cmd: str, **params) -> bool:
+        """Fire-and-forget command. Returns False when not connected."""
+        try:
+            self._write(dict(params, cmd=cmd))
+            return True
+        except (OSError, ConnectionError):
+            return False
+
+    def request(self, cmd: str, timeout: float = 2.0, **params):
+        """Sends a command and waits for its result. Raises on errors, disconnects and timeouts."""
+        request_id = next(self._ids)
+        waiter = [threading.Event(), None]
+        self._pending[request_id] = waiter
+        try:
+            self._write(dict(params, cmd=cmd, id=request_id))
+            if not waiter[0].wait(timeout):
+                raise TimeoutError(f"event bus request '{cmd}' timed out")
+            message = waiter[1]
+            if message is None:
+                raise ConnectionError("event bus connection lost")
+            if message["type"] == "error":
+                raise RuntimeError(message["error"])
+            return message["result"]
+        finally:
+            self._pending.pop(request_id, None)
+
+    def stats(self) -> dict:
+        return {"connected": self.connected, "received": self.received, "last_seq": self.last_seq, "epoch": self.epoch}
@@ -0,0 +1,179 @@
+# event_journal.py
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from agent import metrics
+from agent.event_record import EventRecord
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    detected_at REAL NOT NULL,
+    block_number INTEGER,
+    address TEXT,
+    event TEXT,
+    client_id TEXT,
+    tx_hash TEXT,
+    log_index INTEGER,
+    payload TEXT NOT NULL -- EventRecord.to_bytes() (a BLOB); JSON text in rows written by older versions
+);
+CREATE INDEX IF NOT EXISTS idx_events_detected_at ON events (detected_at);
+CREATE INDEX IF NOT EXISTS idx_events_address_block ON events (address, block_number);
+"""
+
+FLUSH_SECONDS = metrics.histogram("journal_flush_seconds", "Time to write one batch of events to the journal")
+EVENTS_WRITTEN = metrics.counter("journal_events_written_total", "Events written to the journal")
+EVENTS_DROPPED = metrics.counter("journal_events_dropped_total", "Unwritten events dropped past max_pending while writes failed")
+
+
+class EventJournal:
+    """
+    Append-only event history in an embedded SQLite database (WAL mode).
+    append() only buffers; rows are written in one transaction when `flush_size`
+    events are pending or every `flush_interval` seconds, so write cost stays flat
+    no matter how much history is retained. Rows older than `retention_seconds`
+    are deleted by compact(). A failed write keeps its rows pending for the next
+    flush, up to `max_pending` rows (the oldest are dropped past that).
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, flush_size: int = 500,
+                 retention_seconds: float = 30 * 24 * 3600, compact_interval: float = 3600,
+                 max_pending: int = 100000, busy_timeout: float = 10.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.retention_seconds = retention_seconds
+        self.compact_interval = compact_interval
+        self.max_pending = max_pending
+        self.busy_timeout = busy_timeout # Other processes (listener shards, tools) write the same file
+        self.dropped = 0
+        self._last_compact = time.monotonic()
+        self._pending: List[tuple] = []
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened lazily so importing the listener module never touches the disk
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL") # Durable across process crashes, fsync at checkpoints
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def append(self, event) -> None:
+        event = EventRecord.coerce(event)
+        row = (
+            event.detected_at or time.time(),
+            event.block_number,
+            event.address_key or "",
+            event.event,
+            event.client_id,
+            event["transactionHash"],
+            event.log_index,
+            event.to_bytes(),
+        )
+        with self._pending_lock:
+            self._pending.append(row)
+            full = len(self._pending) >= self.flush_size
+        if full and self._flush_requested is not None:
+            # append() may be called from action threads, so wake the loop safely
+            self._loop.call_soon_threadsafe(self._flush_requested.set)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def flush(self) -> int:
+        with self._write_lock:
+            with self._pending_lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            started = time.perf_counter()
+            try:
+                conn = self._connection()
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO events (detected_at, block_number, address, event, client_id, tx_hash, log_index, payload) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+            except Exception:
+                self._requeue(rows)
+                raise
+            FLUSH_SECONDS.observe(time.perf_counter() - started)
+            EVENTS_WRITTEN.inc(len(rows))
+        return len(rows)
+
+    def _requeue(self, rows: List[tuple]) -> None:
+        # Back in front of whatever was appended meanwhile, so journal order is kept
+        with self._pending_lock:
+            self._pending = rows + self._pending
+            excess = len(self._pending) - self.max_pending
+            if excess > 0:
+                del self._pending[:excess]
+                self.dropped += excess
+                EVENTS_DROPPED.inc(excess)
+
+    def compact(self, now: Optional[float] = None) -> int:
+        """Drops rows past the retention window and truncates the WAL file."""
+        cutoff = (now or time.time()) - self.retention_seconds
+        with self._write_lock:
+            conn = self._connection()
+            with conn:
+                deleted = conn.execute("DELETE FROM events WHERE detected_at < ?", (cutoff,)).rowcount
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return deleted
+
+    def replay(self, limit: int) -> List[EventRecord]:
+        """The most recent `limit` events, oldest first, for restoring in-memory state at startup."""
+        with self._write_lock:
+            rows = self._connection().execute(
+                "SELECT payload FROM events ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [
+            EventRecord.from_bytes(payload) if isinstance(payload, bytes) else EventRecord.from_dict(json.loads(payload))
+            for (payload,) in reversed(rows)
+        ]
+
+    def count(self) -> int:
+        with self._write_lock:
+            return self._connection().execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def maintain(self) -> int:
+        """Writes what is pending, and compacts once `compact_interval` has passed. Returns the rows written."""
+        written = self.flush()
+        if time.monotonic() - self._last_compact >= self.compact_interval:
+            self._last_compact = time.monotonic()
+            deleted = self.compact()
+            if deleted:
+                print(f"Event journal: compacted {deleted} event(s) past retention.")
+        return written
+
+    async def run(self) -> None:
+        """Background flush/compaction loop; flushes what is pending when cancelled."""
+        self._loop = asyncio.get_running_loop()
+        self._flush_requested = asyncio.Event()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_requested.clear()
+                try:
+                    await asyncio.to_thread(self.maintain)
+                except Exception as e:
+                    print(f"Error persisting recent events: {e}")
+        finally:
+            self._flush_requested = None
+            self.flush()
@@ -0,0 +1,386 @@
+# event_record.py
+"""
+Compact decoded event records.
+
+An EventRecord keeps what the decoder produced in raw form: addresses and hashes
+as bytes, numbers as ints, argument names and types in one EventSchema shared by
+every record of that event. Hex strings, checksummed addresses and the args dict
+are only built when a record is rendered (to_dict / to_json / format_event).
+Records still answer record["address"], record.get("client_id"), ... like the
+dicts they replace, so actions written against dicts keep working.
+
+Two wire formats:
+  to_json()   compact JSON object, the same fields as to_dict() (API, event bus, SSE)
+  to_bytes()  binary: a fixed header of the numeric and hash fields, then tagged
+              values for the rest (journal rows, spill file and shard pipes via pickle)
+"""
+import functools
+import json
+import math
+import struct
+import sys
+from typing import Dict, Iterable, Optional, Tuple
+
+# flags, address, blockHash, transactionHash, blockNumber, transactionIndex, logIndex, detected_at, seq
+_HEADER = struct.Struct(">B20s32s32sqiidq")
+_HAS_ADDRESS, _HAS_BLOCK_HASH, _HAS_TX_HASH, _REMOVED, _HAS_DETECTED_AT = 1, 2, 4, 8, 16
+_LENGTH = struct.Struct(">I")
+_FLOAT = struct.Struct(">d")
+_ZERO20, _ZERO32 = bytes(20), bytes(32)
+_dumps = json.JSONEncoder(separators=(",", ":"), default=str).encode
+_quote = json.encoder.encode_basestring_ascii # The C string encoder json.dumps itself uses
+
+# Dict keys of a record, as in the decoded event dicts used before
+FIELDS = ("address", "event", "args", "logIndex", "transactionIndex", "transactionHash",
+          "blockHash", "blockNumber", "client_id", "detected_at", "seq", "removed")
+
+
+@functools.lru_cache(maxsize=65536)
+def _checksum(address_hex: str) -> str:
+    from eth_utils import to_checksum_address # Only paid for when a record is rendered
+    return to_checksum_address(address_hex)
+
+
+def to_hex(value) -> str:
+    """'0x' + lowercase hex of raw bytes (no checksum); strings are passed through."""
+    return "0x" + bytes(value).hex() if isinstance(value, (bytes, bytearray)) else value
+
+
+def _to_bytes(value) -> Optional[bytes]:
+    """Raw bytes from HexBytes / bytes / '0x..' strings (with or without the prefix)."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        return bytes.fromhex(value[2:] if value[:2] in ("0x", "0X") else value)
+    return bytes(value)
+
+
+def _json_safe(value):
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    return value
+
+
+def _render(abi_type: str, value):
+    if abi_type == "address" and isinstance(value, bytes):
+        return _checksum("0x" + value.hex())
+    if abi_type == "address[]":
+        return [_checksum("0x" + v.hex()) if isinstance(v, bytes) else v for v in value]
+    return _json_safe(value)
+
+
+def _json_scalar(value) -> str:
+    # Fast path of json.dumps for the scalar fields of a record
+    cls = value.__class__
+    if value is None:
+        return "null"
+    if cls is int:
+        return str(value)
+    if cls is str:
+        return _quote(value)
+    if cls is float and math.isfinite(value):
+        return repr(value)
+    return _dumps(value)
+
+
+def _json_value(abi_type: str, value) -> str:
+    if value.__class__ is int:
+        return str(value)
+    if value.__class__ is bytes:
+        return '"' + (_checksum("0x" + value.hex()) if abi_type == "address" else "0x" + value.hex()) + '"'
+    return _dumps(_render(abi_type, value))
+
+
+def _is_address(value) -> bool:
+    return isinstance(value, str) and len(value) == 42 and value[:2] in ("0x", "0X")
+
+
+class EventSchema:
+    """Name, argument names and ABI types of one event; shared by all its records."""
+    __slots__ = ("name", "arg_names", "arg_types", "json_name", "json_keys", "packed")
+
+    def __init__(self, name: str, arg_names: Tuple[str, ...], arg_types: Tuple[str, ...]):
+        self.name = name
+        self.arg_names = arg_names
+        self.arg_types = arg_types
+        # Pre-encoded for EventRecord.to_json
+        self.json_name = _dumps(name)
+        self.json_keys = tuple(_dumps(n) + ":" for n in arg_names)
+        self.packed = None # ...and for to_bytes, on first use
+
+
+_SCHEMAS: Dict[tuple, EventSchema] = {}
+
+
+def event_schema(name: str, arg_names: Iterable[str], arg_types: Iterable[str]) -> EventSchema:
+    """The shared schema for this signature ('' types render values as they are)."""
+    key = (name, tuple(arg_names), tuple(arg_types))
+    schema = _SCHEMAS.get(key)
+    if schema is None:
+        schema = _SCHEMAS[key] = EventSchema(sys.intern(name), tuple(map(sys.intern, key[1])), key[2])
+    return schema
+
+
+# --- Tagged value codec (the variable part of to_bytes) ---
+def _pack(value, out: bytearray) -> None:
+    if value is None:
+        out += b"N"
+    elif value is True or value is False:
+        out += b"T" if value else b"F"
+    elif isinstance(value, int):
+        data = value.to_bytes((value.bit_length() + 8) // 8, "big", signed=True)
+        out += b"i" + bytes((len(data),)) + data
+    elif isinstance(value, float):
+        out += b"f" + _FLOAT.pack(value)
+    elif isinstance(value, (bytes, bytearray)):
+        out += b"b" + _LENGTH.pack(len(value)) + value
+    elif isinstance(value, str):
+        data = value.encode()
+        out += b"s" + _LENGTH.pack(len(data)) + data
+    elif isinstance(value, (list, tuple)):
+        out += b"l" + _LENGTH.pack(len(value))
+        for item in value:
+            _pack(item, out)
+    elif isinstance(value, dict):
+        out += b"d" + _LENGTH.pack(len(value))
+        for key, item in value.items():
+            _pack(str(key), out)
+            _pack(item, out)
+    else:
+        _pack(str(value), out)
+
+
+def _unpack(data: bytes, offset: int):
+    tag = data[offset:offset + 1]
+    offset += 1
+    if tag == b"N":
+        return None, offset
+    if tag in (b"T", b"F"):
+        return tag == b"T", offset
+    if tag == b"i":
+        size = data[offset]
+        return int.from_bytes(data[offset + 1:offset + 1 + size], "big", signed=True), offset + 1 + size
+    if tag == b"f":
+        return _FLOAT.unpack_from(data, offset)[0], offset + _FLOAT.size
+    (size,) = _LENGTH.unpack_from(data, offset)
+    offset += _LENGTH.size
+    if tag == b"b":
+        return data[offset:offset + size], offset + size
+    if tag == b"s":
+        return data[offset:offset + size].decode(), offset + size
+    if tag == b"l":
+        items = []
+        for _ in range(size):
+            item, offset = _unpack(data, offset)
+            items.append(item)
+        return items, offset
+    if tag == b"d":
+        items = {}
+        for _ in range(size):
+            key, offset = _unpack(data, offset)
+            items[key], offset = _unpack(data, offset)
+        return items, offset
+    raise ValueError(f"Corrupt event record: unknown tag {tag!r} at offset {offset - 1}")
+
+
+class EventRecord:
+    """
+    One decoded log (or alert). `args` is a tuple ordered like schema.arg_names;
+    alerts and other non-log entries keep their extra keys in `extra`.
+    """
+    __slots__ = ("schema", "args", "address", "block_number", "block_hash", "transaction_hash",
+                 "transaction_index", "log_index", "client_id", "detected_at", "seq", "removed", "extra")
+
+    def __init__(self, schema: EventSchema, args: tuple, address: Optional[bytes], block_number: Optional[int],
+                 block_hash: Optional[bytes], transaction_hash: Optional[bytes], transaction_index: Optional[int],
+                 log_index: Optional[int], client_id=None, detected_at: Optional[float] = None,
+                 seq: Optional[int] = None, removed: bool = False, extra: Optional[dict] = None):
+        self.schema = schema
+        self.args = args
+        self.address = address
+        self.block_number = block_number
+        self.block_hash = block_hash
+        self.transaction_hash = transaction_hash
+        self.transaction_index = transaction_index
+        self.log_index = log_index
+        self.client_id = client_id
+        self.detected_at = detected_at
+        self.seq = seq
+        self.removed = removed
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, event: dict) -> "EventRecord":
+        """From a decoded-event dict (journal rows written before records, event bus entries, alerts)."""
+        args = event.get("args") or {}
+        schema = event_schema(
+            event.get("event") or "", args, ("address" if _is_address(v) else "" for v in args.values())
+        )
+        values = tuple(_to_bytes(v) if t == "address" else v for t, v in zip(schema.arg_types, args.values()))
+        extra = {k: v for k, v in event.items() if k not in FIELDS} or None
+        return cls(
+            schema, values, _to_bytes(event.get("address")), event.get("blockNumber"), _to_bytes(event.get("blockHash")),
+            _to_bytes(event.get("transactionHash")), event.get("transactionIndex"), event.get("logIndex"),
+            event.get("client_id"), event.get("detected_at"), event.get("seq"), bool(event.get("removed")), extra
+        )
+
+    @classmethod
+    def coerce(cls, event) -> "EventRecord":
+        return event if isinstance(event, EventRecord) else cls.from_dict(event)
+
+    def copy(self) -> "EventRecord":
+        return EventRecord(
+            self.schema, self.args, self.address, self.block_number, self.block_hash, self.transaction_hash,
+            self.transaction_index, self.log_index, self.client_id, self.detected_at, self.seq, self.removed,
+            dict(self.extra) if self.extra else None
+        )
+
+    # --- Cheap accessors ---
+    @property
+    def event(self) -> str:
+        return self.schema.name
+
+    @property
+    def address_key(self) -> Optional[str]:
+        """Lowercase '0x' address, as used for indexes and filters."""
+        return "0x" + self.address.hex() if self.address is not None else None
+
+    # --- Rendering ---
+    def render_args(self) -> dict:
+        schema = self.schema
+        return {name: _render(t, v) for name, t, v in zip(schema.arg_names, schema.arg_types, self.args)}
+
+    def __getitem__(self, key: str):
+        if key == "address":
+            return _checksum("0x" + self.address.hex()) if self.address is not None else None
+        if key == "event":
+            return self.schema.name
+        if key == "args":
+            return self.render_args()
+        if key == "logIndex":
+            return self.log_index
+        if key == "transactionIndex":
+            return self.transaction_index
+        if key == "transactionHash":
+            return to_hex(self.transaction_hash) if self.transaction_hash is not None else None
+        if key == "blockHash":
+            return to_hex(self.block_hash) if self.block_hash is not None else None
+        if key == "blockNumber":
+            return self.block_number
+        if key == "client_id":
+            return self.client_id
+        if key == "detected_at":
+            return self.detected_at
+        if key == "seq":
+            return self.seq
+        if key == "removed":
+            return self.removed
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def __contains__(self, key: str) -> bool:
+        return key in FIELDS or bool(self.extra and key in self.extra)
+
+    def to_dict(self) -> dict:
+        """JSON-safe dict: checksummed addresses, '0x' hex hashes and bytes, rendered args."""
+        result = {key: self[key] for key in FIELDS[:-1]}
+        for key in ("transactionIndex", "transactionHash", "blockHash", "logIndex"):
+            if result[key] is None:
+                del result[key] # Alerts have no single log behind them
+        if self.removed:
+            result["removed"] = True
+        if self.extra:
+            result.update(_json_safe(self.extra))
+        return result
+
+    def to_json(self) -> str:
+        """Same content as to_dict(), written directly for decoded logs (the common case)."""
+        if (self.extra or self.address is None or self.transaction_hash is None or self.block_hash is None
+                or self.log_index is None or self.transaction_index is None):
+            return _dumps(self.to_dict())
+        schema = self.schema
+        args = ",".join([key + _json_value(t, v) for key, t, v in zip(schema.json_keys, schema.arg_types, self.args)])
+        removed = ',"removed":true' if self.removed else ""
+        return (
+            f'{{"address":"{_checksum("0x" + self.address.hex())}","event":{schema.json_name},"args":{{{args}}},'
+            f'"logIndex":{self.log_index},"transactionIndex":{self.transaction_index},'
+            f'"transactionHash":"0x{self.transaction_hash.hex()}","blockHash":"0x{self.block_hash.hex()}",'
+            f'"blockNumber":{_json_scalar(self.block_number)},"client_id":{_json_scalar(self.client_id)},'
+            f'"detected_at":{_json_scalar(self.detected_at)},"seq":{_json_scalar(self.seq)}{removed}}}'
+        )
+
+    def __repr__(self) -> str:
+        return f"EventRecord({self.to_dict()!r})"
+
+    # --- Binary format ---
+    def to_bytes(self) -> bytes:
+        flags = ((_HAS_ADDRESS if self.address is not None else 0) | (_HAS_BLOCK_HASH if self.block_hash is not None else 0)
+                 | (_HAS_TX_HASH if self.transaction_hash is not None else 0) | (_REMOVED if self.removed else 0)
+                 | (_HAS_DETECTED_AT if self.detected_at is not None else 0))
+        out = bytearray(_HEADER.pack(
+            flags, self.address or _ZERO20, self.block_hash or _ZERO32, self.transaction_hash or _ZERO32,
+            -1 if self.block_number is None else self.block_number,
+            -1 if self.transaction_index is None else self.transaction_index,
+            -1 if self.log_index is None else self.log_index,
+            self.detected_at or 0.0, self.seq or 0,
+        ))
+        schema = self.schema
+        if schema.packed is None:
+            packed = bytearray()
+            for value in (schema.name, schema.arg_names, schema.arg_types):
+                _pack(value, packed)
+            schema.packed = bytes(packed)
+        out += schema.packed
+        for value in (self.args, self.client_id, self.extra):
+            _pack(value, out)
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "EventRecord":
+        (flags, address, block_hash, tx_hash, block_number, tx_index, log_index,
+         detected_at, seq) = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+        values = []
+        for _ in range(6):
+            value, offset = _unpack(data, offset)
+            values.append(value)
+        name, arg_names, arg_types, args, client_id, extra = values
+        return cls(
+            event_schema(name, arg_names, arg_types), tuple(args),
+            address if flags & _HAS_ADDRESS else None,
+            None if block_number < 0 else block_number,
+            block_hash if flags & _HAS_BLOCK_HASH else None,
+            tx_hash if flags & _HAS_TX_HASH else None,
+            None if tx_index < 0 else tx_index,
+            None if log_index < 0 else log_index,
+            client_id, detected_at if flags & _HAS_DETECTED_AT else None, seq or None,
+            bool(flags & _REMOVED), extra,
+        )
+
+    def __reduce__(self):
+        # Pickled (spill file, shard pipes) in the binary format rather than slot by slot
+        return EventRecord.from_bytes, (self.to_bytes(),)
+
+
+def records_json(records: Iterable[EventRecord]) -> str:
+    """A JSON array of records, without an intermediate list of dicts."""
+    return "[" + ",".join(record.to_json() for record in records) + "]"
+
+
+def json_default(value):
+    """json.dumps default= for messages that may embed records."""
+    if isinstance(value, EventRecord):
+        return value.to_dict()
+    return str(value)
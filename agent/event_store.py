@@ -0,0 +1,264 @@
+# event_store.py
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from agent.event_record import EventRecord, _to_bytes
+
+# Fields with a secondary index: value -> _Window of seqs (oldest first)
+INDEXED_FIELDS = ("address", "event", "client_id", "blockNumber")
+
+
+def _index_key(field, value):
+    return value.lower() if field == "address" and isinstance(value, str) else value
+
+
+def _entry_key(entry: EventRecord, field: str):
+    # Index keys straight from the record's raw fields, without rendering it
+    if field == "address":
+        return entry.address_key
+    if field == "event":
+        return entry.schema.name
+    if field == "client_id":
+        return entry.client_id
+    return entry.block_number
+
+
+def format_event(event: EventRecord) -> str:
+    """Human readable one-line rendering of a stored event, as printed by log_event."""
+    client_info = f" (Client: {event.client_id})" if event.client_id else ""
+    detected = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event.detected_at or time.time()))
+    return f"{detected} DETECTED: {event.event} on {event['address']} - Args: {event.render_args()} (Tx: {event['transactionHash']}){client_info}"
+
+
+class _Window:
+    """
+    Append-only sequence with O(1) popleft: a list and a start offset, the evicted
+    prefix cut off in bulk. Unlike a deque it indexes in O(1), so it can be bisected.
+    """
+    __slots__ = ("items", "start")
+
+    def __init__(self):
+        self.items = []
+        self.start = 0
+
+    def __len__(self):
+        return len(self.items) - self.start
+
+    def __getitem__(self, index: int):
+        return self.items[self.start + index]
+
+    def append(self, item) -> None:
+        self.items.append(item)
+
+    def popleft(self):
+        items = self.items
+        item = items[self.start]
+        items[self.start] = None # Not kept alive until the next cut
+        self.start += 1
+        if self.start >= 64 and self.start * 2 >= len(items):
+            del items[:self.start]
+            self.start = 0
+        return item
+
+    def bisect_left(self, value) -> int:
+        return bisect.bisect_left(self.items, value, self.start) - self.start
+
+    def bisect_right(self, value) -> int:
+        return bisect.bisect_right(self.items, value, self.start) - self.start
+
+    def forward(self, index: int = 0):
+        """Iterates oldest-first from `index`."""
+        return map(self.items.__getitem__, range(self.start + index, len(self.items)))
+
+    def backward(self, skip: int = 0):
+        """Iterates newest-first, skipping the `skip` newest."""
+        return map(self.items.__getitem__, range(len(self.items) - 1 - skip, self.start - 1, -1))
+
+
+class RecentEventStore:
+    """
+    Bounded ring buffer of decoded events (EventRecords) with secondary indexes.
+    Every event gets a monotonically increasing `seq`, used as the pagination cursor;
+    seqs restart in a new process, so cursors are only valid within one `epoch`.
+    Appends and evictions are O(1) per index; filtered queries bisect to the cursor
+    in the smallest matching index and walk only that, not the whole buffer.
+    """
+
+    def __init__(self, maxlen: int):
+        self.maxlen = maxlen
+        self.epoch = os.urandom(8).hex()
+        self._events = _Window()
+        self._first_seq = 1
+        self._next_seq = 1
+        self._indexes: Dict[str, Dict[object, _Window]] = {field: {} for field in INDEXED_FIELDS}
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[str, EventRecord], None]] = []
+
+    def __len__(self):
+        return len(self._events)
+
+    @property
+    def last_seq(self) -> int:
+        return self._next_seq - 1
+
+    @property
+    def first_seq(self) -> int:
+        """Oldest seq still held (events below it have been evicted)."""
+        return self._first_seq
+
+    def add_listener(self, callback: Callable[[str, EventRecord], None]) -> Callable[[], None]:
+        """
+        Registers callback(kind, entry), run after every append ("event") and reorg
+        flag ("removed"), on the writer's thread. Returns a function that removes it.
+        """
+        self._listeners.append(callback)
+        return lambda: self._listeners.remove(callback)
+
+    def _notify(self, kind: str, entry: EventRecord) -> None:
+        for callback in list(self._listeners):
+            try:
+                callback(kind, entry)
+            except Exception as e:
+                print(f"Warning: event store listener failed: {e}")
+
+    def append(self, event) -> int:
+        """Stores an EventRecord (or an event dict, converted) and returns its seq."""
+        entry = EventRecord.coerce(event)
+        if entry is event and entry.seq is not None:
+            entry = entry.copy() # Already held by another store
+        if entry.detected_at is None:
+            entry.detected_at = time.time()
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            entry.seq = seq
+            self._events.append(entry)
+            for field in INDEXED_FIELDS:
+                key = _entry_key(entry, field)
+                self._indexes[field].setdefault(key, _Window()).append(seq)
+            while len(self._events) > self.maxlen:
+                self._evict_oldest()
+        if self._listeners:
+            self._notify("event", entry)
+        return seq
+
+    def _evict_oldest(self):
+        evicted = self._events.popleft()
+        self._first_seq = evicted.seq + 1
+        for field in INDEXED_FIELDS:
+            key = _entry_key(evicted, field)
+            seqs = self._indexes[field][key]
+            seqs.popleft()  # seqs are appended in order, so the evicted one is always first
+            if not seqs:
+                del self._indexes[field][key]
+
+    def get(self, seq: int) -> Optional[EventRecord]:
+        with self._lock:
+            return self._get(seq)
+
+    def _get(self, seq: int) -> Optional[EventRecord]:
+        offset = seq - self._first_seq
+        if 0 <= offset < len(self._events):
+            return self._events[offset]
+        return None
+
+    def mark_removed(self, transaction_hash, log_index: int, block_number: int) -> int:
+        """Flags stored copies of a log dropped by a chain reorg. Returns how many were flagged."""
+        tx = _to_bytes(transaction_hash)
+        flagged = []
+        with self._lock:
+            for seq in self._indexes["blockNumber"].get(block_number, ()):
+                entry = self._get(seq)
+                if entry.log_index == log_index and entry.transaction_hash == tx:
+                    entry.removed = True
+                    flagged.append(entry)
+        for entry in flagged:
+            self._notify("removed", entry)
+        return len(flagged)
+
+    def after(
+        self,
+        cursor: int,
+        address: Optional[str] = None,
+        event: Optional[str] = None,
+        client_id: Optional[str] = None,
+        limit: int = 1000,
+    ) -> List[EventRecord]:
+        """Oldest-first events with seq > `cursor`, for resuming a stream from the last seen event."""
+        equality = {"address": address, "event": event, "client_id": client_id}
+        equality = {f: _index_key(f, v) for f, v in equality.items() if v is not None}
+        with self._lock:
+            if equality:
+                candidates = [self._indexes[field].get(key) for field, key in equality.items()]
+                if not all(candidates):
+                    return []
+                seqs = min(candidates, key=len)
+                entries = map(self._get, seqs.forward(seqs.bisect_right(cursor)))
+            else:
+                entries = self._events.forward(max(0, cursor + 1 - self._first_seq))
+            results = []
+            for entry in entries:
+                if any(_entry_key(entry, f) != key for f, key in equality.items()):
+                    continue
+                results.append(entry)
+                if len(results) == limit:
+                    break
+            return results
+
+    def tail(self, count: int) -> List[EventRecord]:
+        with self._lock:
+            return list(self._events.forward(max(0, len(self._events) - count)))
+
+    def query(
+        self,
+        address: Optional[str] = None,
+        event: Optional[str] = None,
+        client_id: Optional[str] = None,
+        block_number: Optional[int] = None,
+        from_block: Optional[int] = None,
+        to_block: Optional[int] = None,
+        cursor: Optional[int] = None,
+        limit: int = 100,
+    ) -> Tuple[List[EventRecord], Optional[int]]:
+        """
+        Newest-first filtered page. `cursor` is the seq to continue below (exclusive),
+        as returned in the previous page's next_cursor. next_cursor is None on the last page.
+        """
+        equality = {"address": address, "event": event, "client_id": client_id, "blockNumber": block_number}
+        equality = {f: _index_key(f, v) for f, v in equality.items() if v is not None}
+        with self._lock:
+            if equality:
+                candidates = []
+                for field, key in equality.items():
+                    seqs = self._indexes[field].get(key)
+                    if not seqs:
+                        return [], None
+                    candidates.append(seqs)
+                seqs = min(candidates, key=len)
+            else:
+                seqs = None
+
+            # Jump straight to the cursor instead of scanning the newer entries
+            if seqs is None:
+                skip = 0 if cursor is None else max(0, self._next_seq - cursor)
+                entries = self._events.backward(skip)
+            else:
+                skip = 0 if cursor is None else len(seqs) - seqs.bisect_left(cursor)
+                entries = map(self._get, seqs.backward(skip))
+
+            results = []
+            next_cursor = None
+            for entry in entries:
+                if any(_entry_key(entry, f) != key for f, key in equality.items()):
+                    continue
+                block = entry.block_number
+                if (from_block is not None and block < from_block) or (to_block is not None and block > to_block):
+                    continue
+                if len(results) == limit:
+                    next_cursor = results[-1].seq
+                    break
+                results.append(entry)
+            return results, next_cursor
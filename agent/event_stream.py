@@ -0,0 +1,125 @@
+# event_stream.py
+import asyncio
+from typing import AsyncIterator, Optional, Set, Tuple
+
+from agent.event_store import RecentEventStore, _entry_key, _index_key
+
+_OVERFLOW = ("overflow", None)
+
+
+class _Subscriber:
+    __slots__ = ("filters", "queue", "overflowed")
+
+    def __init__(self, filters: dict, buffer_size: int):
+        self.filters = filters
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size + 1) # +1 keeps room for the overflow marker
+        self.overflowed = False
+
+    def matches(self, entry) -> bool:
+        return all(_entry_key(entry, field) == key for field, key in self.filters.items())
+
+
+class EventBroadcaster:
+    """
+    Pushes RECENT_EVENTS appends to streaming subscribers (SSE clients).
+    Writers call in from any thread; matching and queueing happen on the server's
+    event loop with one hop per event, not per subscriber. Every subscriber has a
+    bounded buffer: a consumer that falls `buffer_size` events behind is cut off
+    and resumes from its last seq on reconnect, so it can never grow memory.
+    """
+
+    def __init__(self, store: RecentEventStore, buffer_size: int = 1000):
+        self.store = store
+        self.buffer_size = buffer_size
+        self._subscribers: Set[_Subscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._remove_listener = None
+        self.published = 0
+        self.overflowed = 0
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        if self._remove_listener is None:
+            self._remove_listener = self.store.add_listener(self._publish)
+
+    def detach(self) -> None:
+        if self._remove_listener is not None:
+            self._remove_listener()
+            self._remove_listener = None
+        self._loop = None
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def _publish(self, kind: str, entry: dict) -> None:
+        loop = self._loop
+        if loop is None or not self._subscribers:
+            return
+        try:
+            loop.call_soon_threadsafe(self._fan_out, kind, entry)
+        except RuntimeError: # Loop closed during shutdown
+            pass
+
+    def _fan_out(self, kind: str, entry: dict) -> None:
+        self.published += 1
+        for subscriber in self._subscribers:
+            if subscriber.overflowed or not subscriber.matches(entry):
+                continue
+            if subscriber.queue.qsize() >= self.buffer_size:
+                subscriber.overflowed = True
+                self.overflowed += 1
+                subscriber.queue.put_nowait(_OVERFLOW)
+                continue
+            subscriber.queue.put_nowait((kind, entry))
+
+    async def stream(self, address: Optional[str] = None, event: Optional[str] = None,
+                     client_id: Optional[str] = None, cursor: Optional[int] = None,
+                     keepalive: float = 15.0) -> AsyncIterator[Tuple[str, Optional[dict]]]:
+        """
+        Yields (kind, entry) for matching events: first everything after `cursor`
+        still held by the store, then live events as they are appended. kind is
+        "event", "removed", "gap" (events after `cursor` were already evicted),
+        "keepalive" (entry None, every `keepalive` idle seconds) or "overflow"
+        (the subscriber fell behind; the stream ends and the client should reconnect).
+        """
+        filters = {"address": address, "event": event, "client_id": client_id}
+        filters = {f: _index_key(f, v) for f, v in filters.items() if v is not None}
+        subscriber = _Subscriber(filters, self.buffer_size)
+        # Subscribe before reading the backlog so nothing appended in between is missed
+        self._subscribers.add(subscriber)
+        try:
+            last_seq = self.store.last_seq if cursor is None else cursor
+            if cursor is not None:
+                if cursor + 1 < self.store.first_seq:
+                    yield "gap", {"cursor": cursor, "first_seq": self.store.first_seq}
+                while True:
+                    backlog = self.store.after(last_seq, address=address, event=event, client_id=client_id, limit=500)
+                    if not backlog:
+                        break
+                    for entry in backlog:
+                        yield "event", entry
+                    last_seq = backlog[-1].seq
+            while True:
+                try:
+                    kind, entry = await asyncio.wait_for(subscriber.queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield "keepalive", None
+                    continue
+                if kind == "overflow":
+                    yield kind, None
+                    return
+                if kind == "event":
+                    if entry.seq <= last_seq:
+                        continue # Already sent from the backlog
+                    last_seq = entry.seq
+                yield kind, entry
+        finally:
+            self._subscribers.discard(subscriber)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "overflowed": self.overflowed,
+            "buffered": sum(s.queue.qsize() for s in self._subscribers),
+        }
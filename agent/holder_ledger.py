@@ -0,0 +1,454 @@
+# holder_ledger.py
+"""
+Per-token holder balances built incrementally from ERC20 Transfer events, for
+airdrop snapshots and eligibility checks (the listener's "track_holders" action).
+
+Every token has a directory under LEDGER_DIR:
+
+    addresses.txt             one address per line; the line number is its row
+    transfers.bin             append-only fixed-size records (block, sender row, recipient row, amount)
+    checkpoints/<block>.npz   balances of every row as of <block>, every LEDGER_CHECKPOINT_BLOCKS blocks
+
+Balances are kept in memory as four 32-bit limbs per row in int64 arrays (4 x rows),
+so 128-bit token amounts stay exact while eligibility queries (threshold, top holders,
+activity within a block window) are NumPy scans over all rows. Balances at an earlier
+block start from the newest checkpoint at or below it and add the transfers after it.
+Files are only appended to, under a file lock, so other processes (api_server, the REPL,
+other listener shards) read the same ledger by picking up the new tail.
+
+Balances are exact when the token's history was backfilled from its deployment block;
+otherwise they are net flows since tracking began and may be negative (such rows are
+never reported as holders). Transfers retracted by a chain reorg are not reversed.
+
+Usage:
+    python -m agent.holder_ledger 0xToken --min-balance 1000000000000000000 [--block N] [--csv out.csv]
+"""
+import argparse
+import asyncio
+import csv
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from agent import metrics
+from agent.config import LEDGER_DIR, LEDGER_FLUSH_INTERVAL, LEDGER_CHECKPOINT_BLOCKS, LEDGER_CHECKPOINTS_KEPT
+from agent.tools.utils import file_lock
+
+ZERO_ADDRESS = "0x" + "0" * 40 # Mints come from it and burns go to it; never reported as a holder
+LIMB_BITS = 32
+LIMB_MASK = (1 << LIMB_BITS) - 1
+MAX_AMOUNT = 1 << 128 # Larger transfer amounts are skipped (they do not fit the record)
+CHECKPOINT_LAG = 64 # Blocks a checkpoint trails the newest transfer, so actions finishing out of order are included
+_BINCOUNT_CHUNK = 1 << 20 # Records summed per float64 bincount: 2^20 * 2^32 stays below 2^53, so sums are exact
+RECORD = np.dtype([("block", "<i8"), ("sender", "<u4"), ("recipient", "<u4"), ("amount", "<u4", (4,))])
+
+TRANSFERS_WRITTEN = metrics.counter("ledger_transfers_written_total", "Transfers appended to holder ledgers")
+FLUSH_SECONDS = metrics.histogram("ledger_flush_seconds", "Time to append one batch of transfers to a holder ledger")
+
+
+# --- 128-bit amounts as 32-bit limbs ---
+def _limbs(value: int) -> List[int]:
+    # Limbs 0-2 are unsigned 32-bit; limb 3 keeps the sign and the remaining high bits
+    return [(value >> (LIMB_BITS * k)) & LIMB_MASK for k in range(3)] + [value >> (LIMB_BITS * 3)]
+
+def _to_int(balances: np.ndarray, row: int) -> int:
+    return sum(int(balances[k, row]) << (LIMB_BITS * k) for k in range(4))
+
+def _normalize(balances: np.ndarray) -> np.ndarray:
+    for k in range(3):
+        carry = balances[k] >> LIMB_BITS # Arithmetic shift: negative limbs borrow from the next one
+        balances[k] -= carry << LIMB_BITS
+        balances[k + 1] += carry
+    return balances
+
+def _apply(balances: np.ndarray, records: np.ndarray) -> np.ndarray:
+    """Adds `records` to `balances` (4 x rows) in place, vectorized per limb."""
+    rows = balances.shape[1]
+    for start in range(0, len(records), _BINCOUNT_CHUNK):
+        chunk = records[start:start + _BINCOUNT_CHUNK]
+        for k in range(4):
+            weights = chunk["amount"][:, k].astype(np.float64)
+            balances[k] += np.bincount(chunk["recipient"], weights, minlength=rows).astype(np.int64)
+            balances[k] -= np.bincount(chunk["sender"], weights, minlength=rows).astype(np.int64)
+        _normalize(balances)
+    return balances
+
+def _at_least(balances: np.ndarray, threshold: int) -> np.ndarray:
+    """Row mask of balances >= threshold, compared limb by limb from the top."""
+    t = _limbs(threshold)
+    if t[3] > np.iinfo(np.int64).max:
+        return np.zeros(balances.shape[1], dtype=bool)
+    if t[3] < np.iinfo(np.int64).min:
+        return np.ones(balances.shape[1], dtype=bool)
+    mask = balances[0] >= t[0]
+    for k in (1, 2, 3):
+        mask = (balances[k] > t[k]) | ((balances[k] == t[k]) & mask)
+    return mask
+
+
+class TokenLedger:
+    """
+    Holder balances of one token, backed by an append-only directory.
+    record() only buffers; flush() appends the buffered transfers under the file
+    lock; refresh() applies whatever was appended since the last read, by this or
+    any other process. Queries refresh first.
+    """
+
+    def __init__(self, path: str, checkpoint_blocks: int = 1800, checkpoints_kept: int = 24):
+        self.path = path
+        self.checkpoint_blocks = checkpoint_blocks
+        self.checkpoints_kept = checkpoints_kept
+        self.addresses_path = os.path.join(path, "addresses.txt")
+        self.transfers_path = os.path.join(path, "transfers.bin")
+        self.checkpoint_dir = os.path.join(path, "checkpoints")
+        self._addresses: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._address_offset = 0 # Bytes of addresses.txt already read
+        self._records: List[np.ndarray] = [] # Transfers read so far, in file order
+        self._record_count = 0
+        self._state = np.zeros((4, 1024), dtype=np.int64) # Live balances; columns past len(_addresses) are spare capacity
+        self._pending: List[tuple] = []
+        self._pending_lock = threading.Lock()
+        self._lock = threading.RLock()
+        self.head_block = -1
+        self.skipped = 0
+
+    # --- Writing ---
+    def record(self, block: int, sender: str, recipient: str, amount: int) -> bool:
+        """Buffers one transfer (amount in raw token units). Returns False if it cannot be represented."""
+        if not 0 <= amount < MAX_AMOUNT:
+            self.skipped += 1
+            return False
+        with self._pending_lock:
+            self._pending.append((block, sender.lower(), recipient.lower(), amount))
+        return True
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def flush(self) -> int:
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        started = time.perf_counter()
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock, file_lock(self.transfers_path):
+            self._repair()
+            self.refresh() # Rows appended by another process must not be handed out again
+            new_rows: Dict[str, int] = {}
+
+            def row_of(address):
+                row = self._rows.get(address)
+                return row if row is not None else new_rows.setdefault(address, len(self._addresses) + len(new_rows))
+
+            records = np.zeros(len(pending), dtype=RECORD)
+            records["block"] = [block for block, _, _, _ in pending]
+            records["sender"] = [row_of(sender) for _, sender, _, _ in pending]
+            records["recipient"] = [row_of(recipient) for _, _, recipient, _ in pending]
+            amounts = b"".join(amount.to_bytes(16, "little") for _, _, _, amount in pending)
+            records["amount"] = np.frombuffer(amounts, dtype="<u4").reshape(-1, 4)
+            # Addresses first: a reader that sees a record always knows its rows
+            if new_rows:
+                with open(self.addresses_path, "a") as f:
+                    f.write("".join(address + "\n" for address in new_rows))
+            with open(self.transfers_path, "ab") as f:
+                records.tofile(f)
+            self.refresh()
+            self._update_checkpoints(int(records["block"].min()))
+        FLUSH_SECONDS.observe(time.perf_counter() - started)
+        TRANSFERS_WRITTEN.inc(len(pending))
+        return len(pending)
+
+    def _repair(self) -> None:
+        # A writer that crashed mid-append leaves a partial line/record; cut it off before appending
+        for path, unit in ((self.addresses_path, None), (self.transfers_path, RECORD.itemsize)):
+            if not os.path.exists(path):
+                continue
+            size = os.path.getsize(path)
+            if unit is not None:
+                keep = size - size % unit
+            else:
+                with open(path, "rb") as f:
+                    f.seek(max(0, size - 256))
+                    tail = f.read()
+                keep = size - (len(tail) - tail.rfind(b"\n") - 1) if size else 0
+            if keep != size:
+                print(f"Holder ledger: truncating incomplete tail of {path} ({size - keep} byte(s)).")
+                os.truncate(path, keep)
+
+    def _update_checkpoints(self, earliest_block: int) -> None:
+        existing = self._checkpoint_blocks()
+        # Transfers at or below a checkpoint's block (e.g. a backfill behind live events) make it stale
+        for block in [b for b in existing if b >= earliest_block]:
+            self._remove_checkpoint(block)
+        existing = [b for b in existing if b < earliest_block]
+        due = (self.head_block - CHECKPOINT_LAG) // self.checkpoint_blocks * self.checkpoint_blocks
+        if due <= 0 or (existing and due <= existing[-1]):
+            return
+        balances = self.balances(due)
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        tmp_path = os.path.join(self.checkpoint_dir, f".{due}.npz.tmp")
+        with open(tmp_path, "wb") as f:
+            # Limbs 0-2 fit 32 bits once normalized; the top limb is mostly zero and compresses away
+            np.savez_compressed(f, low=balances[:3].astype(np.uint32), high=balances[3])
+        os.replace(tmp_path, os.path.join(self.checkpoint_dir, f"{due}.npz"))
+        for block in (existing + [due])[:-self.checkpoints_kept]:
+            self._remove_checkpoint(block)
+
+    def _remove_checkpoint(self, block: int) -> None:
+        try:
+            os.remove(os.path.join(self.checkpoint_dir, f"{block}.npz"))
+        except FileNotFoundError:
+            pass
+
+    # --- Reading ---
+    def refresh(self) -> int:
+        """Applies addresses and transfers appended since the last read. Returns the number of new transfers."""
+        with self._lock:
+            try:
+                size = os.path.getsize(self.transfers_path)
+            except FileNotFoundError:
+                return 0
+            # Addresses are read after sizing the transfers, so every row those transfers use is known
+            self._read_addresses()
+            count = size // RECORD.itemsize - self._record_count
+            if count <= 0:
+                return 0
+            new = np.fromfile(self.transfers_path, dtype=RECORD, count=count, offset=self._record_count * RECORD.itemsize)
+            self._records.append(new)
+            self._record_count += len(new)
+            _apply(self._live(), new)
+            self.head_block = max(self.head_block, int(new["block"].max()))
+            return len(new)
+
+    def _read_addresses(self) -> None:
+        try:
+            with open(self.addresses_path, "rb") as f:
+                f.seek(self._address_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1 # A line still being written is read next time
+        for address in data[:end].decode().splitlines():
+            self._rows[address] = len(self._addresses)
+            self._addresses.append(address)
+        self._address_offset += end
+        if len(self._addresses) > self._state.shape[1]:
+            state = np.zeros((4, max(len(self._addresses), 2 * self._state.shape[1])), dtype=np.int64)
+            state[:, :self._state.shape[1]] = self._state
+            self._state = state
+
+    def _live(self) -> np.ndarray:
+        return self._state[:, :len(self._addresses)]
+
+    def _all_records(self) -> np.ndarray:
+        if len(self._records) != 1:
+            self._records = [np.concatenate(self._records) if self._records else np.zeros(0, dtype=RECORD)]
+        return self._records[0]
+
+    def _checkpoint_blocks(self) -> List[int]:
+        try:
+            names = os.listdir(self.checkpoint_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-4]) for name in names if name.endswith(".npz") and name[:-4].isdigit())
+
+    def _load_checkpoint(self, block: int, rows: int) -> Tuple[int, np.ndarray]:
+        balances = np.zeros((4, rows), dtype=np.int64)
+        for checkpoint in reversed(self._checkpoint_blocks()):
+            if checkpoint > block:
+                continue
+            try:
+                with np.load(os.path.join(self.checkpoint_dir, f"{checkpoint}.npz")) as saved:
+                    low, high = saved["low"], saved["high"]
+            except (OSError, ValueError, KeyError):
+                continue # Removed or replaced while we looked: try an older one
+            width = min(rows, len(high))
+            balances[:3, :width] = low[:, :width]
+            balances[3, :width] = high[:width]
+            return checkpoint, balances
+        return -1, balances
+
+    def balances(self, block: Optional[int] = None) -> np.ndarray:
+        """Balances of every row after `block` (default: latest) as a 4 x rows limb array."""
+        with self._lock:
+            if block is None or block >= self.head_block:
+                return self._live().copy()
+            start, balances = self._load_checkpoint(block, len(self._addresses))
+            records = self._all_records()
+            blocks = records["block"]
+            return _apply(balances, records[(blocks > start) & (blocks <= block)])
+
+    def _active(self, from_block: Optional[int], to_block: Optional[int]) -> np.ndarray:
+        records = self._all_records()
+        window = np.ones(len(records), dtype=bool)
+        if from_block is not None:
+            window &= records["block"] >= from_block
+        if to_block is not None:
+            window &= records["block"] <= to_block
+        active = np.zeros(len(self._addresses), dtype=bool)
+        active[records["sender"][window]] = True
+        active[records["recipient"][window]] = True
+        return active
+
+    def holders(self, min_balance: int = 1, block: Optional[int] = None, held_since: Optional[int] = None,
+                active_from: Optional[int] = None, active_to: Optional[int] = None,
+                limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """
+        (address, balance) of holders with at least `min_balance` raw units at `block`
+        (default: latest), largest first. `held_since`: they also held min_balance at
+        that block. `active_from`/`active_to`: they sent or received within that window.
+        """
+        min_balance = max(1, min_balance)
+        with self._lock:
+            self.refresh()
+            balances = self.balances(block)
+            eligible = _at_least(balances, min_balance)
+            zero_row = self._rows.get(ZERO_ADDRESS)
+            if zero_row is not None:
+                eligible[zero_row] = False
+            if held_since is not None:
+                eligible &= _at_least(self.balances(held_since), min_balance)
+            if active_from is not None or active_to is not None:
+                eligible &= self._active(active_from, active_to)
+            rows = np.flatnonzero(eligible)
+            order = np.lexsort(tuple(balances[k, rows] for k in range(4)))[::-1] # Last key (top limb) sorts first
+            rows = rows[order[:limit] if limit is not None else order]
+            return [(self._addresses[row], _to_int(balances, row)) for row in rows]
+
+    def top_holders(self, n: int = 20, block: Optional[int] = None) -> List[Tuple[str, int]]:
+        return self.holders(1, block=block, limit=n)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self.refresh()
+            return {
+                "addresses": len(self._addresses),
+                "transfers": self._record_count,
+                "head_block": self.head_block if self.head_block >= 0 else None,
+                "checkpoints": self._checkpoint_blocks(),
+                "pending": self.pending,
+                "skipped": self.skipped,
+            }
+
+
+class HolderLedgers:
+    """
+    A TokenLedger per token address under `directory`, opened on first use.
+    Transfers recorded from action threads are written in batches by run().
+    """
+
+    def __init__(self, directory: str, flush_interval: float = 1.0, flush_size: int = 5000,
+                 checkpoint_blocks: int = 1800, checkpoints_kept: int = 24):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.checkpoint_blocks = checkpoint_blocks
+        self.checkpoints_kept = checkpoints_kept
+        self._ledgers: Dict[str, TokenLedger] = {}
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def ledger(self, token: str) -> TokenLedger:
+        token = token.lower()
+        ledger = self._ledgers.get(token)
+        if ledger is None:
+            with self._lock:
+                ledger = self._ledgers.get(token)
+                if ledger is None:
+                    ledger = self._ledgers[token] = TokenLedger(
+                        os.path.join(self.directory, token), self.checkpoint_blocks, self.checkpoints_kept
+                    )
+        return ledger
+
+    def tokens(self) -> List[str]:
+        """Tokens with a ledger on disk (written by any process)."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if name.startswith("0x") and len(name) == 42)
+
+    def record_transfer(self, token: str, block: int, sender: str, recipient: str, amount: int) -> None:
+        if not self.ledger(token).record(block, sender, recipient, amount):
+            print(f"Holder ledger: skipped a transfer of {amount} on {token} (outside 0..2^128).")
+            return
+        self._pending += 1
+        if self._pending >= self.flush_size and self._flush_requested is not None:
+            # Called from action threads, so wake the loop safely
+            self._loop.call_soon_threadsafe(self._flush_requested.set)
+
+    def flush(self) -> int:
+        self._pending = 0
+        written = 0
+        for ledger in list(self._ledgers.values()):
+            try:
+                written += ledger.flush()
+            except Exception as e:
+                print(f"Error writing holder ledger {ledger.path}: {e}")
+        return written
+
+    async def run(self) -> None:
+        """Background writer loop; flushes what is pending when cancelled."""
+        self._loop = asyncio.get_running_loop()
+        self._flush_requested = asyncio.Event()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_requested.clear()
+                await asyncio.to_thread(self.flush)
+        finally:
+            self._flush_requested = None
+            self.flush()
+
+
+HOLDER_LEDGERS = HolderLedgers(
+    LEDGER_DIR,
+    flush_interval=LEDGER_FLUSH_INTERVAL,
+    checkpoint_blocks=LEDGER_CHECKPOINT_BLOCKS,
+    checkpoints_kept=LEDGER_CHECKPOINTS_KEPT
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Airdrop recipient list from a token's holder ledger.")
+    parser.add_argument("token", help="Token contract address")
+    parser.add_argument("--min-balance", type=int, default=1, help="Raw token units (e.g. 10**18 for 1 token with 18 decimals)")
+    parser.add_argument("--block", type=int, default=None, help="Snapshot block (default: latest)")
+    parser.add_argument("--held-since", type=int, default=None, help="Also require min-balance at this block")
+    parser.add_argument("--active-from", type=int, default=None, help="Require a transfer at or after this block")
+    parser.add_argument("--active-to", type=int, default=None, help="Require a transfer at or before this block")
+    parser.add_argument("--csv", default=None, help="Write address,balance rows here instead of printing a summary")
+    args = parser.parse_args()
+
+    ledger = HOLDER_LEDGERS.ledger(args.token)
+    started = time.perf_counter()
+    holders = ledger.holders(args.min_balance, block=args.block, held_since=args.held_since,
+                             active_from=args.active_from, active_to=args.active_to)
+    elapsed = time.perf_counter() - started
+    stats = ledger.stats()
+    print(f"{len(holders)} holder(s) of {args.token} out of {stats['addresses']} address(es), "
+          f"{stats['transfers']} transfer(s) up to block {stats['head_block']} ({elapsed:.2f}s).")
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["address", "balance"])
+            writer.writerows(holders)
+        print(f"Wrote {args.csv}.")
+    else:
+        for address, balance in holders[:20]:
+            print(f"  {address} {balance}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,70 @@
 # main.py
-from agent.tools.base_tools import get_base_native_balance
-from agent.tools.x_tools import get_latest_tweets_from_user  # Import only if used
-# from agent.tools.coinbase_tools import ... # Import only if used
-from agent.agent.setup import create_agent_executor
-from agent.config import BASESCAN_API_KEY, x_client  # Check if keys/clients are available
 import threading
 
-from agent.tools.monitoring_tools import (
-    add_contract_tracking_target,
-    list_tracked_targets,
-    get_recent_tracked_events
+from agent.config import (
+    BASESCAN_API_KEY, X_BEARER_TOKEN, RPC_URLS, LISTENER_SHARDS, LISTENER_CONTRACTS_PER_SHARD,
+    START_LISTENER, EVENT_BUS_PATH, X_ACCOUNTS
 )
-from agent.background_listener import run_listener  # Import the listener function
-from agent.config import BASE_WSS_URL
+from agent.tools.registry import MONITORING_TOOLS, load_tools
+# The LLM stack, web3 and API clients are imported inside run(), only for what this run uses
 
 def run():
     print("Initializing agent and listener...")
     listener_thread = None
-    active_tools = []
+    supervisor = None
+    bus_client = None
+    x_stop = None
+    tool_names = []
     
-    if BASE_WSS_URL:
+    if not START_LISTENER and EVENT_BUS_PATH:
+        # The listener runs as its own process (python -m agent.background_listener / agent.sharding):
+        # tools write to the shared contract store and read events mirrored over the event bus
+        from agent.background_listener import RECENT_EVENTS
+        from agent.event_bus import EventBusClient
+        print("Attaching to the background listener over the event bus...")
+        tool_names.extend(MONITORING_TOOLS)
+        bus_client = EventBusClient(EVENT_BUS_PATH, RECENT_EVENTS)
+        bus_client.start()
+    elif any(url.startswith("ws") for url in RPC_URLS):
         print("Base WSS URL found. Adding monitoring control tools...")
-        active_tools.append(add_contract_tracking_target)
-        active_tools.append(list_tracked_targets)
-        active_tools.append(get_recent_tracked_events)
-        # --- Start Background Listener (Simple Threading Example) ---
-        print("Starting background listener thread...")
-        listener_thread = threading.Thread(target=run_listener, daemon=True) # daemon=True allows main to exit
-        listener_thread.start()
-        print("Listener thread started.")
-        # --- NOTE: Robust apps use multiprocessing or task queues ---
+        tool_names.extend(MONITORING_TOOLS)
+        if LISTENER_SHARDS > 1 or LISTENER_CONTRACTS_PER_SHARD > 0:
+            # --- Sharded listener: contracts partitioned across worker processes ---
+            from agent.sharding import ShardSupervisor
+            print("Starting sharded background listener...")
+            supervisor = ShardSupervisor()
+            supervisor.start()
+        else:
+            # --- Start Background Listener (Simple Threading Example) ---
+            from agent.background_listener import run_listener
+            print("Starting background listener thread...")
+            listener_thread = threading.Thread(target=run_listener, daemon=True) # daemon=True allows main to exit
+            listener_thread.start()
+            print("Listener thread started.")
     else:
-        print("Warning: BASE_WSS_URL not found. Monitoring tools/listener disabled.")
+        print("Warning: no WebSocket RPC endpoint (BASE_WSS_URL / RPC_URLS). Monitoring tools/listener disabled.")
     
     if BASESCAN_API_KEY:
-        active_tools.append(get_base_native_balance)
+        tool_names.append("get_base_native_balance")
+        tool_names.append("get_base_native_balances")
         # Add other base tools if defined and key available
-    if x_client: # Check if client initialized successfully
-        active_tools.append(get_latest_tweets_from_user)
-        # Add other X tools if defined and client available
+    if X_BEARER_TOKEN: # The X client itself is created on the tool's first call
+        tool_names.append("get_latest_tweets_from_user")
+        # Add other X tools if defined and token available
+        if X_ACCOUNTS:
+            # Keeps the tweet cache warm so the tool rarely has to poll on a call
+            from agent.tools.x_ingest import X_INGESTOR
+            x_stop = threading.Event()
+            threading.Thread(target=X_INGESTOR.run, args=(X_ACCOUNTS, x_stop), daemon=True).start()
     # Add Coinbase tools similarly if client available
 
-    if not active_tools:
+    if not tool_names:
         print("Error: No tools could be initialized. Agent cannot run.")
         return
 
+    from agent.agent.setup import create_agent_executor
     try:
-        agent_executor = create_agent_executor(active_tools)
+        agent_executor = create_agent_executor(load_tools(tool_names))
     except ValueError as e:
         print(f"Error setting up agent: {e}")
         return
@@ -74,6 +92,14 @@ def run():
             print(f"An error occurred during interaction: {e}")
             # Optionally break or continue loop on error
 
+    if supervisor is not None:
+        print("Stopping listener shards...")
+        supervisor.stop()
+    if bus_client is not None:
+        bus_client.stop()
+    if x_stop is not None:
+        x_stop.set()
+
 if __name__ == "__main__":
     run()
 
@@ -0,0 +1,239 @@
+# metrics.py
+"""
+Lightweight in-process metrics, exposed in the Prometheus text format by
+api_server at /metrics (no client library needed).
+
+Metrics are module-level objects declared next to the code they measure:
+
+    LOGS = metrics.counter("listener_logs_received_total", "Logs received", ["contract"])
+    LOGS.labels(address).inc()
+    DECODE = metrics.histogram("listener_decode_seconds", "Decode time")
+    DECODE.observe(elapsed)
+
+Recording is a dict lookup plus a locked add (well under a microsecond), so the
+listener keeps them on in production. Gauges can read a callback at scrape time
+instead of being updated on the hot path. Other processes (listener shards) ship
+snapshot() to the process that serves /metrics, which renders them with an extra
+label (e.g. shard="1").
+"""
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds: 100us .. 10s, for per-log and per-action work
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Seconds: end-to-end lag from block time (1s resolution) to dispatch
+LAG_BUCKETS = (0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 15.0, 30.0, 60.0, 120.0, 300.0, 900.0)
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self, lock: threading.Lock):
+        self.value = 0.0
+        self._lock = lock
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds: Sequence[float], lock: threading.Lock):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = lock
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        return _Value(self._lock)
+
+    def labels(self, *values) -> object:
+        """The series for these label values (in `labelnames` order), created on first use."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self) -> Dict[tuple, object]:
+        return {tuple(str(v) for v in values): self._sample(child) for values, child in list(self._children.items())}
+
+    def _sample(self, child):
+        return child.value
+
+    def snapshot(self) -> dict:
+        return {"name": self.name, "kind": self.kind, "help": self.help,
+                "labelnames": self.labelnames, "samples": self._samples()}
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labelnames)
+        self._fn = fn
+
+    def set_function(self, fn: Optional[Callable[[], float]]) -> None:
+        """Reads the value from `fn()` at scrape time (unlabelled gauges only)."""
+        self._fn = fn
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def _samples(self) -> Dict[tuple, object]:
+        if self._fn is None:
+            return super()._samples()
+        try:
+            return {(): float(self._fn())}
+        except Exception:
+            return {}
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _Buckets(self.buckets, self._lock)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _sample(self, child):
+        return (list(child.counts), child.sum, child.count)
+
+    def snapshot(self) -> dict:
+        return dict(super().snapshot(), buckets=self.buckets)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} already registered with a different type or labels")
+                return existing # Module re-imported: keep counting into the same metric
+            self._metrics[metric.name] = metric
+            return metric
+
+    def snapshot(self) -> List[dict]:
+        """Picklable copy of every metric, for shipping to the process that serves /metrics."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return [metric.snapshot() for metric in metrics]
+
+    def render(self, remote: Iterable[Tuple[Dict[str, str], List[dict]]] = ()) -> str:
+        """
+        Prometheus text exposition of this registry, plus `remote` snapshots,
+        each rendered with its extra labels (e.g. ({"shard": "1"}, snapshot)).
+        """
+        families: Dict[str, list] = {}
+        for extra, snapshot in [({}, self.snapshot())] + list(remote):
+            for family in snapshot:
+                families.setdefault(family["name"], []).append((extra, family))
+        lines = []
+        for name, parts in families.items():
+            first = parts[0][1]
+            lines.append(f"# HELP {name} {_escape_help(first['help'])}")
+            lines.append(f"# TYPE {name} {first['kind']}")
+            for extra, family in parts:
+                for values, sample in family["samples"].items():
+                    labels = list(zip(family["labelnames"], values)) + list(extra.items())
+                    if family["kind"] == "histogram":
+                        counts, total, count = sample
+                        cumulative = 0
+                        for bound, bucket_count in zip(list(family["buckets"]) + [math.inf], counts):
+                            cumulative += bucket_count
+                            lines.append(f"{name}_bucket{_labels(labels + [('le', _number(bound))])} {cumulative}")
+                        lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+                        lines.append(f"{name}_count{_labels(labels)} {count}")
+                    else:
+                        lines.append(f"{name}{_labels(labels)} {_number(sample)}")
+        return "\n".join(lines) + "\n"
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _labels(pairs: List[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    escaped = (k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def gauge(name: str, help: str, labelnames: Sequence[str] = (), fn: Optional[Callable[[], float]] = None) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames, fn))
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
@@ -0,0 +1,377 @@
+# rpc_pool.py
+"""
+Pool of Base JSON-RPC endpoints (WebSocket and HTTP) with health scoring and failover.
+
+Every endpoint in RPC_URLS is scored from its smoothed latency, recent error
+rate and requests in flight. It counts as stale from a failure until a request
+to it succeeds again, and while its head trails the best head by more than
+RPC_MAX_LAG_BLOCKS. eth_blockNumber probes every RPC_PROBE_INTERVAL seconds
+refresh the heads and bring failed endpoints back, backing off (up to
+RPC_COOLDOWN_MAX) while they keep failing.
+
+- Reads go through pooled_web3(), an AsyncWeb3 on a pooled provider, so
+  callers keep using w3.eth.*. A request goes to the best endpoint that has the blocks it asks
+  for; if it takes longer than that method usually does, it is hedged to the
+  runner-up and the first answer wins. Connection errors, timeouts and rate
+  limits move it on to the next endpoint; ordinary JSON-RPC errors (reverts,
+  "range too large") come back to the caller as they are.
+- Subscriptions live on one socket: the listener connects it to
+  best_websocket() and reconnects elsewhere once that endpoint goes stale. The
+  checkpoints and reorg rewind replay whatever the old endpoint had not delivered.
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from agent import metrics
+from agent.config import (
+    BLOCK_TIME, RPC_URLS, RPC_REQUEST_TIMEOUT, RPC_HEDGE_MIN_DELAY, RPC_PROBE_INTERVAL,
+    RPC_MAX_LAG_BLOCKS, RPC_COOLDOWN_MAX, WSS_MAX_MESSAGE_SIZE
+)
+
+_RATE_LIMIT_HINTS = ("rate limit", "429", "too many requests") # As in backfill: throttling, not a bad request
+# Idempotent reads that may be sent to two endpoints at once
+HEDGED_METHODS = frozenset({
+    "eth_blockNumber", "eth_getLogs", "eth_getBlockByNumber", "eth_getBlockByHash", "eth_call",
+    "eth_getBalance", "eth_getCode", "eth_chainId", "eth_getTransactionReceipt", "eth_getTransactionByHash",
+})
+
+REQUESTS = metrics.counter("rpc_requests_total", "JSON-RPC requests per endpoint", ["endpoint", "outcome"])
+LATENCY = metrics.histogram("rpc_request_seconds", "JSON-RPC request time per endpoint", ["endpoint"])
+HEDGES = metrics.counter("rpc_hedged_requests_total", "Reads also sent to a second endpoint because the first was slow")
+FAILOVERS = metrics.counter("rpc_failovers_total", "Requests retried on another endpoint after a failure")
+
+
+class RateLimited(Exception):
+    pass
+
+
+def _is_rate_limited(error) -> bool:
+    if not error:
+        return False
+    code = error.get("code") if isinstance(error, dict) else None
+    message = str(error.get("message", "") if isinstance(error, dict) else error).lower()
+    return code == 429 or any(hint in message for hint in _RATE_LIMIT_HINTS)
+
+
+def _to_block(method: str, params) -> Optional[int]:
+    """The newest block a read needs, when it names one explicitly."""
+    if method == "eth_getLogs" and params and isinstance(params[0], dict):
+        block = params[0].get("toBlock")
+    elif method in ("eth_getBlockByNumber", "eth_call", "eth_getBalance", "eth_getCode") and params:
+        block = params[0] if method == "eth_getBlockByNumber" else (params[1] if len(params) > 1 else None)
+    else:
+        return None
+    if isinstance(block, int):
+        return block
+    if isinstance(block, str) and block.startswith("0x"):
+        return int(block, 16)
+    return None # "latest" and friends
+
+
+class _Rtt:
+    """Smoothed round-trip time and its variation (as TCP estimates its retransmit timeout)."""
+    __slots__ = ("srtt", "rttvar")
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = 0.0
+
+    def observe(self, elapsed: float) -> None:
+        if self.srtt is None:
+            self.srtt, self.rttvar = elapsed, elapsed / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - elapsed)
+            self.srtt = 0.875 * self.srtt + 0.125 * elapsed
+
+    @property
+    def slow_after(self) -> Optional[float]:
+        return None if self.srtt is None else self.srtt + 4 * self.rttvar
+
+
+class Endpoint:
+    """One RPC URL, its connection and its health."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.websocket = url.startswith(("ws://", "wss://"))
+        parts = urlsplit(url)
+        self.name = f"{parts.scheme}://{parts.netloc}" # Paths often carry API keys: never logged
+        self.rtt = _Rtt()
+        self.error_rate = 0.0 # Moving average of failed requests
+        self.failures = 0 # In a row
+        self.cooldown_until = 0.0
+        self.inflight = 0
+        self.head: Optional[int] = None
+        self.head_seen_at = 0.0
+        self.requests = 0
+        self.errors = 0
+        self._provider = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._connect_lock_loop = None
+
+    async def provider(self):
+        if self._provider is None:
+            from web3 import AsyncHTTPProvider, WebSocketProvider
+            if self.websocket:
+                self._provider = WebSocketProvider(self.url, websocket_kwargs={"max_size": WSS_MAX_MESSAGE_SIZE})
+            else:
+                # No retries of its own: the pool fails over instead of backing off on one endpoint
+                self._provider = AsyncHTTPProvider(
+                    self.url, request_kwargs={"timeout": RPC_REQUEST_TIMEOUT}, exception_retry_configuration=None
+                )
+        if self.websocket and not await self._provider.is_connected():
+            async with self._lock_for_loop():
+                if not await self._provider.is_connected():
+                    await self._provider.connect()
+        return self._provider
+
+    def _lock_for_loop(self) -> asyncio.Lock:
+        # Made on first use inside the running loop: the module-level pool is built at
+        # import time, and a lock stays bound to the first loop that waits on it
+        loop = asyncio.get_running_loop()
+        if self._connect_lock is None or self._connect_lock_loop is not loop:
+            self._connect_lock, self._connect_lock_loop = asyncio.Lock(), loop
+        return self._connect_lock
+
+    async def disconnect(self) -> None:
+        if self._provider is not None and self.websocket:
+            try:
+                await self._provider.disconnect()
+            except Exception:
+                pass
+
+    def record_success(self, elapsed: float) -> None:
+        self.rtt.observe(elapsed)
+        self.error_rate *= 0.9
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    def record_failure(self) -> None:
+        self.error_rate = 0.9 * self.error_rate + 0.1
+        self.failures += 1
+        self.errors += 1
+        self.cooldown_until = time.monotonic() + min(RPC_COOLDOWN_MAX, 2 ** (self.failures - 1))
+
+    def observe_head(self, block: int) -> None:
+        if self.head is None or block > self.head:
+            self.head = block
+            self.head_seen_at = time.monotonic()
+
+    def estimated_head(self, now: float) -> Optional[int]:
+        """The head now, assuming the endpoint kept up with the chain since its head last moved."""
+        if self.head is None:
+            return None
+        return self.head + int((now - self.head_seen_at) / BLOCK_TIME)
+
+    def score(self) -> float:
+        """Lower is better: expected wait, inflated by load and recent errors."""
+        latency = self.rtt.srtt or 0.0 # Unmeasured endpoints get tried (and measured) first
+        return latency * (1 + self.inflight) * (1 + 10 * self.error_rate)
+
+
+class RpcPool:
+    """Endpoints of one chain; see the module docstring for the routing rules."""
+
+    def __init__(self, urls: List[str], timeout: float = RPC_REQUEST_TIMEOUT, hedge_min_delay: float = RPC_HEDGE_MIN_DELAY,
+                 probe_interval: float = RPC_PROBE_INTERVAL, max_lag_blocks: int = RPC_MAX_LAG_BLOCKS):
+        self.endpoints = [Endpoint(url) for url in dict.fromkeys(urls)]
+        self.timeout = timeout
+        self.hedge_min_delay = hedge_min_delay
+        self.probe_interval = probe_interval
+        self.max_lag_blocks = max_lag_blocks
+        self._method_rtt: Dict[str, _Rtt] = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    # --- Health ---
+    def best_head(self) -> Optional[int]:
+        heads = [e.head for e in self.endpoints if e.head is not None]
+        return max(heads) if heads else None
+
+    def stale(self, endpoint: Endpoint) -> bool:
+        """Failed since its last success, or trailing the best endpoint's head."""
+        if endpoint.failures:
+            return True
+        best = self.best_head()
+        return best is not None and endpoint.head is not None and best - endpoint.head > self.max_lag_blocks
+
+    def ranked(self, websocket: bool = False, min_block: Optional[int] = None) -> List[Endpoint]:
+        """Endpoints best first: fresh ones by score, then stale ones, those that failed longest ago first."""
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e.websocket or not websocket]
+        if min_block is not None:
+            # Endpoints known to be behind `min_block` would silently return partial results
+            ready = [e for e in candidates if (e.estimated_head(now) or min_block) >= min_block]
+            candidates = ready or sorted(candidates, key=lambda e: -(e.estimated_head(now) or 0))[:1]
+        fresh = sorted((e for e in candidates if not self.stale(e)), key=Endpoint.score)
+        stale = sorted((e for e in candidates if self.stale(e)), key=lambda e: (e.cooldown_until, e.score()))
+        return fresh + stale
+
+    def best_websocket(self) -> Optional[Endpoint]:
+        ranked = self.ranked(websocket=True)
+        return ranked[0] if ranked else None
+
+    def endpoint(self, url: str) -> Optional[Endpoint]:
+        return next((e for e in self.endpoints if e.url == url), None)
+
+    def _hedge_delay(self, method: str) -> float:
+        slow_after = self._method_rtt.get(method, _Rtt()).slow_after
+        return min(self.timeout, max(self.hedge_min_delay, slow_after if slow_after is not None else self.timeout))
+
+    # --- Requests ---
+    async def _send(self, endpoint: Endpoint, method: str, params) -> dict:
+        endpoint.inflight += 1
+        endpoint.requests += 1
+        started = time.monotonic()
+        try:
+            provider = await endpoint.provider()
+            response = await asyncio.wait_for(provider.make_request(method, params), self.timeout)
+        except asyncio.CancelledError:
+            # Lost a hedge race: the elapsed time is still a lower bound on its latency
+            endpoint.rtt.observe(time.monotonic() - started)
+            REQUESTS.labels(endpoint.name, "cancelled").inc()
+            raise
+        except Exception:
+            endpoint.record_failure()
+            REQUESTS.labels(endpoint.name, "error").inc()
+            await endpoint.disconnect() # Reconnects on next use
+            raise
+        finally:
+            endpoint.inflight -= 1
+        elapsed = time.monotonic() - started
+        if _is_rate_limited(response.get("error")):
+            endpoint.record_failure()
+            REQUESTS.labels(endpoint.name, "rate_limited").inc()
+            raise RateLimited(f"{endpoint.name}: {response['error']}")
+        endpoint.record_success(elapsed)
+        self._method_rtt.setdefault(method, _Rtt()).observe(elapsed)
+        REQUESTS.labels(endpoint.name, "ok").inc()
+        LATENCY.labels(endpoint.name).observe(elapsed)
+        if method == "eth_blockNumber" and isinstance(response.get("result"), str):
+            endpoint.observe_head(int(response["result"], 16))
+        return response
+
+    async def request(self, method: str, params) -> dict:
+        """
+        Sends one JSON-RPC request to the best endpoint, hedging slow reads to the
+        runner-up and failing over on transport errors and rate limits.
+        """
+        candidates = iter(self.ranked(min_block=_to_block(method, params)))
+        running: Dict[asyncio.Task, Endpoint] = {}
+        hedge = method in HEDGED_METHODS and len(self.endpoints) > 1
+        last_error: Optional[Exception] = None
+
+        def launch() -> bool:
+            endpoint = next(candidates, None)
+            if endpoint is None:
+                return False
+            running[asyncio.ensure_future(self._send(endpoint, method, params))] = endpoint
+            return True
+
+        launch()
+        hedged = None # The endpoint that was racing when the hedge started
+        try:
+            while running:
+                done, _ = await asyncio.wait(
+                    running, timeout=self._hedge_delay(method) if hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Slower than this method usually is: race the next endpoint (once)
+                    hedge = False
+                    if launch():
+                        hedged = next(iter(running))
+                        self.hedges += 1
+                        HEDGES.inc()
+                    continue
+                for task in done:
+                    running.pop(task)
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if hedged is not None and task is not hedged:
+                        self.hedge_wins += 1
+                    return response
+                if not running:
+                    self.failovers += 1
+                    FAILOVERS.inc()
+                    if not launch():
+                        break
+        finally:
+            for task in running:
+                task.cancel()
+        raise last_error or ConnectionError("no RPC endpoint configured")
+
+    # --- Probing ---
+    async def probe(self) -> None:
+        """eth_blockNumber on every endpoint not backing off: refreshes heads and latency, and lets recovered ones back in."""
+        async def one(endpoint):
+            try:
+                await self._send(endpoint, "eth_blockNumber", [])
+            except Exception:
+                pass
+        now = time.monotonic()
+        await asyncio.gather(*(one(e) for e in self.endpoints if e.cooldown_until <= now))
+
+    async def run(self) -> None:
+        """Background probe loop."""
+        try:
+            while True:
+                await self.probe()
+                await asyncio.sleep(self.probe_interval)
+        finally:
+            for endpoint in self.endpoints:
+                await endpoint.disconnect()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        best = self.best_head()
+        return {
+            "endpoints": [{
+                "endpoint": e.name,
+                "websocket": e.websocket,
+                "stale": self.stale(e),
+                "latency_ms": round(e.rtt.srtt * 1000, 1) if e.rtt.srtt is not None else None,
+                "error_rate": round(e.error_rate, 3),
+                "inflight": e.inflight,
+                "head": e.head,
+                "lag_blocks": best - e.head if best is not None and e.head is not None else None,
+                "cooldown_s": round(max(0.0, e.cooldown_until - now), 1),
+                "requests": e.requests,
+                "errors": e.errors,
+            } for e in self.endpoints],
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+        }
+
+
+_pooled_provider_class = None
+
+def pooled_web3(pool: RpcPool):
+    """An AsyncWeb3 whose requests all go through `pool` (web3 is imported on first use)."""
+    global _pooled_provider_class
+    from web3 import AsyncWeb3
+    if _pooled_provider_class is None:
+        from web3.providers.async_base import AsyncBaseProvider
+
+        class PooledProvider(AsyncBaseProvider):
+            def __init__(self, pool: RpcPool):
+                super().__init__()
+                self.pool = pool
+
+            async def make_request(self, method, params):
+                return await self.pool.request(method, params)
+
+            async def is_connected(self, show_traceback: bool = False) -> bool:
+                return any(not self.pool.stale(e) for e in self.pool.endpoints)
+
+        _pooled_provider_class = PooledProvider
+    return AsyncWeb3(_pooled_provider_class(pool))
+
+
+RPC_POOL = RpcPool(RPC_URLS)
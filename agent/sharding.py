@@ -0,0 +1,444 @@
+# sharding.py
+"""
+Sharded listener: a supervisor partitions the tracked contracts across N listener
+processes with a consistent hash ring, so decoding and actions use N cores and each
+process holds only its slice of the provider's subscription/address limits.
+
+Every shard runs the normal listen_for_events loop with a SHARD_FILTER, so it
+picks up its own additions/removals through the usual hot reload. When the shard
+count changes, only the contracts whose ring owner changed move, in two steps: the
+old owners drop them first and report the logs they handled past the checkpoint,
+then the new owners resume from the shared checkpoint file, skipping those logs, so
+a hand-over does not run actions twice. Events recorded by the shards are forwarded
+in batches to the supervisor, which merges them (de-duplicated) into this process's
+RECENT_EVENTS for the agent tools and API, and is the only writer of the event journal.
+"""
+import asyncio
+import bisect
+import hashlib
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from agent import metrics
+from agent.config import (
+    ACTION_SPILL_PATH, DEDUP_CAPACITY, LISTENER_SHARDS, LISTENER_CONTRACTS_PER_SHARD, LISTENER_MAX_SHARDS
+)
+from agent.delivery import DeliveryDeduplicator
+
+METRICS_PUSH_INTERVAL = 2.0 # Seconds between shard metric snapshots sent to the supervisor
+HANDOVER_TIMEOUT = 15.0 # Seconds a rebalance waits for the old owners to release the contracts that move
+
+
+def _ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring over shard ids with `vnodes` points per shard. Adding or
+    removing a shard moves only ~1/N of the keys, all to or from that shard.
+    """
+
+    def __init__(self, shard_ids: Sequence[int], vnodes: int = 64):
+        points = sorted((_ring_hash(f"shard-{shard}-{i}"), shard) for shard in shard_ids for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def owner(self, key: str) -> int:
+        index = bisect.bisect(self._hashes, _ring_hash(key.lower())) % len(self._hashes)
+        return self._shards[index]
+
+
+# --- Shard worker process ---
+class _EventForwarder:
+    """Batches sink messages and ships them to the supervisor every `interval` seconds."""
+
+    def __init__(self, out_queue, shard_id: int, interval: float = 0.05, batch_size: int = 500):
+        self.out_queue = out_queue
+        self.shard_id = shard_id
+        self.interval = interval
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def __call__(self, kind, payload):
+        with self._lock:
+            self._pending.append((kind, payload))
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            self.out_queue.put((self.shard_id, batch))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+def _shard_main(shard_id: int, shard_ids: List[int], wss_url: Optional[str], events_out, control,
+                handed: Optional[dict] = None):
+    """Entry point of a listener shard process. `handed`: logs already handled for contracts it takes over."""
+    from agent import background_listener as listener
+
+    ring = None
+
+    def assign(ids):
+        nonlocal ring
+        ring = HashRing(ids)
+        owner = ring.owner
+        listener.SHARD_FILTER = lambda addr: owner(addr) == shard_id
+        print(f"Shard {shard_id}: owning its share of contracts across {len(ids)} shard(s).")
+
+    assign(shard_ids)
+    listener.JOURNAL_EVENTS = False # Journaled once, by the supervisor
+    listener.adopt_handed_over(handed or {})
+    # One action overflow file per shard id: a shared file would be replayed by every
+    # shard at startup and truncated under the others' appends. A restarted shard keeps its id
+    root, ext = os.path.splitext(ACTION_SPILL_PATH)
+    listener.ACTION_PIPELINE.set_spill_path(f"{root}.shard{shard_id}{ext}")
+    forwarder = _EventForwarder(events_out, shard_id)
+    listener.EVENT_SINKS.append(forwarder)
+
+    def push_metrics():
+        # The supervisor serves /metrics for all shards, labelled shard="<id>"
+        while True:
+            time.sleep(METRICS_PUSH_INTERVAL)
+            forwarder("metrics", metrics.REGISTRY.snapshot())
+
+    threading.Thread(target=push_metrics, daemon=True).start()
+
+    async def release(ids):
+        # Keeps only what it owns under both rings: the rest is about to move to another shard
+        old, new = ring.owner, HashRing(ids).owner
+        listener.SHARD_FILTER = lambda addr: old(addr) == shard_id and new(addr) == shard_id
+        return await listener.hand_over_targets()
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        listen_task = asyncio.create_task(listener.listen_for_events(wss_url, restore_history=False))
+
+        def read_control():
+            while True:
+                command, arg = control.get()
+                if command == "release":
+                    try:
+                        released = asyncio.run_coroutine_threadsafe(release(arg), loop).result(HANDOVER_TIMEOUT)
+                    except Exception as e:
+                        print(f"Shard {shard_id}: failed to release contracts for a rebalance: {e}")
+                        continue
+                    forwarder("released", released)
+                    forwarder.flush()
+                elif command == "rebalance":
+                    ids, handed = arg
+                    # Runs on the loop ahead of the reload that starts the new contracts' catch-up
+                    loop.call_soon_threadsafe(listener.adopt_handed_over, handed)
+                    assign(ids)
+                    listener.request_target_reload()
+                elif command == "reload":
+                    listener.request_target_reload()
+                elif command == "stop":
+                    loop.call_soon_threadsafe(listen_task.cancel)
+                    return
+
+        threading.Thread(target=read_control, daemon=True).start()
+        try:
+            await listen_task
+        except asyncio.CancelledError:
+            pass
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        forwarder.flush()
+
+
+# --- Supervisor ---
+class ShardSupervisor:
+    """
+    Starts, monitors and rebalances the listener shard processes, and merges their
+    events into one stream. With `contracts_per_shard` set, the shard count follows
+    the registry size (between `shards` and `max_shards`). Crashed shards are restarted
+    with exponential backoff.
+    """
+
+    def __init__(self, shards: int = LISTENER_SHARDS, wss_url: Optional[str] = None,
+                 contracts_per_shard: int = LISTENER_CONTRACTS_PER_SHARD, max_shards: int = LISTENER_MAX_SHARDS,
+                 on_event: Optional[Callable[[dict], None]] = None, check_interval: float = 1.0):
+        self.min_shards = max(1, shards)
+        self.max_shards = max(self.min_shards, max_shards)
+        self.contracts_per_shard = contracts_per_shard
+        self.wss_url = wss_url # None: each shard uses the endpoint pool in RPC_URLS
+        self.on_event = on_event
+        self.check_interval = check_interval
+        self._ctx = multiprocessing.get_context("spawn") # Never fork a process that already runs threads
+        self._events = self._ctx.Queue()
+        self._workers: Dict[int, dict] = {}
+        self._retiring: List[dict] = []
+        self._shard_ids: List[int] = []
+        self._merged = DeliveryDeduplicator(DEDUP_CAPACITY)
+        self._shard_metrics: Dict[int, list] = {} # Latest metrics snapshot per shard
+        self._handover = threading.Condition()
+        self._released: Optional[Dict[int, dict]] = None # shard id -> what it released, during a rebalance
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._bus = None
+        self.events_merged = 0
+        self.restarts = 0
+
+    # --- Lifecycle ---
+    def start(self) -> None:
+        from agent import background_listener as listener
+
+        if not len(listener.RECENT_EVENTS):
+            listener.restore_recent_events()
+        self.resize(self.desired_shards())
+        # The merged stream is what other local processes see over the event bus
+        self._bus = listener.start_event_bus(
+            stats_provider=lambda: {"shards": self.stats()}, on_reload=self.reload_targets,
+            metrics_provider=self.render_metrics
+        )
+        for target in (self._merge_loop, self._monitor_loop, self._journal_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stopping.set()
+        if self._bus is not None:
+            self._bus.stop()
+            self._bus = None
+        for thread in self._threads:
+            thread.join(timeout=2)
+        workers = list(self._workers.values()) + self._retiring
+        for worker in workers:
+            worker["control"].put(("stop", None))
+        deadline = time.monotonic() + timeout
+        # Keep draining while waiting: a child cannot exit until its queued batches are read
+        while any(w["process"].is_alive() for w in workers) and time.monotonic() < deadline:
+            self._drain()
+            time.sleep(0.05)
+        for worker in workers:
+            if worker["process"].is_alive():
+                worker["process"].terminate()
+        self._workers.clear()
+        self._retiring.clear()
+        self._drain()
+        from agent import background_listener as listener
+        try:
+            listener.EVENT_JOURNAL.flush()
+        except Exception as e:
+            print(f"Error persisting recent events: {e}")
+
+    def reload_targets(self) -> None:
+        """Asks every shard to re-apply the contract store now rather than at its next poll."""
+        for worker in list(self._workers.values()):
+            worker["control"].put(("reload", None))
+
+    def desired_shards(self) -> int:
+        if self.contracts_per_shard <= 0:
+            return self.min_shards
+        from agent.tools import contract_manager
+        wanted = math.ceil(len(contract_manager.load_contracts()) / self.contracts_per_shard)
+        return min(self.max_shards, max(self.min_shards, wanted))
+
+    def resize(self, count: int) -> None:
+        """Rebalances onto shards 0..count-1: surviving shards re-filter, others start or stop."""
+        shard_ids = list(range(count))
+        previous = self._shard_ids
+        handed = self._hand_over(shard_ids) if self._workers else {}
+        self._shard_ids = shard_ids
+        ring = HashRing(shard_ids)
+        handed_to = {shard_id: {} for shard_id in shard_ids}
+        for addr, keys in handed.items():
+            handed_to[ring.owner(addr)][addr] = keys
+        for shard_id in [s for s in self._workers if s not in shard_ids]:
+            worker = self._workers.pop(shard_id)
+            worker["control"].put(("stop", None))
+            self._retiring.append(worker)
+        for shard_id in shard_ids:
+            if shard_id in self._workers:
+                self._workers[shard_id]["control"].put(("rebalance", (shard_ids, handed_to[shard_id])))
+            else:
+                self._spawn(shard_id, handed=handed_to[shard_id])
+        if previous:
+            print(f"Shard supervisor: rebalanced from {len(previous)} to {count} shard(s).")
+        else:
+            print(f"Shard supervisor: started {count} listener shard(s).")
+
+    def _hand_over(self, shard_ids: List[int]) -> Dict[str, list]:
+        """
+        First half of a rebalance: every running shard drops the contracts it does not
+        own under the new ring and reports the logs it handled for them. Returns the
+        reports merged, {address: [log keys]}; a shard that does not answer within
+        HANDOVER_TIMEOUT is given up on (its contracts may then replay some actions).
+        """
+        workers = {s: w for s, w in self._workers.items() if w["process"].is_alive()}
+        with self._handover:
+            self._released = {}
+        for worker in workers.values():
+            worker["control"].put(("release", shard_ids))
+        deadline = time.monotonic() + HANDOVER_TIMEOUT
+        with self._handover:
+            while any(s not in self._released and w["process"].is_alive() for s, w in workers.items()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    missing = [s for s in workers if s not in self._released]
+                    print(f"Shard supervisor: shard(s) {missing} did not release their contracts in time.")
+                    break
+                self._handover.wait(min(remaining, 0.5))
+            released, self._released = self._released, None
+        handed = {}
+        for contracts in released.values():
+            handed.update(contracts)
+        return handed
+
+    def _spawn(self, shard_id: int, restarts: int = 0, handed: Optional[dict] = None) -> None:
+        control = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_shard_main, args=(shard_id, self._shard_ids, self.wss_url, self._events, control, handed),
+            name=f"listener-shard-{shard_id}", daemon=True
+        )
+        process.start()
+        self._workers[shard_id] = {"process": process, "control": control, "restarts": restarts, "restart_at": None}
+
+    def _monitor_loop(self) -> None:
+        while not self._stopping.wait(self.check_interval):
+            try:
+                now = time.monotonic()
+                for shard_id, worker in list(self._workers.items()):
+                    if worker["process"].is_alive():
+                        continue
+                    if worker["restart_at"] is None:
+                        delay = min(60.0, 2.0 ** worker["restarts"])
+                        worker["restart_at"] = now + delay
+                        print(f"Shard supervisor: shard {shard_id} exited ({worker['process'].exitcode}), "
+                              f"restarting in {delay:.0f}s.")
+                    elif now >= worker["restart_at"]:
+                        self.restarts += 1
+                        self._spawn(shard_id, worker["restarts"] + 1)
+                for worker in list(self._retiring):
+                    worker["process"].join(0)
+                    if not worker["process"].is_alive():
+                        self._retiring.remove(worker)
+                if self.contracts_per_shard > 0:
+                    desired = self.desired_shards()
+                    if desired != len(self._shard_ids):
+                        self.resize(desired)
+            except Exception as e:
+                print(f"Shard supervisor error: {e}")
+
+    # --- Merged output stream ---
+    def _merge_batch(self, batch, shard_id: Optional[int] = None) -> None:
+        for kind, payload in batch:
+            try:
+                self._merge_one(kind, payload, shard_id)
+            except Exception as e:
+                # One malformed message must not cost the rest of the batch
+                print(f"Shard supervisor: failed to merge a '{kind}' message from shard {shard_id}: {e}")
+
+    def _merge_one(self, kind, payload, shard_id: Optional[int]) -> None:
+        from agent import background_listener as listener
+
+        if kind == "metrics":
+            self._shard_metrics[shard_id] = payload
+        elif kind == "event":
+            # A contract handed between shards may replay a block the old owner already sent.
+            # Alerts are not logs (no or a borrowed tx/logIndex): they carry an id of their own
+            alert_id = payload.get("alert_id")
+            if alert_id is not None:
+                fresh = self._merged.first_seen(b"alert:" + str(alert_id).encode())
+            else:
+                fresh = self._merged.first_delivery(payload)
+            if not fresh:
+                return
+            listener.RECENT_EVENTS.append(payload)
+            listener.EVENT_JOURNAL.append(payload)
+            self.events_merged += 1
+            if self.on_event is not None:
+                try:
+                    self.on_event(payload)
+                except Exception as e:
+                    print(f"Shard supervisor: on_event callback failed: {e}")
+        elif kind == "released":
+            with self._handover:
+                if self._released is not None:
+                    self._released[shard_id] = payload
+                    self._handover.notify_all()
+        elif kind == "removed":
+            tx, log_index, block = payload
+            self._merged.retract({"transactionHash": tx, "logIndex": log_index})
+            listener.RECENT_EVENTS.mark_removed(tx, log_index, block)
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                shard_id, batch = self._events.get_nowait()
+            except queue.Empty:
+                return
+            self._merge_batch(batch, shard_id)
+
+    def _merge_loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                shard_id, batch = self._events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._merge_batch(batch, shard_id)
+            except Exception as e:
+                print(f"Shard supervisor: failed to merge events: {e}")
+
+    def _journal_loop(self) -> None:
+        from agent import background_listener as listener
+
+        journal = listener.EVENT_JOURNAL
+        while not self._stopping.wait(journal.flush_interval):
+            try:
+                journal.maintain()
+            except Exception as e:
+                print(f"Error persisting recent events: {e}")
+
+    def render_metrics(self) -> str:
+        """Prometheus text for every live shard (labelled shard="<id>"), plus this process's own metrics."""
+        snapshots = [({"shard": str(shard_id)}, snapshot) for shard_id, snapshot in sorted(self._shard_metrics.items())
+                     if shard_id in self._workers]
+        return metrics.REGISTRY.render(snapshots)
+
+    def stats(self) -> dict:
+        return {
+            "shards": len(self._shard_ids),
+            "alive": sum(1 for w in self._workers.values() if w["process"].is_alive()),
+            "events_merged": self.events_merged,
+            "duplicates_dropped": self._merged.duplicates,
+            "restarts": self.restarts,
+        }
+
+
+def run_sharded_listener(shards: int = LISTENER_SHARDS, wss_url: Optional[str] = None) -> None:
+    """Runs a supervisor in the foreground until interrupted."""
+    supervisor = ShardSupervisor(shards, wss_url)
+    supervisor.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("\nSharded listener stopped by user.")
+    finally:
+        supervisor.stop()
+
+
+if __name__ == "__main__":
+    run_sharded_listener()
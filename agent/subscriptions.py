@@ -0,0 +1,97 @@
+# subscriptions.py
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from web3 import Web3
+
+
+def _hex(topic: bytes) -> str:
+    return "0x" + topic.hex()
+
+
+def _log_filter(topics, addresses) -> dict:
+    return {
+        "address": [Web3.to_checksum_address(a) for a in sorted(addresses)],
+        "topics": [sorted(_hex(t) for t in topics)],
+    }
+
+
+GroupKey = Tuple[FrozenSet[bytes], int]
+
+
+def group_by_topics(active_contracts: Dict[str, dict],
+                    max_addresses: Optional[int] = None) -> Dict[GroupKey, List[str]]:
+    """
+    Groups contract addresses that track exactly the same set of topic0 hashes.
+    Keys are (topics, part): groups larger than `max_addresses` (providers cap the
+    addresses one filter may hold) are split into sorted parts of at most that size.
+    """
+    by_topics: Dict[FrozenSet[bytes], List[str]] = {}
+    for addr, info in active_contracts.items():
+        topics = frozenset(info["decoders"].topics_for(info["tracked_events"]))
+        if not topics:
+            print(f"Warning: none of {sorted(info['tracked_events'])} found in ABI for {addr}. Not subscribing.")
+            continue
+        by_topics.setdefault(topics, []).append(addr)
+    groups: Dict[GroupKey, List[str]] = {}
+    for topics, addresses in by_topics.items():
+        if not max_addresses or len(addresses) <= max_addresses:
+            groups[(topics, 0)] = addresses
+            continue
+        addresses = sorted(addresses)
+        for part, start in enumerate(range(0, len(addresses), max_addresses)):
+            groups[(topics, part)] = addresses[start:start + max_addresses]
+    return groups
+
+
+def build_log_filters(active_contracts: Dict[str, dict], max_addresses: Optional[int] = None) -> List[dict]:
+    """
+    Builds eth_subscribe('logs') filter params, one per group of contracts sharing a topic set.
+    topics[0] is an OR-list of the tracked event signatures, so the node only sends
+    logs that handle_event will actually dispatch.
+    """
+    return [_log_filter(topics, addresses)
+            for (topics, _), addresses in group_by_topics(active_contracts, max_addresses).items()]
+
+
+class SubscriptionManager:
+    """
+    Keeps the node-side log subscriptions in step with active_contracts.
+    sync() only touches groups whose topic set or address list changed; new
+    subscriptions are opened before the ones they replace are closed, so logs
+    for unaffected contracts keep flowing on the same socket throughout.
+    """
+
+    def __init__(self, w3, max_addresses_per_filter: Optional[int] = None):
+        self.w3 = w3
+        self.max_addresses_per_filter = max_addresses_per_filter
+        self._subscriptions: Dict[GroupKey, Tuple[str, Tuple[str, ...]]] = {}
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def reset(self) -> None:
+        """Forgets all subscriptions (after the socket they lived on was lost)."""
+        self._subscriptions.clear()
+
+    async def sync(self, active_contracts: Dict[str, dict]) -> None:
+        groups = group_by_topics(active_contracts, self.max_addresses_per_filter)
+        wanted = {key: tuple(sorted(addrs)) for key, addrs in groups.items()}
+        stale = []
+        for key, addresses in wanted.items():
+            topics = key[0]
+            current = self._subscriptions.get(key)
+            if current is not None and current[1] == addresses:
+                continue
+            log_filter = _log_filter(topics, addresses)
+            print(f"Subscribing to {len(topics)} topic(s) for addresses: {log_filter['address']}")
+            sub_id = await self.w3.eth.subscribe("logs", log_filter)
+            if current is not None:
+                stale.append(current[0])
+            self._subscriptions[key] = (sub_id, addresses)
+        for key in [k for k in self._subscriptions if k not in wanted]:
+            stale.append(self._subscriptions.pop(key)[0])
+        for sub_id in stale:
+            try:
+                await self.w3.eth.unsubscribe(sub_id)
+            except Exception as e:
+                print(f"Listener Warning: Failed to unsubscribe {sub_id}: {e}")
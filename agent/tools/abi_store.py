@@ -0,0 +1,144 @@
+# tools/abi_store.py
+"""
+Content-addressed ABI storage and batched ABI fetching from Basescan.
+
+ABIs are stored once per distinct content under <abi_dir>/by_hash/<sha256>.json
+(the same hash the listener uses to share compiled decoders), and
+<abi_dir>/abi_index.json maps each contract address to its ABI hash. Onboarding
+thousands of ERC20 tokens therefore writes one ABI file, and every contract
+record points at that same path.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Union
+
+from agent.tools.basescan import get_basescan_client
+from agent.tools.utils import atomic_write_json, file_lock
+
+INDEX_FILENAME = "abi_index.json"
+
+
+def abi_content_hash(abi: list) -> str:
+    """sha256 of the ABI's canonical JSON (key order and whitespace do not matter)."""
+    canonical = json.dumps(abi, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class AbiStore:
+    """
+    ABI files keyed by content hash, plus an address -> hash index.
+    The index is cached in memory and re-read only when the file changes; writes
+    merge with the file under a lock, so concurrent onboarding processes are safe.
+    """
+
+    def __init__(self, abi_dir: str):
+        self.abi_dir = abi_dir
+        self.hash_dir = os.path.join(abi_dir, "by_hash")
+        self.index_path = os.path.join(abi_dir, INDEX_FILENAME)
+        self._index: Dict[str, str] = {}
+        self._index_version = object()
+        self._lock = threading.Lock()
+
+    def _index_file_version(self):
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _read_index(self) -> Dict[str, str]:
+        version = self._index_file_version()
+        if version != self._index_version:
+            index = {}
+            if version is not None:
+                try:
+                    with open(self.index_path, "r") as f:
+                        index = json.load(f)
+                except json.JSONDecodeError as e:
+                    print(f"Warning: ignoring unreadable ABI index at {self.index_path}: {e}")
+            self._index, self._index_version = index, version
+        return self._index
+
+    def path_for_hash(self, content_hash: str) -> str:
+        return os.path.join(self.hash_dir, f"{content_hash}.json")
+
+    def path_for(self, address: str) -> Optional[str]:
+        """Stored ABI path for `address`, falling back to the legacy abi_<address>.json layout."""
+        address = address.lower()
+        with self._lock:
+            content_hash = self._read_index().get(address)
+        if content_hash:
+            path = self.path_for_hash(content_hash)
+            if os.path.exists(path):
+                return path
+        legacy = os.path.join(self.abi_dir, f"abi_{address}.json")
+        return legacy if os.path.exists(legacy) else None
+
+    def _write_abi(self, abi: list) -> str:
+        content_hash = abi_content_hash(abi)
+        path = self.path_for_hash(content_hash)
+        if not os.path.exists(path):
+            os.makedirs(self.hash_dir, exist_ok=True)
+            atomic_write_json(path, abi, indent=2)
+        return path
+
+    def save_many(self, abis: Dict[str, list]) -> Dict[str, str]:
+        """Stores ABIs for many addresses with one index write. Returns address -> ABI path."""
+        paths, hashes = {}, {}
+        for address, abi in abis.items():
+            path = self._write_abi(abi)
+            paths[address.lower()] = path
+            hashes[address.lower()] = os.path.splitext(os.path.basename(path))[0]
+        if hashes:
+            os.makedirs(self.abi_dir, exist_ok=True)
+            with self._lock, file_lock(self.index_path):
+                self._index_version = object() # Another process may have written: re-read under the lock
+                index = dict(self._read_index())
+                index.update(hashes)
+                atomic_write_json(self.index_path, index, indent=2, sort_keys=True)
+                self._index, self._index_version = index, self._index_file_version()
+        return paths
+
+    def save(self, address: str, abi: list) -> str:
+        return self.save_many({address: abi})[address.lower()]
+
+    def stats(self) -> dict:
+        with self._lock:
+            index = self._read_index()
+        return {"addresses": len(index), "distinct_abis": len(set(index.values()))}
+
+
+_stores: Dict[str, AbiStore] = {}
+
+
+def get_abi_store(abi_dir: str) -> AbiStore:
+    store = _stores.get(abi_dir)
+    if store is None:
+        store = _stores[abi_dir] = AbiStore(abi_dir)
+    return store
+
+
+def fetch_and_save_abis(addresses: Iterable[str], api_key: Optional[str], abi_dir: str,
+                        refresh: bool = False) -> Dict[str, Union[str, Exception]]:
+    """
+    Resolves ABI paths for many contracts: addresses already in the store are not
+    fetched again (unless `refresh`); the rest are fetched concurrently and stored
+    with a single index update. Values are ABI paths or the per-address error.
+    """
+    store = get_abi_store(abi_dir)
+    results: Dict[str, Union[str, Exception]] = {}
+    missing: List[str] = []
+    for address in dict.fromkeys(a.lower() for a in addresses):
+        path = None if refresh else store.path_for(address)
+        if path:
+            results[address] = path
+        else:
+            missing.append(address)
+    if missing:
+        fetched = get_basescan_client(api_key).fetch_abis(missing)
+        abis = {addr: abi for addr, abi in fetched.items() if not isinstance(abi, Exception)}
+        results.update(store.save_many(abis))
+        results.update({addr: e for addr, e in fetched.items() if isinstance(e, Exception)})
+    return results
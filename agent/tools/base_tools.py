@@ -1,14 +1,79 @@
 # tools/base_tools.py
-import requests
 import json
-from langchain.tools import tool
-from agent.config import BASESCAN_API_KEY  # Import key from config
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, Tuple, Union
+from agent.config import BASESCAN_API_KEY, BALANCE_CACHE_TTL  # Import key from config
+from agent.tools.basescan import get_basescan_client
+from agent.tools.cache import cached_tool
 
-BASESCAN_API_URL = "https://api.basescan.org/api"
+MAX_BALANCES_IN_REPLY = 50 # Per-address balances listed to the agent; the rest are only counted
 
-@tool
+def _is_address(address: str) -> bool:
+    return isinstance(address, str) and address.startswith("0x") and len(address) == 42
+
+def _format_eth(wei: int) -> str:
+    return format(Decimal(wei).scaleb(-18).normalize(), "f")
+
+# --- Python API (bulk checks such as airdrop eligibility) ---
+def iter_native_balances(addresses: Iterable[str]) -> Iterator[Tuple[str, Union[int, Exception]]]:
+    """
+    Streams (address, balance in wei) for any number of addresses, 20 per Basescan
+    balancemulti request over the shared pooled client. Addresses of a failed
+    request come back with the exception instead of a balance.
+    """
+    return get_basescan_client(BASESCAN_API_KEY).iter_balances(addresses)
+
+def get_native_balances(addresses: Iterable[str]) -> Dict[str, Union[int, Exception]]:
+    """Collects iter_native_balances into address -> balance in wei (or the error)."""
+    return dict(iter_native_balances(addresses))
+
+# --- Agent tools ---
+@cached_tool(BALANCE_CACHE_TTL, key=lambda address: (address.lower(),))
 def get_base_native_balance(address: str) -> str:
     """Gets native ETH balance for an address ON BASE NETWORK via Basescan."""
     if not BASESCAN_API_KEY:
         return "Error: Basescan API key not configured."
-    # ... (rest of the tool implementation) ...
+    if not _is_address(address):
+        return f"Error: Invalid address format: {address}."
+    try:
+        wei = get_basescan_client(BASESCAN_API_KEY).fetch_balance(address)
+    except Exception as e:
+        return f"Error: Failed to fetch balance for {address}: {e}"
+    return f"{address} holds {_format_eth(wei)} ETH on Base ({wei} wei)."
+
+def get_base_native_balances(addresses: list[str], min_balance_eth: float = 0.0) -> str:
+    """
+    Gets native ETH balances for many addresses ON BASE NETWORK via Basescan (20 addresses per request).
+    Args:
+        addresses (list[str]): The addresses to check ('0x...').
+        min_balance_eth (float): Only list addresses holding at least this much ETH (optional).
+    Returns a JSON summary: how many addresses were checked and matched, their total balance,
+    the largest matching balances in ETH (at most 50) and any addresses that could not be checked.
+    """
+    if not BASESCAN_API_KEY:
+        return "Error: Basescan API key not configured."
+    errors = {a: "invalid address format" for a in addresses if not _is_address(a)}
+    valid = [a for a in addresses if _is_address(a)]
+    if not valid:
+        return "Error: No valid addresses given."
+    threshold = int(Decimal(str(min_balance_eth)).scaleb(18))
+
+    matching, checked, total = [], 0, 0
+    for address, balance in iter_native_balances(valid):
+        if isinstance(balance, Exception):
+            errors[address] = str(balance)
+            continue
+        checked += 1
+        if balance >= threshold:
+            matching.append((balance, address))
+            total += balance
+    matching.sort(reverse=True)
+    return json.dumps({
+        "checked": checked,
+        "matching": len(matching),
+        "total_eth": _format_eth(total),
+        "balances_eth": {address: _format_eth(balance) for balance, address in matching[:MAX_BALANCES_IN_REPLY]},
+        "truncated": len(matching) > MAX_BALANCES_IN_REPLY,
+        "errors": dict(list(errors.items())[:MAX_BALANCES_IN_REPLY]),
+        "error_count": len(errors),
+    }, indent=2)
@@ -0,0 +1,158 @@
+# tools/basescan.py
+"""
+Basescan API client shared by every tool that talks to Basescan (ABI fetching,
+balance lookups): one pooled keep-alive session and one rate limit per process.
+"""
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+BALANCEMULTI_MAX_ADDRESSES = 20 # Basescan's limit per account/balancemulti call
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` acquisitions per second with bursts up to
+    `capacity`. The default capacity of 1 spaces calls evenly, which keeps any
+    one-second window (how Basescan counts) within the quota.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+class BasescanClient:
+    """
+    Basescan API over one pooled keep-alive session. Calls are paced by a
+    token bucket to stay inside the API key's quota, and "rate limit" replies are
+    retried with backoff.
+    """
+
+    def __init__(self, api_key: Optional[str], base_url: str, rate_per_second: float = 5.0,
+                 concurrency: int = 4, timeout: float = 10.0, max_retries: int = 3):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.limiter = TokenBucket(rate_per_second)
+        import requests # Deferred so importing the tools stays cheap
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.requests = 0
+
+    def _call(self, params: dict):
+        params = dict(params, apikey=self.api_key)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            self.requests += 1
+            response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+            if response.status_code == 429 and attempt < self.max_retries:
+                time.sleep(0.5 * 2 ** attempt)
+                continue
+            if response.status_code != 200:
+                raise RuntimeError(f"Basescan API request failed with status {response.status_code}")
+            data = response.json()
+            if data.get("status") == "1":
+                return data["result"]
+            message = str(data.get("result") or data.get("message"))
+            if "rate limit" in message.lower() and attempt < self.max_retries:
+                time.sleep(0.5 * 2 ** attempt)
+                continue
+            raise RuntimeError(f"Basescan API error: {message}")
+
+    def fetch_abi(self, address: str) -> list:
+        return json.loads(self._call({"module": "contract", "action": "getabi", "address": address}))
+
+    def fetch_abis(self, addresses: Iterable[str]) -> Dict[str, Union[list, Exception]]:
+        """Fetches many ABIs concurrently. Values are the ABI or the exception raised for that address."""
+        addresses = list(dict.fromkeys(a.lower() for a in addresses))
+
+        def fetch(address):
+            try:
+                return self.fetch_abi(address)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            return dict(zip(addresses, pool.map(fetch, addresses)))
+
+    def fetch_balance(self, address: str) -> int:
+        """Native balance of one address, in wei."""
+        return int(self._call({"module": "account", "action": "balance", "address": address, "tag": "latest"}))
+
+    def _fetch_balance_batch(self, batch: List[str]) -> Dict[str, int]:
+        result = self._call({"module": "account", "action": "balancemulti", "address": ",".join(batch), "tag": "latest"})
+        return {item["account"].lower(): int(item["balance"]) for item in result}
+
+    def iter_balances(self, addresses: Iterable[str],
+                      batch_size: int = BALANCEMULTI_MAX_ADDRESSES) -> Iterator[Tuple[str, Union[int, Exception]]]:
+        """
+        Native balances (wei) for many addresses: `batch_size` addresses per
+        balancemulti request, at most `concurrency` requests in flight. Yields
+        (address, balance) as each batch completes, so results stream back while
+        later batches are still being fetched; addresses of a failed batch are
+        yielded with the exception instead of a balance.
+        """
+        addresses = list(dict.fromkeys(a.lower() for a in addresses))
+        batches = iter([addresses[i:i + batch_size] for i in range(0, len(addresses), batch_size)])
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            in_flight = {}
+
+            def submit_next():
+                batch = next(batches, None)
+                if batch:
+                    in_flight[pool.submit(self._fetch_balance_batch, batch)] = batch
+
+            for _ in range(self.concurrency):
+                submit_next()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = in_flight.pop(future)
+                    submit_next()
+                    try:
+                        balances = future.result()
+                    except Exception as e:
+                        for address in batch:
+                            yield address, e
+                        continue
+                    for address in batch:
+                        balance = balances.get(address)
+                        yield address, balance if balance is not None else RuntimeError("address missing from Basescan reply")
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_client: Optional[BasescanClient] = None
+
+
+def get_basescan_client(api_key: Optional[str]) -> BasescanClient:
+    """Process-wide client, so every call shares one connection pool and one rate limit."""
+    global _client
+    if _client is None or _client.api_key != api_key:
+        from agent.config import BASESCAN_API_URL, BASESCAN_RATE_LIMIT, BASESCAN_CONCURRENCY
+        _client = BasescanClient(api_key, BASESCAN_API_URL, BASESCAN_RATE_LIMIT, BASESCAN_CONCURRENCY)
+    return _client
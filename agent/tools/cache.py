@@ -0,0 +1,158 @@
+# tools/cache.py
+"""
+Shared result cache for agent tool calls.
+
+Tools that hit external APIs (Basescan) are wrapped with @cached_tool(ttl):
+identical calls within `ttl` seconds are answered from memory, the least recently
+used entries are evicted beyond TOOL_CACHE_SIZE, and concurrent identical calls
+are coalesced so only one of them goes over the network (single flight). Error
+results and exceptions are never cached.
+"""
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from agent.config import TOOL_CACHE_SIZE
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with per-entry expiry and single-flight computation.
+    Keys are tuples whose first item is a namespace (the tool name); hit/miss
+    counts are kept per namespace.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict() # key -> (expires_at, value)
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self.evictions = 0
+
+    def _count(self, key, field: str) -> None:
+        counts = self._counts.setdefault(key[0], {"hits": 0, "misses": 0, "coalesced": 0, "expired": 0})
+        counts[field] += 1
+
+    def get_or_compute(self, key: tuple, compute: Callable[[], Any], ttl: float,
+                       cacheable: Optional[Callable[[Any], bool]] = None):
+        """
+        Returns the cached value for `key`, or runs `compute` once for all
+        concurrent callers and caches its result for `ttl` seconds (when
+        `cacheable(result)` allows it). Exceptions reach every waiting caller.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                if item[0] > time.monotonic():
+                    self._data.move_to_end(key)
+                    self._count(key, "hits")
+                    return item[1]
+                del self._data[key]
+                self._count(key, "expired")
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self._count(key, "misses")
+            else:
+                self._count(key, "coalesced")
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            flight.value = value
+            if ttl > 0 and (cacheable is None or cacheable(value)):
+                with self._lock:
+                    self._data[key] = (time.monotonic() + ttl, value)
+                    self._data.move_to_end(key)
+                    while len(self._data) > self.maxsize:
+                        self._data.popitem(last=False)
+                        self.evictions += 1
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def invalidate(self, namespace: Optional[str] = None) -> int:
+        """Drops every entry (or only `namespace`'s). Returns the number removed."""
+        with self._lock:
+            keys = [k for k in self._data if namespace is None or k[0] == namespace]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            per_tool = {name: dict(counts) for name, counts in self._counts.items()}
+            served = sum(c["hits"] + c["coalesced"] for c in per_tool.values()) # Answered without a call of their own
+            lookups = sum(c["hits"] + c["misses"] + c["coalesced"] for c in per_tool.values())
+            return {
+                "entries": len(self._data),
+                "maxsize": self.maxsize,
+                "in_flight": len(self._inflight),
+                "evictions": self.evictions,
+                "hit_rate": round(served / lookups, 4) if lookups else None,
+                "tools": per_tool,
+            }
+
+
+TOOL_CACHE = TTLCache(TOOL_CACHE_SIZE)
+
+
+def _not_an_error(result) -> bool:
+    # Tools report failures as "Error: ..." strings; those must be retried, not replayed
+    return result is not None and not (isinstance(result, str) and result.startswith("Error"))
+
+
+def cached_tool(ttl: float, key: Optional[Callable[..., tuple]] = None, cache: Optional[TTLCache] = None):
+    """
+    Caches a tool function's results in `cache` (default TOOL_CACHE) for `ttl` seconds (0 disables).
+    Calls are keyed on their (hashable) bound arguments with defaults applied, so
+    f("x") and f("x", 5) share an entry; `key(*args, **kwargs)` overrides that
+    (e.g. to lower-case addresses). The wrapper keeps the function's name,
+    docstring and signature, so it registers as a tool like the plain function.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if key is not None:
+                call_key = (func.__name__,) + tuple(key(*args, **kwargs))
+            else:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                call_key = (func.__name__,) + tuple(bound.arguments.items())
+            return (cache if cache is not None else TOOL_CACHE).get_or_compute(
+                call_key, lambda: func(*args, **kwargs), ttl, cacheable=_not_an_error
+            )
+
+        return wrapper
+
+    return decorator
@@ -1,21 +1,61 @@
-import json
 import os
-from typing import List, Dict, Optional
+from typing import Callable, Iterable, List, Dict, Optional
+
+from agent.tools.contract_store import CachedContractStore, JsonContractStore, SqliteContractStore
 
 CONTRACTS_FILE = os.path.join(os.path.dirname(__file__), "contracts.json")
+# "json" (default, contracts.json) or "sqlite" (CONTRACTS_DB, better for very large registries)
+CONTRACT_STORE_BACKEND = os.getenv("CONTRACT_STORE_BACKEND", "json").lower()
+CONTRACTS_DB = os.getenv("CONTRACTS_DB", os.path.join(os.path.dirname(__file__), "contracts.db"))
 
-def load_contracts() -> Dict[str, dict]:
-    if not os.path.exists(CONTRACTS_FILE):
-        return {}
-    with open(CONTRACTS_FILE, "r") as f:
+_store: Optional[CachedContractStore] = None
+
+# Callbacks fired after every write, for in-process consumers such as the listener.
+# Writers in other processes are picked up by polling contracts_version() instead.
+_change_listeners: List[Callable[[], None]] = []
+
+def get_store() -> CachedContractStore:
+    """The configured registry backend, created on first use (and again if the path changes)."""
+    global _store
+    if CONTRACT_STORE_BACKEND == "sqlite":
+        if not isinstance(_store, SqliteContractStore) or _store.path != CONTRACTS_DB:
+            _store = SqliteContractStore(CONTRACTS_DB)
+    elif not isinstance(_store, JsonContractStore) or _store.path != CONTRACTS_FILE:
+        _store = JsonContractStore(CONTRACTS_FILE)
+    return _store
+
+def subscribe_changes(callback: Callable[[], None]) -> Callable[[], None]:
+    """Registers a no-argument callback run after each save. Returns an unsubscribe function."""
+    _change_listeners.append(callback)
+    return lambda: _change_listeners.remove(callback)
+
+def contracts_version():
+    """Cheap change token for the store; changes whenever any process writes to it."""
+    return get_store().version()
+
+def _notify_changed() -> None:
+    for callback in list(_change_listeners):
         try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            return {}
+            callback()
+        except Exception as e:
+            print(f"Warning: contract change listener failed: {e}")
+
+def _record(abi_path, events_to_track, actions, client_id, extra_info) -> dict:
+    return {
+        "abi_path": abi_path,
+        "tracked_events": events_to_track,
+        "actions": actions,
+        "client_id": client_id,
+        "extra_info": extra_info or {}
+    }
+
+def load_contracts() -> Dict[str, dict]:
+    # Copy of the cached registry: only re-parsed when the store changed on disk
+    return dict(get_store().contracts())
 
 def save_contracts(contracts: Dict[str, dict]) -> None:
-    with open(CONTRACTS_FILE, "w") as f:
-        json.dump(contracts, f, indent=2)
+    get_store().apply(contracts, replace=True)
+    _notify_changed()
 
 def add_or_update_contract(
     contract_address: str,
@@ -26,38 +66,48 @@ def add_or_update_contract(
     extra_info: Optional[dict] = None
 ) -> str:
     contract_address = contract_address.lower()
-    contracts = load_contracts()
-    contracts[contract_address] = {
-        "abi_path": abi_path,
-        "tracked_events": events_to_track,
-        "actions": actions,
-        "client_id": client_id,
-        "extra_info": extra_info or {}
-    }
-    save_contracts(contracts)
+    get_store().apply({contract_address: _record(abi_path, events_to_track, actions, client_id, extra_info)})
+    _notify_changed()
     return f"Contract {contract_address} added/updated for client {client_id}."
 
+def add_or_update_contracts(entries: Iterable[dict]) -> int:
+    """
+    Batched upsert: one locked, atomic write for many contracts. Each entry takes the
+    add_or_update_contract keyword arguments. Returns the number of contracts written.
+    """
+    upserts = {}
+    for entry in entries:
+        upserts[entry["contract_address"].lower()] = _record(
+            entry["abi_path"],
+            entry["events_to_track"],
+            entry["actions"],
+            entry.get("client_id"),
+            entry.get("extra_info")
+        )
+    if upserts:
+        get_store().apply(upserts)
+        _notify_changed()
+    return len(upserts)
+
 def remove_contract(contract_address: str) -> str:
     contract_address = contract_address.lower()
-    contracts = load_contracts()
-    if contract_address in contracts:
-        del contracts[contract_address]
-        save_contracts(contracts)
+    if get_store().apply({}, removals=[contract_address]):
+        _notify_changed()
         return f"Contract {contract_address} removed."
     else:
         return f"Contract {contract_address} not found."
 
 def list_contracts(client_id: Optional[str] = None) -> List[dict]:
-    contracts = load_contracts()
+    store = get_store()
+    contracts = store.contracts() if client_id is None else store.by_client(client_id)
     result = []
     for addr, data in contracts.items():
-        if client_id is None or data.get("client_id") == client_id:
-            entry = {"address": addr}
-            entry.update(data)
-            result.append(entry)
+        entry = {"address": addr}
+        entry.update(data)
+        result.append(entry)
     return result
 
 def get_contract(contract_address: str) -> Optional[dict]:
     contract_address = contract_address.lower()
-    contracts = load_contracts()
-    return contracts.get(contract_address)
\ No newline at end of file
+    data = get_store().contracts().get(contract_address)
+    return dict(data) if data is not None else None
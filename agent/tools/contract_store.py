@@ -0,0 +1,186 @@
+# tools/contract_store.py
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from agent.tools.utils import atomic_write_json, file_lock
+
+
+def _index_by_client(contracts: Dict[str, dict]) -> Dict[Optional[str], Dict[str, dict]]:
+    index: Dict[Optional[str], Dict[str, dict]] = {}
+    for addr, data in contracts.items():
+        index.setdefault(data.get("client_id"), {})[addr] = data
+    return index
+
+
+def _patch_index(index, previous: Dict[str, dict], upserts: Dict[str, dict], removed: List[str]):
+    """
+    Copy of a by-client index with only the touched clients' maps rebuilt, so
+    a write costs the size of the change, not of the registry. Dicts handed
+    out by earlier reads are never mutated.
+    """
+    index = dict(index)
+    copied = set()
+    dropped = set(removed)
+
+    def client_map(client_id):
+        if client_id not in copied:
+            index[client_id] = dict(index.get(client_id, {}))
+            copied.add(client_id)
+        return index[client_id]
+
+    for addr in list(upserts) + removed:
+        if addr in previous:
+            client_map(previous[addr].get("client_id")).pop(addr, None)
+    for addr, data in upserts.items():
+        if addr not in dropped:
+            client_map(data.get("client_id"))[addr] = data
+    return {client_id: m for client_id, m in index.items() if m}
+
+
+class CachedContractStore:
+    """
+    Shared caching logic for contract registry backends.
+    Reads are served from memory until the backend's version token changes
+    (another process or thread wrote), so repeated lookups cost one stat/query
+    instead of a full parse. Writes go through apply(), which is atomic and
+    takes an exclusive lock so concurrent CLI / API server writers cannot
+    lose each other's updates.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._version = object() # Never equal to a real version: first read always loads
+        self._contracts: Dict[str, dict] = {}
+        self._by_client: Dict[Optional[str], Dict[str, dict]] = {}
+        self._lock = threading.RLock()
+
+    # --- Backend hooks ---
+    def version(self):
+        raise NotImplementedError
+
+    def _load_all(self) -> Dict[str, dict]:
+        raise NotImplementedError
+
+    def _commit(self, contracts: Dict[str, dict], upserts: Dict[str, dict], removals: List[str]) -> None:
+        raise NotImplementedError
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        yield
+
+    # --- Cached reads ---
+    def contracts(self) -> Dict[str, dict]:
+        with self._lock:
+            version = self.version()
+            if version != self._version:
+                self._contracts = self._load_all()
+                self._by_client = _index_by_client(self._contracts)
+                self._version = version
+            return self._contracts
+
+    def by_client(self, client_id: Optional[str]) -> Dict[str, dict]:
+        with self._lock:
+            self.contracts()
+            return self._by_client.get(client_id, {})
+
+    # --- Writes ---
+    def apply(self, upserts: Dict[str, dict], removals: Iterable[str] = (), replace: bool = False) -> List[str]:
+        """
+        Upserts and removes records in one atomic write. With replace=True the
+        store is rewritten to exactly `upserts`. Returns the removed addresses.
+        """
+        with self._lock, self._exclusive():
+            previous = self.contracts() # Reloads only if another process wrote since our last read
+            contracts = {} if replace else dict(previous)
+            contracts.update(upserts)
+            if replace:
+                removed = [addr for addr in previous if addr not in contracts]
+            else:
+                removed = [addr for addr in removals if contracts.pop(addr, None) is not None]
+            self._commit(contracts, upserts, removed)
+            if replace:
+                self._by_client = _index_by_client(contracts)
+            else:
+                self._by_client = _patch_index(self._by_client, previous, upserts, removed)
+            self._contracts = contracts
+            self._version = self.version()
+            return removed
+
+
+class JsonContractStore(CachedContractStore):
+    """contracts.json backend: whole-file atomic rewrite (temp file + rename) under flock."""
+
+    def version(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        # The inode changes on every atomic rename, so this catches same-size rewrites
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _load_all(self) -> Dict[str, dict]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                return {}
+
+    def _exclusive(self):
+        return file_lock(self.path)
+
+    def _commit(self, contracts, upserts, removals):
+        # Readers see either the old or the new file, never a partial one
+        atomic_write_json(self.path, contracts, indent=2)
+
+
+class SqliteContractStore(CachedContractStore):
+    """SQLite backend: row-level upserts, indexed by client_id, change counter in a meta table."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS contracts (
+                address TEXT PRIMARY KEY,
+                client_id TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_contracts_client_id ON contracts (client_id);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+        """)
+
+    def version(self):
+        return self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def _load_all(self) -> Dict[str, dict]:
+        rows = self._conn.execute("SELECT address, data FROM contracts").fetchall()
+        return {addr: json.loads(data) for addr, data in rows}
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        # BEGIN IMMEDIATE takes the database write lock up front (cross-process)
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        else:
+            self._conn.execute("COMMIT")
+
+    def _commit(self, contracts, upserts, removals):
+        self._conn.executemany(
+            "INSERT INTO contracts (address, client_id, data) VALUES (?, ?, ?) "
+            "ON CONFLICT(address) DO UPDATE SET client_id = excluded.client_id, data = excluded.data",
+            [(addr, data.get("client_id"), json.dumps(data)) for addr, data in upserts.items()],
+        )
+        self._conn.executemany("DELETE FROM contracts WHERE address = ?", [(addr,) for addr in removals])
+        self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
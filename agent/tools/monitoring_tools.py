@@ -1,14 +1,16 @@
 # tools/monitoring_tools.py
 import json
 import os
+from agent.tools import contract_manager
 from agent.tools.utils import fetch_and_save_abi
-from agent.config import BASESCAN_API_KEY
-from langchain.tools import tool
+from agent.config import ABI_DIR, BASESCAN_API_KEY
+from agent.event_store import format_event
 
-# --- In-memory simulation - NEEDS PROPER IPC FOR SEPARATE PROCESSES ---
-from agent.background_listener import TRACKING_TARGETS, RECENT_EVENTS_LOG, ABI_DIR
+# Plain functions: agent.tools.registry wraps them as LLM tools when the agent registers
+# them, so the CLI and api_server can call them without loading the LLM stack.
+# Targets live in the contract store (shared by every process); RECENT_EVENTS is filled by
+# the in-process listener, or mirrored over the event bus when the listener runs separately
 
-@tool
 def add_contract_tracking_target(
     contract_address: str,
     abi_filename: str,
@@ -21,8 +23,8 @@ def add_contract_tracking_target(
         contract_address (str): The Base network contract address ('0x...').
         abi_filename (str): The filename of the ABI JSON file located in the ABI directory (e.g., 'MyToken.json').
         events_to_track (list[str]): A list of exact event names from the ABI to monitor (e.g., ['Transfer', 'Approval']).
-        actions (list[str]): A list of action identifiers to trigger (e.g., ['log_event', 'check_value']). Defaults to ['log_event'].
-    Returns a success or error message. The listener needs a restart or dynamic update mechanism to apply changes.
+        actions (list[str]): A list of action identifiers to trigger (e.g., ['log_event', 'check_value']; 'track_holders' keeps a holder ledger of an ERC20 token for get_token_holders). Defaults to ['log_event'].
+    Returns a success or error message. A running listener picks up the change within a fraction of a second.
     """
     address_lower = contract_address.lower()
     if not contract_address or not contract_address.startswith("0x") or len(contract_address) != 42:
@@ -35,7 +37,7 @@ def add_contract_tracking_target(
     abi_path = os.path.join(ABI_DIR, abi_filename)
     if not os.path.exists(abi_path):
         try:
-            print(f"ABI file not found at {abi_path}. Attempting to fetch from Basescan...")
+            print(f"ABI file not found at {abi_path}. Looking it up in the ABI store / Basescan...")
             fetched_path = fetch_and_save_abi(contract_address, BASESCAN_API_KEY, ABI_DIR)
             abi_path = fetched_path
             print(f"Successfully fetched and saved ABI to {abi_path}")
@@ -43,57 +45,121 @@ def add_contract_tracking_target(
             return f"Error: ABI file not found and failed to fetch from Basescan: {e}"
 
     # Check if actions are valid (simple check against known keys)
-    from background_listener import ACTION_DISPATCHER # Needs access to action keys
+    from agent.background_listener import ACTION_DISPATCHER # Needs access to action keys
     valid_actions = list(ACTION_DISPATCHER.keys())
     invalid_actions = [a for a in actions if a not in valid_actions]
     if invalid_actions:
         return f"Error: Invalid action(s) specified: {invalid_actions}. Valid actions are: {valid_actions}"
 
 
-    # --- SIMULATED UPDATE ---
-    # In production: Send message via IPC to listener process
-    print(f"[Tool Simulation] Updating tracking target: {address_lower}")
-    TRACKING_TARGETS[address_lower] = {
-        "abi_path": abi_path,
-        "tracked_events": events_to_track,
-        "actions": actions
-    }
-    # --- END SIMULATION ---
+    # Persisting to the contract store is what reaches the listener: it is notified
+    # in-process and polls the store for writes from other processes
+    existing = contract_manager.get_contract(address_lower) or {}
+    contract_manager.add_or_update_contract(
+        contract_address=address_lower,
+        abi_path=abi_path,
+        events_to_track=events_to_track,
+        actions=actions,
+        client_id=existing.get("client_id"),
+        extra_info=existing.get("extra_info")
+    )
 
-    return f"Success: Added/Updated tracking for contract {contract_address} targeting events {events_to_track} with actions {actions}. Listener restart/update may be needed."
+    return f"Success: Added/Updated tracking for contract {contract_address} targeting events {events_to_track} with actions {actions}. The running listener will apply it automatically."
 
 
-@tool
 def list_tracked_targets() -> str:
     """
     Lists the contracts currently configured for tracking by the background listener.
     Returns a JSON string representation of the tracked targets or a message if none are tracked.
     """
-     # --- SIMULATED READ ---
-    print("[Tool Simulation] Reading tracking targets")
-    if not TRACKING_TARGETS:
+    targets = contract_manager.load_contracts()
+    if not targets:
         return "No contracts are currently configured for tracking."
-    # Make it JSON serializable (convert complex objects if any)
-    serializable_targets = json.dumps(TRACKING_TARGETS, indent=2)
-     # --- END SIMULATION ---
-    return serializable_targets
+    return json.dumps(targets, indent=2)
 
-@tool
-def get_recent_tracked_events(count: int = 10) -> str:
+def get_recent_tracked_events(count: int = 10, contract_address: str = "", event_name: str = "", client_id: str = "", as_json: bool = False) -> str:
     """
     Retrieves the most recent events detected and logged by the background listener.
     Args:
         count (int): The maximum number of recent events to retrieve (default 10).
-    Returns a list of log strings or a message if no events have been logged recently.
+        contract_address (str): Only return events from this contract address (optional).
+        event_name (str): Only return events with this name, e.g. 'Transfer' (optional).
+        client_id (str): Only return events for contracts owned by this client (optional).
+        as_json (bool): Return a JSON array of structured events (exact args, hashes, block numbers) instead of log lines.
+    Returns a list of log strings (or JSON) or a message if no events have been logged recently.
     """
-    # --- SIMULATED READ ---
-    print(f"[Tool Simulation] Reading last {count} logged events")
-    if not RECENT_EVENTS_LOG:
+    from agent.background_listener import RECENT_EVENTS
+    if not len(RECENT_EVENTS):
         return "No events detected recently by the listener."
-    # Get the last 'count' items
-    start_index = max(0, len(RECENT_EVENTS_LOG) - count)
-    recent_logs = RECENT_EVENTS_LOG[start_index:]
-     # --- END SIMULATION ---
-    # Return as newline-separated string for readability, or JSON
+    recent_events, _ = RECENT_EVENTS.query(
+        address=contract_address or None,
+        event=event_name or None,
+        client_id=client_id or None,
+        limit=count
+    )
+    if as_json:
+        from agent.event_record import records_json
+        return records_json(reversed(recent_events))
+    # Oldest first, newline-separated for readability
+    recent_logs = [format_event(e) for e in reversed(recent_events)]
     return "\n".join(recent_logs) if recent_logs else "No events found in log."
 
+def get_token_holders(
+    token_address: str,
+    min_balance: str = "1",
+    block_number: int = 0,
+    held_since_block: int = 0,
+    active_from_block: int = 0,
+    active_to_block: int = 0,
+    top: int = 20,
+    save_csv: bool = False
+) -> str:
+    """
+    Airdrop snapshot from the holder ledger of a tracked ERC20 token (needs the 'track_holders' action).
+    Args:
+        token_address (str): The token contract address ('0x...').
+        min_balance (str): Minimum balance in raw token units, as a decimal string (default '1').
+        block_number (int): Snapshot block (0 = latest).
+        held_since_block (int): Also require min_balance at this earlier block (0 = no requirement).
+        active_from_block (int): Require a transfer at or after this block (0 = no requirement).
+        active_to_block (int): Require a transfer at or before this block (0 = no requirement).
+        top (int): How many of the largest holders to list (default 20).
+        save_csv (bool): Also write every eligible holder to a CSV file and return its path.
+    Returns a JSON summary: number of eligible holders, their total balance and the largest ones.
+    """
+    from agent.holder_ledger import HOLDER_LEDGERS
+    if not token_address or not token_address.startswith("0x") or len(token_address) != 42:
+        return f"Error: Invalid token address format: {token_address}."
+    try:
+        threshold = int(min_balance)
+    except (TypeError, ValueError):
+        return f"Error: min_balance must be an integer amount of raw token units, got {min_balance!r}."
+    if token_address.lower() not in HOLDER_LEDGERS.tokens():
+        return f"Error: No holder ledger for {token_address}. Track its Transfer event with the 'track_holders' action first."
+
+    ledger = HOLDER_LEDGERS.ledger(token_address)
+    holders = ledger.holders(
+        threshold,
+        block=block_number or None,
+        held_since=held_since_block or None,
+        active_from=active_from_block or None,
+        active_to=active_to_block or None
+    )
+    stats = ledger.stats()
+    summary = {
+        "token": token_address.lower(),
+        "block": block_number or stats["head_block"],
+        "eligible_holders": len(holders),
+        "total_balance": str(sum(balance for _, balance in holders)),
+        "top_holders": {address: str(balance) for address, balance in holders[:max(0, top)]},
+        "ledger_transfers": stats["transfers"],
+    }
+    if save_csv:
+        export_dir = os.path.join(HOLDER_LEDGERS.directory, "exports")
+        os.makedirs(export_dir, exist_ok=True)
+        path = os.path.join(export_dir, f"{token_address.lower()}-{summary['block']}-{threshold}.csv")
+        with open(path, "w") as f:
+            f.write("address,balance\n")
+            f.writelines(f"{address},{balance}\n" for address, balance in holders)
+        summary["csv_path"] = path
+    return json.dumps(summary, indent=2)
@@ -0,0 +1,37 @@
+# tools/registry.py
+"""
+Agent tools by name. Tool modules only define plain functions; the module is
+imported and the function wrapped as a langchain tool the first time the agent
+registers it, so nothing that merely calls a tool (add_contract.py, api_server)
+pays for the LLM stack, and unused tools never load their dependencies.
+"""
+import importlib
+from typing import Dict, Iterable, List
+
+# Tool name -> module defining a function of the same name
+TOOL_MODULES: Dict[str, str] = {
+    "add_contract_tracking_target": "agent.tools.monitoring_tools",
+    "list_tracked_targets": "agent.tools.monitoring_tools",
+    "get_recent_tracked_events": "agent.tools.monitoring_tools",
+    "get_token_holders": "agent.tools.monitoring_tools",
+    "get_base_native_balance": "agent.tools.base_tools",
+    "get_base_native_balances": "agent.tools.base_tools",
+    "get_latest_tweets_from_user": "agent.tools.x_tools",
+}
+MONITORING_TOOLS = ["add_contract_tracking_target", "list_tracked_targets", "get_recent_tracked_events", "get_token_holders"]
+
+_loaded: Dict[str, object] = {}
+
+
+def load_tool(name: str):
+    """The langchain tool for `name`, built once per process."""
+    loaded = _loaded.get(name)
+    if loaded is None:
+        from langchain.tools import tool
+        func = getattr(importlib.import_module(TOOL_MODULES[name]), name)
+        loaded = _loaded[name] = tool(func)
+    return loaded
+
+
+def load_tools(names: Iterable[str]) -> List[object]:
+    return [load_tool(name) for name in names]
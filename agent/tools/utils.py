@@ -1,32 +1,58 @@
+import contextlib
 import os
 import json
-import requests
+import tempfile
+
+try:
+    import fcntl
+except ImportError: # Windows: fall back to in-process locking only
+    fcntl = None
+
+@contextlib.contextmanager
+def file_lock(path: str):
+    """
+    Exclusive advisory lock on `path` + ".lock", held across processes for the
+    duration of the block (a no-op where flock is unavailable).
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def atomic_write_json(path: str, data, **dump_kwargs) -> None:
+    """
+    Writes JSON to a temp file in the same directory, fsyncs it and renames it over
+    `path`, so readers only ever see the old or the new content.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
 
 def fetch_and_save_abi(contract_address: str, api_key: str, abi_dir: str) -> str:
     """
-    Fetches the verified contract ABI from Basescan and saves it to a file.
+    Fetches the verified contract ABI from Basescan and saves it to the content-addressed
+    ABI store (see tools/abi_store.py); an ABI already stored for the address is reused.
     Returns the path to the saved ABI JSON file.
     Raises an exception if fetching fails.
     """
-    url = f"https://api.basescan.org/api"
-    params = {
-        "module": "contract",
-        "action": "getabi",
-        "address": contract_address,
-        "apikey": api_key
-    }
-    response = requests.get(url, params=params, timeout=10)
-    if response.status_code != 200:
-        raise RuntimeError(f"Basescan API request failed with status {response.status_code}")
-    data = response.json()
-    if data.get("status") != "1":
-        raise RuntimeError(f"Basescan API error: {data.get('result')}")
-    abi_json = json.loads(data["result"])
-
-    # Save ABI to file
-    os.makedirs(abi_dir, exist_ok=True)
-    filename = f"abi_{contract_address.lower()}.json"
-    filepath = os.path.join(abi_dir, filename)
-    with open(filepath, "w") as f:
-        json.dump(abi_json, f, indent=2)
-    return filepath
\ No newline at end of file
+    from agent.tools.abi_store import fetch_and_save_abis
+    result = fetch_and_save_abis([contract_address], api_key, abi_dir)[contract_address.lower()]
+    if isinstance(result, Exception):
+        raise result
+    return result
@@ -0,0 +1,425 @@
+# tools/x_ingest.py
+"""
+Incremental X timeline ingestion behind the X tools.
+
+Usernames are resolved to user IDs 100 at a time and the IDs are kept in the
+tweet store, so a handle costs one lookup per X_USER_CACHE_TTL. Timelines are
+polled with since_id, so a poll only transfers tweets newer than the newest one
+stored; a catch-up longer than max_pages pages is resumed from its pagination
+token by the next poll, and since_id only moves once it is complete. Each account has its own poll interval: halved after a poll that found
+new tweets, grown by half after one that did not (between X_POLL_MIN_INTERVAL
+and X_POLL_MAX_INTERVAL), so quiet accounts stop eating into the rate limit.
+Tweets are kept in a local SQLite cache that get_latest_tweets_from_user reads.
+
+Usage (background polling without the agent):
+    python -m agent.tools.x_ingest project_a project_b [--once]
+
+The client is anything with tweepy.Client's get_users / get_users_tweets
+(returning objects with .data / .errors / .meta), so a stub can stand in for it.
+"""
+import argparse
+import json
+import random
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+USERS_PER_LOOKUP = 100 # GET /2/users/by accepts up to 100 usernames
+MAX_RESULTS = 100 # Timeline page size cap (the API minimum is 5)
+TWEET_FIELDS = ["created_at", "public_metrics"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS x_users (
+    username TEXT PRIMARY KEY, -- lowercase, without '@'
+    user_id INTEGER,           -- NULL: no such user
+    resolved_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS x_accounts (
+    user_id INTEGER PRIMARY KEY,
+    since_id INTEGER,
+    poll_interval REAL NOT NULL,
+    next_poll_at REAL NOT NULL,
+    polled_at REAL NOT NULL,
+    resume_token TEXT,         -- Set while a catch-up walk back to since_id is unfinished...
+    resume_newest INTEGER      -- ...and the newest tweet it has seen, since_id once it completes
+);
+CREATE TABLE IF NOT EXISTS x_tweets (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    created_at TEXT,
+    text TEXT,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_x_tweets_user ON x_tweets (user_id, id);
+"""
+
+
+def normalize_username(username: str) -> str:
+    return username.strip().lstrip("@").lower()
+
+
+def _rate_limit_reset(error: Exception) -> Optional[float]:
+    """Epoch seconds at which a rate-limited call may be retried, or None if `error` is not a rate limit."""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", getattr(response, "status", None))
+    if type(error).__name__ != "TooManyRequests" and status != 429:
+        return None
+    reset = (getattr(response, "headers", None) or {}).get("x-rate-limit-reset")
+    return float(reset) if reset else time.time() + 60
+
+
+def _tweet_row(user_id: int, tweet) -> tuple:
+    data = tweet if isinstance(tweet, dict) else (getattr(tweet, "data", None) or {"id": tweet.id, "text": tweet.text})
+    created_at = data.get("created_at")
+    return (int(data["id"]), user_id, str(created_at) if created_at else None, data.get("text"),
+            json.dumps(data, separators=(",", ":"), default=str))
+
+
+class RateLimited(RuntimeError):
+    def __init__(self, until: float):
+        super().__init__(f"X API rate limit reached, retry after {time.strftime('%H:%M:%S', time.localtime(until))}")
+        self.until = until
+
+
+class XClientUnavailable(RuntimeError):
+    def __init__(self):
+        super().__init__("X client not available")
+
+
+class TweetStore:
+    """
+    Resolved user IDs, per-account poll cursors and tweets in one SQLite file (WAL
+    mode), shared by the poller and the tool even when they run in different processes.
+    Only the newest `keep_per_user` tweets of an account are kept.
+    """
+
+    def __init__(self, path: str, keep_per_user: int = 200):
+        self.path = path
+        self.keep_per_user = keep_per_user
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened lazily so importing the X tools never touches the disk
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(x_accounts)")}
+            for column, kind in (("resume_token", "TEXT"), ("resume_newest", "INTEGER")):
+                if column not in columns: # Stores created before catch-ups could be resumed
+                    conn.execute(f"ALTER TABLE x_accounts ADD COLUMN {column} {kind}")
+            self._conn = conn
+        return self._conn
+
+    def user_ids(self, usernames: Iterable[str], max_age: float) -> Dict[str, Optional[int]]:
+        """Cached username -> user ID (None: no such user) for entries resolved within `max_age` seconds."""
+        usernames = list(usernames)
+        if not usernames:
+            return {}
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT username, user_id FROM x_users WHERE resolved_at >= ? AND username IN ({','.join('?' * len(usernames))})",
+                [time.time() - max_age] + usernames,
+            ).fetchall()
+        return dict(rows)
+
+    def save_user_ids(self, user_ids: Dict[str, Optional[int]]) -> None:
+        now = time.time()
+        with self._lock, self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO x_users (username, user_id, resolved_at) VALUES (?, ?, ?)",
+                [(username, user_id, now) for username, user_id in user_ids.items()],
+            )
+
+    def account(self, user_id: int) -> Optional[dict]:
+        fields = ("since_id", "poll_interval", "next_poll_at", "polled_at", "resume_token", "resume_newest")
+        with self._lock:
+            row = self._connection().execute(
+                f"SELECT {', '.join(fields)} FROM x_accounts WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(fields, row))
+
+    def save_poll(self, user_id: int, tweets: List[tuple], since_id: Optional[int],
+                  poll_interval: float, next_poll_at: float,
+                  resume_token: Optional[str] = None, resume_newest: Optional[int] = None) -> None:
+        """Stores a poll's tweets and the account's new cursor in one transaction."""
+        with self._lock, self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO x_tweets (id, user_id, created_at, text, payload) VALUES (?, ?, ?, ?, ?)", tweets
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO x_accounts "
+                "(user_id, since_id, poll_interval, next_poll_at, polled_at, resume_token, resume_newest) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, since_id, poll_interval, next_poll_at, time.time(), resume_token, resume_newest),
+            )
+            if tweets:
+                conn.execute(
+                    "DELETE FROM x_tweets WHERE user_id = ? AND id < "
+                    "(SELECT MIN(id) FROM (SELECT id FROM x_tweets WHERE user_id = ? ORDER BY id DESC LIMIT ?))",
+                    (user_id, user_id, self.keep_per_user),
+                )
+
+    def latest(self, user_id: int, count: int) -> List[dict]:
+        """The account's newest `count` cached tweets, newest first."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT id, created_at, text FROM x_tweets WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, count)
+            ).fetchall()
+        return [{"id": str(tweet_id), "created_at": created_at, "text": text} for tweet_id, created_at, text in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class XIngestor:
+    """
+    Resolves usernames and polls timelines incrementally into a TweetStore.
+    poll_due() polls the accounts whose interval has elapsed; refresh() polls one
+    account on demand unless it was polled within `max_age` seconds. A rate limit
+    pauses all polling until the window resets. A first poll fetches `initial_count`
+    tweets (or what refresh() asks for, up to a page of MAX_RESULTS).
+    """
+
+    def __init__(self, store: TweetStore, client_factory: Callable[[], object],
+                 min_interval: float = 60.0, max_interval: float = 1800.0,
+                 user_cache_ttl: float = 7 * 24 * 3600, initial_count: int = 20, max_pages: int = 5):
+        self.store = store
+        self.client_factory = client_factory
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.user_cache_ttl = user_cache_ttl
+        self.initial_count = max(5, min(MAX_RESULTS, initial_count))
+        self.max_pages = max_pages
+        self.paused_until = 0.0
+        self._locks: Dict[int, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._stats_lock = threading.Lock() # paused_until and the counters: run() and tool calls share them
+        self.lookups = 0
+        self.timeline_requests = 0
+        self.polls = 0
+        self.new_tweets = 0
+        self.rate_limited = 0
+
+    def _client(self):
+        client = self.client_factory()
+        if client is None:
+            raise XClientUnavailable()
+        return client
+
+    def _call(self, func, **kwargs):
+        with self._stats_lock:
+            paused_until = self.paused_until
+        if time.time() < paused_until:
+            raise RateLimited(paused_until)
+        try:
+            return func(**kwargs)
+        except Exception as e:
+            reset = _rate_limit_reset(e)
+            if reset is None:
+                raise
+            with self._stats_lock:
+                self.rate_limited += 1
+                self.paused_until = paused_until = max(self.paused_until, reset)
+            raise RateLimited(paused_until) from e
+
+    # --- Usernames ---
+    def resolve(self, usernames: Iterable[str]) -> Dict[str, Optional[int]]:
+        """username -> user ID (None if the account does not exist), looking up only uncached names."""
+        usernames = list(dict.fromkeys(normalize_username(u) for u in usernames))
+        resolved = self.store.user_ids(usernames, self.user_cache_ttl)
+        missing = [u for u in usernames if u not in resolved]
+        for i in range(0, len(missing), USERS_PER_LOOKUP):
+            batch = missing[i:i + USERS_PER_LOOKUP]
+            with self._stats_lock:
+                self.lookups += 1
+            response = self._call(self._client().get_users, usernames=batch)
+            found = {normalize_username(user.username): int(user.id) for user in (response.data or [])}
+            # Names missing from the reply (suspended, renamed, never existed) are remembered as None
+            looked_up = {username: found.get(username) for username in batch}
+            self.store.save_user_ids(looked_up)
+            resolved.update(looked_up)
+        return resolved
+
+    # --- Timelines ---
+    def _lock(self, user_id: int) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(user_id, threading.Lock())
+
+    def poll(self, user_id: int) -> int:
+        """Fetches the account's tweets since its cursor. Returns how many were new."""
+        with self._lock(user_id):
+            return self._poll(user_id)
+
+    def _poll(self, user_id: int, count: int = 0) -> int:
+        account = self.store.account(user_id)
+        since_id = account["since_id"] if account else None
+        resume_token = account["resume_token"] if since_id else None
+        params = {"id": user_id, "tweet_fields": TWEET_FIELDS}
+        if since_id:
+            params.update(since_id=since_id, max_results=MAX_RESULTS)
+            if resume_token:
+                params["pagination_token"] = resume_token # Where the last poll's catch-up stopped
+        else:
+            # First poll: recent tweets only, no history walk
+            params["max_results"] = min(MAX_RESULTS, max(count, self.initial_count))
+        client = self._client()
+        tweets = []
+        newest = account["resume_newest"] if resume_token else since_id
+        next_token = None
+        for _ in range(self.max_pages):
+            with self._stats_lock:
+                self.timeline_requests += 1
+            response = self._call(client.get_users_tweets, **params)
+            meta = response.meta or {}
+            tweets.extend(_tweet_row(user_id, tweet) for tweet in (response.data or []))
+            if meta.get("newest_id"):
+                newest = max(newest or 0, int(meta["newest_id"]))
+            next_token = meta.get("next_token") if since_id else None
+            if not next_token:
+                break
+            params["pagination_token"] = next_token # Catching up on more than a page since the last poll
+        if tweets:
+            newest = max(newest or 0, max(row[0] for row in tweets))
+
+        interval = account["poll_interval"] if account else self.min_interval
+        if next_token:
+            # Stopped at max_pages with older tweets still unread: since_id stays put until
+            # the walk gets back to it, or those tweets would never be fetched
+            interval, cursor, resume_newest = self.min_interval, since_id, newest
+        else:
+            if tweets and account:
+                interval = max(self.min_interval, interval / 2)
+            elif account:
+                interval = min(self.max_interval, interval * 1.5)
+            cursor, resume_newest = newest, None
+        next_poll_at = time.time() + interval * random.uniform(0.9, 1.1) # Jitter keeps accounts from polling in lockstep
+        self.store.save_poll(user_id, tweets, cursor, interval, next_poll_at, next_token, resume_newest)
+        with self._stats_lock:
+            self.polls += 1
+            self.new_tweets += len(tweets)
+        return len(tweets)
+
+    def refresh(self, username: str, max_age: float, count: int = 0) -> Optional[int]:
+        """
+        Resolves `username` and polls it unless it was polled within `max_age` seconds;
+        a first poll fetches at least `count` tweets (at most MAX_RESULTS). Returns the user ID.
+        """
+        user_id = self.resolve([username]).get(normalize_username(username))
+        if user_id is None:
+            return None
+        with self._lock(user_id):
+            account = self.store.account(user_id)
+            if account is None or time.time() - account["polled_at"] >= max_age:
+                self._poll(user_id, count)
+        return user_id
+
+    def poll_due(self, usernames: Iterable[str]) -> int:
+        """Polls the accounts among `usernames` whose interval has elapsed, most overdue first. Returns new tweets."""
+        user_ids = [uid for uid in self.resolve(usernames).values() if uid is not None]
+        now = time.time()
+        due = []
+        for user_id in user_ids:
+            account = self.store.account(user_id)
+            next_poll_at = account["next_poll_at"] if account else 0.0
+            if next_poll_at <= now:
+                due.append((next_poll_at, user_id))
+        new = 0
+        for _, user_id in sorted(due):
+            new += self.poll(user_id)
+        return new
+
+    def next_due(self, usernames: Iterable[str]) -> float:
+        """Epoch seconds of the next scheduled poll among `usernames` (already resolved ones)."""
+        resolved = self.store.user_ids([normalize_username(u) for u in usernames], self.user_cache_ttl)
+        times = [
+            (self.store.account(uid) or {}).get("next_poll_at", 0.0) for uid in resolved.values() if uid is not None
+        ]
+        with self._stats_lock:
+            paused_until = self.paused_until
+        return max(min(times, default=time.time() + self.min_interval), paused_until)
+
+    def run(self, usernames: List[str], stop: Optional[threading.Event] = None) -> None:
+        """Polls `usernames` on their adaptive schedule until `stop` is set (run it in a thread)."""
+        stop = stop or threading.Event()
+        print(f"X ingestion: polling {len(usernames)} account(s).")
+        while not stop.is_set():
+            try:
+                new = self.poll_due(usernames)
+                if new:
+                    print(f"X ingestion: {new} new tweet(s).")
+            except RateLimited as e:
+                print(f"X ingestion: {e}.")
+            except Exception as e:
+                print(f"X ingestion Error: {e}")
+                stop.wait(self.min_interval)
+                continue
+            stop.wait(max(1.0, self.next_due(usernames) - time.time()))
+
+    def cached(self, username: str, count: int) -> Tuple[Optional[int], List[dict], Optional[float]]:
+        """(user ID, newest `count` cached tweets, time of the last poll) without calling the API."""
+        user_id = self.store.user_ids([normalize_username(username)], float("inf")).get(normalize_username(username))
+        if user_id is None:
+            return None, [], None
+        account = self.store.account(user_id)
+        return user_id, self.store.latest(user_id, count), account["polled_at"] if account else None
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "user_lookups": self.lookups,
+                "timeline_requests": self.timeline_requests,
+                "polls": self.polls,
+                "new_tweets": self.new_tweets,
+                "rate_limited": self.rate_limited,
+                "paused_until": self.paused_until if self.paused_until > time.time() else None,
+            }
+
+
+def _build_ingestor() -> XIngestor:
+    from agent.config import (
+        X_TWEETS_DB, X_TWEETS_KEPT, X_POLL_MIN_INTERVAL, X_POLL_MAX_INTERVAL, X_USER_CACHE_TTL,
+        X_INITIAL_TWEETS, X_MAX_PAGES, get_x_client
+    )
+    return XIngestor(
+        TweetStore(X_TWEETS_DB, keep_per_user=X_TWEETS_KEPT), get_x_client,
+        min_interval=X_POLL_MIN_INTERVAL, max_interval=X_POLL_MAX_INTERVAL, user_cache_ttl=X_USER_CACHE_TTL,
+        initial_count=X_INITIAL_TWEETS, max_pages=X_MAX_PAGES,
+    )
+
+
+X_INGESTOR = _build_ingestor() # Process-wide: one store connection, one rate limit pause
+
+
+def main():
+    from agent.config import X_ACCOUNTS
+
+    parser = argparse.ArgumentParser(description="Poll X accounts into the local tweet cache.")
+    parser.add_argument("usernames", nargs="*", help="Accounts to poll (default: X_ACCOUNTS)")
+    parser.add_argument("--once", action="store_true", help="Poll the due accounts once and exit")
+    args = parser.parse_args()
+    usernames = args.usernames or X_ACCOUNTS
+    if not usernames:
+        print("X ingestion: no accounts given (arguments or X_ACCOUNTS).")
+        return
+    try:
+        if args.once:
+            print(f"X ingestion: {X_INGESTOR.poll_due(usernames)} new tweet(s).")
+        else:
+            X_INGESTOR.run(usernames)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        X_INGESTOR.store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,25 @@
 # tools/x_tools.py
 import json
-from langchain.tools import tool
-from agent.config import x_client  # Import the initialized client from config
+from agent.config import TWEETS_CACHE_TTL
+from agent.tools.x_ingest import X_INGESTOR, XClientUnavailable, normalize_username  # Client is created on the first poll
 
-@tool
 def get_latest_tweets_from_user(username: str, count: int = 5) -> str:
-    """Gets latest tweets from X user. Requires X client initialized in config."""
-    if not x_client:
+    """Gets latest tweets from X user. Requires X_BEARER_TOKEN to be configured."""
+    username = normalize_username(username)
+    count = max(1, min(100, int(count)))
+    error = None
+    try:
+        # Only polls when the account's cache is older than TWEETS_CACHE_TTL, and then only for tweets since the last one
+        if X_INGESTOR.refresh(username, TWEETS_CACHE_TTL, count) is None:
+            return f"Error: X user @{username} not found."
+    except XClientUnavailable:
         return "Error: X client not available."
-    # ... (rest of the tool implementation using x_client) ...
+    except Exception as e: # Rate limited or an API error: serve what is cached
+        error = str(e)
+    user_id, tweets, polled_at = X_INGESTOR.cached(username, count)
+    if user_id is None:
+        return f"Error fetching tweets for @{username}: {error}"
+    result = {"username": username, "user_id": str(user_id), "tweets": tweets, "polled_at": polled_at}
+    if error:
+        result["note"] = f"Served from cache, refresh failed: {error}"
+    return json.dumps(result)
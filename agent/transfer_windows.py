@@ -0,0 +1,475 @@
+# transfer_windows.py
+"""
+Streaming aggregation of ERC20 Transfer values per token and per client, with
+whale and volume-spike alerts (fed by the listener's "check_value" action).
+
+Windows are configured as TRANSFER_WINDOW_SPECS, e.g. "5m:5,1h:12,1d:1": a length
+and a number of slots. One slot is a tumbling window (the current fixed interval);
+more slots make a sliding window that moves one slot at a time. Every (key, window)
+keeps per slot: transfer count, volume in token units, a log-scale histogram of
+transfer sizes (for percentiles) and HyperLogLog registers (for unique senders).
+Time is measured in blocks (BLOCK_TIME seconds each), so replayed and backfilled
+transfers land in the window they belong to, and transfers older than a window are
+ignored by it instead of being counted as new.
+
+add() only buffers. run() applies the buffer every TRANSFER_WINDOW_FLUSH_INTERVAL
+seconds as one batch of NumPy scatter-adds over all keys, then checks only the keys
+the batch touched:
+
+    whale         a transfer at or above the token's extra_info "whale_threshold" (token
+                  units), or else above the WHALE_PERCENTILE transfer size of the second
+                  window once it holds WHALE_MIN_SAMPLES transfers
+    volume spike  volume in the first window at or above extra_info "volume_threshold", or
+                  else VOLUME_SPIKE_FACTOR times the second window's volume rate over the
+                  same span (with at least VOLUME_SPIKE_MIN_COUNT transfers)
+
+Alerts go to the `on_alert` callback (the listener runs ALERT_ACTIONS on them), at
+most one per key and kind every ALERT_COOLDOWN seconds. Token decimals are read
+once per token with decimals() and kept in TOKEN_DECIMALS_FILE.
+
+With listener shards, each shard aggregates the tokens it owns, so client windows
+only cover that shard's share of the client's tokens.
+"""
+import asyncio
+import inspect
+import json
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from agent import metrics
+from agent.config import (
+    BLOCK_TIME, TRANSFER_WINDOW_SPECS, TRANSFER_WINDOW_FLUSH_INTERVAL, WHALE_PERCENTILE, WHALE_MIN_SAMPLES,
+    VOLUME_SPIKE_FACTOR, VOLUME_SPIKE_MIN_COUNT, ALERT_COOLDOWN, TOKEN_DECIMALS_FILE
+)
+from agent.tools.utils import atomic_write_json, file_lock
+
+DEFAULT_DECIMALS = 18 # Used while a token's decimals are unknown
+DECIMALS_RETRY_SECONDS = 600 # Failed decimals() lookups are retried after this long
+# Transfer size histogram: quarter-decade bins from 1e-6 to 1e12 token units, plus under/overflow
+HIST_MIN_EXP, HIST_MAX_EXP, HIST_BINS_PER_DECADE = -6, 12, 4
+HIST_BINS = (HIST_MAX_EXP - HIST_MIN_EXP) * HIST_BINS_PER_DECADE + 2
+HLL_BITS = 6 # 64 registers per slot: about 13% error on unique sender counts
+HLL_REGISTERS = 1 << HLL_BITS
+_HLL_ALPHA = 0.709 # Bias correction for 64 registers
+
+ALERTS_FIRED = metrics.counter("transfer_alerts_total", "Whale and volume-spike alerts fired", ["kind"])
+BATCH_SECONDS = metrics.histogram("transfer_window_batch_seconds", "Time to apply one batch of transfers to the windows")
+
+
+def parse_window_specs(specs: str) -> List[Tuple[str, int, int]]:
+    """'5m:5,1h:12' -> [(name, length in blocks, slots), ...]"""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    windows = []
+    for spec in filter(None, (s.strip() for s in specs.split(","))):
+        name, _, slots = spec.partition(":")
+        seconds = float(name[:-1]) * units[name[-1]] if name[-1] in units else float(name)
+        slots = int(slots or 1)
+        blocks = max(slots, int(round(seconds / BLOCK_TIME / slots)) * slots) # Whole blocks per slot
+        windows.append((name, blocks, slots))
+    return windows
+
+
+def _bins(amounts: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore"):
+        scaled = np.floor((np.log10(amounts) - HIST_MIN_EXP) * HIST_BINS_PER_DECADE)
+    return np.clip(np.nan_to_num(scaled, nan=-1, neginf=-1) + 1, 0, HIST_BINS - 1).astype(np.int64)
+
+def _bin_upper(index: np.ndarray) -> np.ndarray:
+    return 10.0 ** (HIST_MIN_EXP + index / HIST_BINS_PER_DECADE)
+
+def _hll_estimate(registers: np.ndarray) -> np.ndarray:
+    """Unique counts from HyperLogLog registers (rows x HLL_REGISTERS)."""
+    m = HLL_REGISTERS
+    raw = _HLL_ALPHA * m * m / np.sum(2.0 ** -registers.astype(np.float64), axis=1)
+    zeros = np.count_nonzero(registers == 0, axis=1)
+    with np.errstate(divide="ignore"):
+        small = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), small, raw)
+
+
+class _Window:
+    """Slot arrays of one window for every key (rows grow with the number of keys)."""
+
+    def __init__(self, name: str, blocks: int, slots: int, capacity: int):
+        self.name = name
+        self.blocks = blocks
+        self.slots = slots
+        self.slot_blocks = blocks // slots
+        self.count = np.zeros((capacity, slots), dtype=np.int64)
+        self.volume = np.zeros((capacity, slots), dtype=np.float64)
+        self.hist = np.zeros((capacity, slots, HIST_BINS), dtype=np.int32)
+        self.hll = np.zeros((capacity, slots, HLL_REGISTERS), dtype=np.uint8)
+        self.epoch = np.full((capacity, slots), -1, dtype=np.int64) # Slot number (block // slot_blocks) each cell holds
+
+    def grow(self, capacity: int) -> None:
+        for field in ("count", "volume", "hist", "hll", "epoch"):
+            old = getattr(self, field)
+            new = np.full((capacity,) + old.shape[1:], -1 if field == "epoch" else 0, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, field, new)
+
+    def add(self, keys, blocks, amounts, bins, registers, ranks) -> int:
+        """Scatter-adds one batch. Returns how many transfers were too old for this window."""
+        epoch = blocks // self.slot_blocks
+        slot = epoch % self.slots
+        cells = keys * self.slots + slot
+        flat_epoch = self.epoch.reshape(-1)
+        # A cell still holding an older slot is cleared before the batch lands in it
+        unique, inverse = np.unique(cells, return_inverse=True)
+        newest = np.full(len(unique), -1, dtype=np.int64)
+        np.maximum.at(newest, inverse, epoch)
+        newer = newest > flat_epoch[unique]
+        if newer.any():
+            rows, cols = np.divmod(unique[newer], self.slots)
+            self.count[rows, cols] = 0
+            self.volume[rows, cols] = 0
+            self.hist[rows, cols] = 0
+            self.hll[rows, cols] = 0
+            flat_epoch[unique[newer]] = newest[newer]
+        current = epoch == flat_epoch[cells] # Older transfers whose slot was already reused are dropped
+        keys, slot, amounts, bins = keys[current], slot[current], amounts[current], bins[current]
+        np.add.at(self.count, (keys, slot), 1)
+        np.add.at(self.volume, (keys, slot), amounts)
+        np.add.at(self.hist, (keys, slot, bins), 1)
+        np.maximum.at(self.hll, (keys, slot, registers[current]), ranks[current])
+        return int(np.count_nonzero(~current))
+
+    def live(self, keys: np.ndarray, head_block: int) -> np.ndarray:
+        """Mask of the slots of `keys` that lie inside the window ending at head_block."""
+        head_epoch = head_block // self.slot_blocks
+        epochs = self.epoch[keys]
+        return (epochs >= 0) & (epochs > head_epoch - self.slots) & (epochs <= head_epoch)
+
+    def totals(self, keys: np.ndarray, head_block: int) -> dict:
+        live = self.live(keys, head_block)
+        return {
+            "count": (self.count[keys] * live).sum(axis=1),
+            "volume": (self.volume[keys] * live).sum(axis=1),
+            "hist": (self.hist[keys] * live[:, :, None]).sum(axis=1),
+            "senders": _hll_estimate((self.hll[keys] * live[:, :, None]).max(axis=1)),
+        }
+
+
+def percentile_from_hist(hist: np.ndarray, q: float) -> np.ndarray:
+    """Upper edge of the bin holding quantile q, per row of a (rows x HIST_BINS) histogram (nan if empty)."""
+    total = hist.sum(axis=1)
+    cumulative = np.cumsum(hist, axis=1)
+    index = np.argmax(cumulative >= np.maximum(1, np.ceil(q * total))[:, None], axis=1)
+    return np.where(total > 0, _bin_upper(index), np.nan)
+
+
+class TokenDecimals:
+    """
+    decimals() per token, read once over RPC and kept in memory and in a JSON file
+    shared by every process. `w3` (an AsyncWeb3) is set by the listener.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.w3 = None
+        self._known: Optional[Dict[str, int]] = None
+        self._failed: Dict[str, float] = {} # token -> monotonic time of the last failed lookup
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _load(self) -> Dict[str, int]:
+        if self._known is None:
+            try:
+                with open(self.path, "r") as f:
+                    self._known = {token.lower(): int(d) for token, d in json.load(f).items()}
+            except FileNotFoundError:
+                self._known = {}
+            except (json.JSONDecodeError, ValueError) as e:
+                print(f"Warning: ignoring unreadable token decimals at {self.path}: {e}")
+                self._known = {}
+        return self._known
+
+    def cached(self, token: str) -> Optional[int]:
+        return self._load().get(token.lower())
+
+    async def get(self, token: str) -> Optional[int]:
+        """The token's decimals, or None while unknown (no RPC, not an ERC20, or a recent failure)."""
+        token = token.lower()
+        decimals = self._load().get(token)
+        if decimals is not None or self.w3 is None:
+            return decimals
+        if time.monotonic() - self._failed.get(token, -DECIMALS_RETRY_SECONDS) < DECIMALS_RETRY_SECONDS:
+            return None
+        future = self._inflight.get(token)
+        if future is None:
+            future = self._inflight[token] = asyncio.ensure_future(self._fetch(token))
+            future.add_done_callback(lambda _: self._inflight.pop(token, None))
+        return await asyncio.shield(future)
+
+    async def _fetch(self, token: str) -> Optional[int]:
+        from web3 import Web3
+        try:
+            result = await self.w3.eth.call({"to": Web3.to_checksum_address(token), "data": "0x313ce567"}) # decimals()
+            decimals = int.from_bytes(bytes(result)[-32:], "big")
+            if len(result) < 32 or decimals > 77:
+                raise ValueError(f"unexpected decimals() result {bytes(result).hex() or 'empty'}")
+        except Exception as e:
+            self._failed[token] = time.monotonic()
+            print(f"Warning: decimals() lookup failed for {token}: {e}. Assuming {DEFAULT_DECIMALS} for now.")
+            return None
+        self._load()[token] = decimals
+        await asyncio.to_thread(self._save, token, decimals)
+        return decimals
+
+    def _save(self, token: str, decimals: int) -> None:
+        with file_lock(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    on_disk = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                on_disk = {}
+            on_disk[token] = decimals
+            atomic_write_json(self.path, on_disk, indent=2, sort_keys=True)
+
+
+class TransferWindows:
+    """Per-token and per-client windowed Transfer statistics and alerts (see module docstring)."""
+
+    def __init__(self, window_specs: str = "5m:5,1h:12,1d:1", flush_interval: float = 0.25,
+                 whale_percentile: float = 0.999, whale_min_samples: int = 1000,
+                 spike_factor: float = 5.0, spike_min_count: int = 20, alert_cooldown: float = 300,
+                 on_alert: Optional[Callable[[dict], object]] = None):
+        self.flush_interval = flush_interval
+        self.whale_percentile = whale_percentile
+        self.whale_min_samples = whale_min_samples
+        self.spike_factor = spike_factor
+        self.spike_min_count = spike_min_count
+        self.cooldown_blocks = max(1, int(alert_cooldown / BLOCK_TIME))
+        self.on_alert = on_alert
+        self._capacity = 256
+        self.windows = [_Window(name, blocks, slots, self._capacity) for name, blocks, slots in parse_window_specs(window_specs)]
+        self._keys: Dict[Tuple[str, str], int] = {} # ("token", address) / ("client", client_id) -> row
+        self._key_names: List[Tuple[str, str]] = []
+        self._thresholds: Dict[str, Tuple[Optional[float], Optional[float]]] = {} # token -> (whale, volume) in token units
+        self._last_alert: Dict[Tuple[int, str], int] = {} # (row, kind) -> block of the last alert
+        self._first_block = np.full(self._capacity, np.iinfo(np.int64).max, dtype=np.int64) # row -> first block seen
+        self._pending: List[tuple] = []
+        self._lock = threading.Lock()
+        self._apply_lock = threading.Lock() # flush() runs on a worker thread: held while it updates the windows
+        self.head_block = -1
+        self.transfers = 0
+        self.late = 0
+        self.batches = 0
+        self.alerts = {"whale": 0, "volume_spike": 0}
+
+    def _row(self, kind: str, name: str) -> int:
+        row = self._keys.get((kind, name))
+        if row is None:
+            row = self._keys[(kind, name)] = len(self._key_names)
+            self._key_names.append((kind, name))
+            if row >= self._capacity:
+                self._capacity *= 2
+                for window in self.windows:
+                    window.grow(self._capacity)
+                self._first_block = np.concatenate([self._first_block, np.full(
+                    self._capacity - len(self._first_block), np.iinfo(np.int64).max, dtype=np.int64)])
+        return row
+
+    def set_thresholds(self, token: str, whale: Optional[float] = None, volume: Optional[float] = None) -> None:
+        """Fixed alert thresholds for one token, in token units (None = the statistical default)."""
+        self._thresholds[token.lower()] = (whale, volume)
+
+    def add(self, token: str, client_id: Optional[str], block: int, sender: str, recipient: str, value: int,
+            decimals: Optional[int], tx_hash: str = "", log_index: int = 0) -> None:
+        """Buffers one Transfer (raw `value`); applied with the next batch."""
+        amount = value / 10 ** (DEFAULT_DECIMALS if decimals is None else decimals)
+        sender = sender.lower()
+        # Addresses are hash outputs, so their leading bits serve as the HyperLogLog hash
+        hashed = int(sender[2:18], 16)
+        rank = 64 - HLL_BITS + 1 - (hashed >> HLL_BITS).bit_length()
+        with self._lock:
+            self._pending.append((token.lower(), client_id, block, amount, hashed & (HLL_REGISTERS - 1), rank,
+                                  sender, recipient.lower(), value, tx_hash, log_index))
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def flush(self) -> List[dict]:
+        """Applies the buffered transfers and returns the alerts they triggered."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return []
+        with self._apply_lock:
+            return self._apply(batch)
+
+    def _apply(self, batch: List[tuple]) -> List[dict]:
+        started = time.perf_counter()
+        token_rows = np.array([self._row("token", t[0]) for t in batch], dtype=np.int64)
+        client_rows = np.array([self._row("client", t[1]) if t[1] else -1 for t in batch], dtype=np.int64)
+        blocks = np.array([t[2] for t in batch], dtype=np.int64)
+        amounts = np.array([t[3] for t in batch], dtype=np.float64)
+        registers = np.array([t[4] for t in batch], dtype=np.int64)
+        ranks = np.array([t[5] for t in batch], dtype=np.uint8)
+        bins = _bins(amounts)
+        self.head_block = max(self.head_block, int(blocks.max()))
+
+        # Client windows get the same transfers, stacked under their own rows
+        has_client = client_rows >= 0
+        keys = np.concatenate([token_rows, client_rows[has_client]])
+        stacked = [np.concatenate([a, a[has_client]]) for a in (blocks, amounts, bins, registers, ranks)]
+        for window in self.windows:
+            self.late += window.add(keys, *stacked)
+        np.minimum.at(self._first_block, keys, stacked[0])
+        self.transfers += len(batch)
+        self.batches += 1
+        alerts = self._check(batch, token_rows, amounts, np.unique(keys))
+        BATCH_SECONDS.observe(time.perf_counter() - started)
+        return alerts
+
+    def _cooled_down(self, row: int, kind: str, block: int) -> bool:
+        last = self._last_alert.get((row, kind))
+        if last is not None and block - last < self.cooldown_blocks:
+            return False
+        self._last_alert[(row, kind)] = block
+        return True
+
+    def _check(self, batch, token_rows, amounts, touched) -> List[dict]:
+        alerts = []
+        if not self.windows:
+            return alerts
+        short = self.windows[0]
+        long = self.windows[1] if len(self.windows) > 1 else short
+        long_totals = long.totals(touched, self.head_block)
+        fixed = [self._thresholds.get(name, (None, None)) if kind == "token" else (None, None)
+                 for kind, name in (self._key_names[row] for row in touched.tolist())]
+
+        # Whales: fixed threshold, else the long window's high percentile once it has enough samples
+        whale_limit = percentile_from_hist(long_totals["hist"], self.whale_percentile)
+        whale_limit[long_totals["count"] < self.whale_min_samples] = np.inf
+        for i, (whale, _) in enumerate(fixed):
+            if whale is not None:
+                whale_limit[i] = whale
+        limit_of = dict(zip(touched.tolist(), whale_limit.tolist()))
+        limits = np.array([limit_of[row] for row in token_rows.tolist()])
+        candidates = np.flatnonzero(amounts >= limits)
+        largest = {}
+        for i in candidates[np.argsort(-amounts[candidates])]:
+            largest.setdefault(int(token_rows[i]), int(i)) # Largest whale per token in this batch
+        for row, i in largest.items():
+            token, client_id, block, amount, _, _, sender, recipient, value, tx_hash, log_index = batch[i]
+            if self._cooled_down(row, "whale", block):
+                alerts.append(self._alert("whale", "WhaleTransfer", row, long.name, token, client_id, block, tx_hash, log_index, {
+                    "from": sender, "to": recipient, "value": value, "amount": amount,
+                    "threshold": limit_of[row], "window": long.name,
+                }))
+
+        # Volume spikes: the short window against the long window's rate over the same span
+        if short is not long:
+            short_totals = short.totals(touched, self.head_block)
+            # The baseline only spans the history seen for each key, which may be shorter than the long window
+            seen = np.minimum(self.head_block - self._first_block[touched] + 1, long.blocks)
+            history = seen - short.blocks
+            baseline = (long_totals["volume"] - short_totals["volume"]) * short.blocks / np.maximum(history, 1)
+            spiking = (short_totals["count"] >= self.spike_min_count) & (history >= short.blocks) & (baseline > 0) & \
+                      (short_totals["volume"] >= self.spike_factor * baseline)
+            for i, (_, volume) in enumerate(fixed):
+                if volume is not None:
+                    spiking[i] = short_totals["volume"][i] >= volume
+            for i in np.flatnonzero(spiking):
+                row = int(touched[i])
+                kind, name = self._key_names[row]
+                if not self._cooled_down(row, "volume_spike", self.head_block):
+                    continue
+                alerts.append(self._alert(
+                    "volume_spike", "VolumeSpike", row, short.name,
+                    name if kind == "token" else "", name if kind == "client" else None,
+                    self.head_block, "", 0, {
+                        "window": short.name, "volume": float(short_totals["volume"][i]),
+                        "baseline": float(baseline[i]), "transfers": int(short_totals["count"][i]),
+                        "unique_senders": int(round(short_totals["senders"][i])),
+                    }))
+        return alerts
+
+    def _alert(self, kind, event, row, window, token, client_id, block, tx_hash, log_index, args) -> dict:
+        self.alerts[kind] += 1
+        ALERTS_FIRED.labels(kind).inc()
+        key_kind, name = self._key_names[row]
+        return {
+            "address": token, "event": event, "args": args, "alert": kind,
+            # An alert is not a log: a whale alert points at its Transfer's (tx, logIndex), a volume
+            # spike at none, so it is identified by what fired, where and when (the cooldown makes this unique)
+            "alert_id": f"{kind}:{key_kind}:{name}:{window}:{block}",
+            "blockNumber": block, "transactionHash": tx_hash, "logIndex": log_index,
+            "client_id": client_id,
+        }
+
+    def snapshot(self, kind: str, name: str) -> Optional[dict]:
+        """Current statistics of one token ("token", address) or client ("client", id) for every window."""
+        row = self._keys.get((kind, name.lower() if kind == "token" else name))
+        if row is None:
+            return None
+        keys = np.array([row])
+        result = {}
+        with self._apply_lock:
+            for window in self.windows:
+                totals = window.totals(keys, self.head_block)
+                hist = totals["hist"]
+                result[window.name] = {
+                    "transfers": int(totals["count"][0]),
+                    "volume": float(totals["volume"][0]),
+                    "unique_senders": int(round(totals["senders"][0])),
+                    **{f"p{int(q * 100)}": _finite(percentile_from_hist(hist, q)[0]) for q in (0.5, 0.9, 0.99)},
+                }
+        return result
+
+    def stats(self) -> dict:
+        counts = {"token": 0, "client": 0}
+        for kind, _ in self._key_names:
+            counts[kind] += 1
+        return {
+            "windows": [{"name": w.name, "blocks": w.blocks, "slots": w.slots} for w in self.windows],
+            "tokens": counts["token"],
+            "clients": counts["client"],
+            "head_block": self.head_block if self.head_block >= 0 else None,
+            "transfers": self.transfers,
+            "late": self.late,
+            "batches": self.batches,
+            "pending": self.pending,
+            "alerts": dict(self.alerts),
+        }
+
+    async def run(self) -> None:
+        """Background batch loop: applies buffered transfers and hands alerts to on_alert."""
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                try:
+                    alerts = await asyncio.to_thread(self.flush) # The NumPy updates stay off the event loop
+                except Exception as e:
+                    print(f"Error aggregating transfers: {e}")
+                    continue
+                for alert in alerts:
+                    try:
+                        result = self.on_alert(alert) if self.on_alert is not None else None
+                        if inspect.isawaitable(result):
+                            await result
+                    except Exception as e:
+                        print(f"Error handling {alert['alert']} alert {alert['alert_id']}: {e}")
+        finally:
+            self.flush()
+
+
+def _finite(value: float) -> Optional[float]:
+    return None if math.isnan(value) else float(value)
+
+
+TOKEN_DECIMALS = TokenDecimals(TOKEN_DECIMALS_FILE)
+TRANSFER_WINDOWS = TransferWindows(
+    TRANSFER_WINDOW_SPECS,
+    flush_interval=TRANSFER_WINDOW_FLUSH_INTERVAL,
+    whale_percentile=WHALE_PERCENTILE,
+    whale_min_samples=WHALE_MIN_SAMPLES,
+    spike_factor=VOLUME_SPIKE_FACTOR,
+    spike_min_count=VOLUME_SPIKE_MIN_COUNT,
+    alert_cooldown=ALERT_COOLDOWN
+)
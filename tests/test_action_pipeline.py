@@ -0,0 +1,89 @@
+# tests/test_action_pipeline.py
+"""ActionPipeline overflow: per-client order through the spill file and on_settled bookkeeping (run: python -m pytest tests)."""
+import asyncio
+from collections import Counter, defaultdict
+
+import pytest
+
+from agent.action_pipeline import ActionPipeline
+
+CLIENTS = ["client-a", "client-b", "client-c"]
+PER_CLIENT = 40
+
+
+def _events():
+    """PER_CLIENT events per client, interleaved the way a listener submits them."""
+    return [{"client_id": client, "seq": seq} for seq in range(PER_CLIENT) for client in CLIENTS]
+
+
+async def _overflowing(pipeline, events, action_ids):
+    """
+    Submits `events` while the first action holds the only worker, so the queue overflows;
+    the second half is submitted while the queue drains and spilled actions are fed back.
+    """
+    await pipeline.start()
+    try:
+        for i, event in enumerate(events):
+            await pipeline.submit(action_ids[i % len(action_ids)], event)
+            if i == 0:
+                await asyncio.sleep(0.01) # The worker takes it and waits on the gate
+            elif i == len(events) // 2:
+                pipeline.gate.set()
+            if pipeline.gate.is_set():
+                await asyncio.sleep(0.001)
+        pipeline.gate.set()
+        await pipeline.join()
+    finally:
+        await pipeline.close()
+
+
+def _pipeline(tmp_path, overflow, record):
+    gate = asyncio.Event()
+
+    async def ok(event):
+        await gate.wait()
+        record.append((event["client_id"], event["seq"]))
+
+    async def fail(event):
+        await gate.wait()
+        raise RuntimeError("down")
+
+    pipeline = ActionPipeline({"ok": ok, "fail": fail}, workers=1, queue_size=8, retries=0,
+                              overflow=overflow, spill_path=str(tmp_path / "action_spill.bin"))
+    pipeline.gate = gate
+    return pipeline
+
+
+def test_spilled_actions_run_in_submit_order_per_client(tmp_path):
+    ran = []
+
+    async def run():
+        pipeline = _pipeline(tmp_path, "spill", ran)
+        await _overflowing(pipeline, _events(), ["ok"])
+        return pipeline
+
+    pipeline = asyncio.run(run())
+    assert pipeline.spilled > len(_events()) // 3 # Many of them went through the file
+    assert len(ran) == len(_events())
+    per_client = defaultdict(list)
+    for client, seq in ran:
+        per_client[client].append(seq)
+    assert per_client == {client: list(range(PER_CLIENT)) for client in CLIENTS}
+
+
+@pytest.mark.parametrize("overflow", ["spill", "drop_oldest"])
+def test_on_settled_fires_once_per_action(tmp_path, overflow):
+    settled = Counter()
+    events = _events()
+
+    async def run():
+        pipeline = _pipeline(tmp_path, overflow, [])
+        pipeline.on_settled = lambda action_id, event: settled.update([(action_id, event["client_id"], event["seq"])])
+        await _overflowing(pipeline, events, ["ok", "fail"]) # Failed for good settles too
+        return pipeline
+
+    pipeline = asyncio.run(run())
+    assert pipeline.spilled if overflow == "spill" else pipeline.dropped # The overflow path was taken
+    submitted = {(("ok", "fail")[i % 2], event["client_id"], event["seq"]) for i, event in enumerate(events)}
+    assert set(settled) == submitted
+    assert set(settled.values()) == {1}
@@ -0,0 +1,120 @@
+# tests/test_backfill.py
+"""LogBackfiller and backfill_contracts against devtools/fake_ws_node over HTTP (run: python -m pytest tests)."""
+import asyncio
+
+from web3 import AsyncWeb3, Web3
+
+from agent.backfill import BackfillCheckpoints, BlockProgress, LogBackfiller, backfill_contracts
+from agent.devtools.bench import ERC20_EVENTS_ABI
+from agent.devtools.fake_ws_node import FakeNode, start_http
+from agent.event_decoding import EventDecoderRegistry
+
+TOKEN = "0x" + "11" * 20
+TRANSFER_TOPIC = "0x" + Web3.keccak(text="Transfer(address,address,uint256)").hex().removeprefix("0x")
+BLOCKS = 400 # One Transfer per block
+
+
+def _logs(blocks=BLOCKS):
+    holder = "0x" + "00" * 12 + "22" * 20
+    return [{
+        "address": TOKEN,
+        "topics": [TRANSFER_TOPIC, holder, holder],
+        "data": "0x" + (block).to_bytes(32, "big").hex(),
+        "blockNumber": hex(block),
+        "blockHash": "0x" + block.to_bytes(32, "big").hex(),
+        "transactionHash": "0x" + (block + 10 ** 6).to_bytes(32, "big").hex(),
+        "transactionIndex": "0x0",
+        "logIndex": "0x0",
+        "removed": False,
+    } for block in range(1, blocks + 1)]
+
+
+async def _with_node(node, test):
+    runner, url = await start_http(node)
+    w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(url))
+    try:
+        return await test(w3)
+    finally:
+        await w3.provider.disconnect()
+        await runner.cleanup()
+
+
+def _active_contracts():
+    registry = EventDecoderRegistry(Web3())
+    config = {"tracked_events": ["Transfer"], "extra_info": {"start_block": 1}}
+    return {TOKEN: {"decoders": registry.register(TOKEN, ERC20_EVENTS_ABI), "config": config,
+                    "tracked_events": frozenset(config["tracked_events"])}}
+
+
+def test_chunks_shrink_when_the_node_rejects_a_range():
+    node = FakeNode(_logs(), max_logs=50)
+
+    async def test(w3):
+        backfiller = LogBackfiller(w3, chunk_size=200, min_chunk_size=10, concurrency=2, target_logs_per_request=400)
+        ranges = []
+        async for start, end, logs in backfiller.iter_ranges({"address": [Web3.to_checksum_address(TOKEN)]}, 1, BLOCKS):
+            ranges.append((start, end, [log["blockNumber"] for log in logs]))
+        return backfiller, ranges
+
+    backfiller, ranges = asyncio.run(_with_node(node, test))
+    blocks = [block for _, _, chunk in ranges for block in chunk]
+    assert blocks == list(range(1, BLOCKS + 1)) # Every log once, in block order
+    assert ranges[0][:2] == (1, 200) # Yielded per requested chunk, split or not
+    assert backfiller.chunk_size == 50 # Shrunk to what the node accepts, and not grown past it again
+    assert backfiller.requests == 14 # Both 200-block chunks split twice
+
+
+def test_resumes_from_the_checkpoint_after_a_crash(tmp_path):
+    node = FakeNode(_logs())
+    active_contracts = _active_contracts()
+    checkpoints = BackfillCheckpoints(str(tmp_path / "checkpoints.json"))
+    handled = []
+
+    async def crash_at_block_250(raw_log):
+        if raw_log["blockNumber"] == 250:
+            raise RuntimeError("crash")
+        handled.append(raw_log["blockNumber"])
+
+    async def handle(raw_log):
+        handled.append(raw_log["blockNumber"])
+
+    async def first_run(w3):
+        try:
+            await backfill_contracts(w3, active_contracts, checkpoints, crash_at_block_250,
+                                     chunk_size=100, max_chunk_size=100, concurrency=1)
+        except RuntimeError:
+            pass
+
+    asyncio.run(_with_node(node, first_run))
+    assert handled == list(range(1, 250))
+    # Chunks are checkpointed once fully handled: the one that crashed is replayed
+    assert checkpoints.get(TOKEN) == 200
+    checkpoints.save() # As the listener's periodic save would have
+    reloaded = BackfillCheckpoints(str(tmp_path / "checkpoints.json"))
+    assert reloaded.get(TOKEN) == 200
+
+    handled.clear()
+    dispatched = asyncio.run(_with_node(node, lambda w3: backfill_contracts(
+        w3, active_contracts, reloaded, handle, chunk_size=100, max_chunk_size=100, concurrency=1
+    )))
+    assert handled == list(range(201, BLOCKS + 1))
+    assert dispatched == BLOCKS - 200
+    assert BackfillCheckpoints(str(tmp_path / "checkpoints.json")).get(TOKEN) == BLOCKS
+
+
+def test_checkpoint_waits_for_unsettled_actions(tmp_path):
+    node = FakeNode(_logs())
+    checkpoints = BackfillCheckpoints(str(tmp_path / "checkpoints.json"))
+    progress = BlockProgress(checkpoints)
+
+    async def handle(raw_log):
+        progress.submitted(TOKEN, raw_log["blockNumber"])
+        if raw_log["blockNumber"] != 120: # Still queued in the action pipeline
+            progress.settled(TOKEN, raw_log["blockNumber"])
+
+    asyncio.run(_with_node(node, lambda w3: backfill_contracts(
+        w3, _active_contracts(), checkpoints, handle, chunk_size=100, progress=progress
+    )))
+    assert checkpoints.get(TOKEN) == 119
+    progress.settled(TOKEN, 120)
+    assert checkpoints.get(TOKEN) == BLOCKS
@@ -0,0 +1,74 @@
+# tests/test_basescan.py
+"""BasescanClient and the ABI store against devtools/fake_basescan (run: python -m pytest tests)."""
+import json
+import os
+import threading
+
+import pytest
+
+from agent.devtools.bench import ERC20_EVENTS_ABI
+from agent.devtools.fake_basescan import FakeBasescan
+from agent.tools import abi_store
+from agent.tools.basescan import BasescanClient
+
+UNVERIFIED = "0x" + "ee" * 20
+
+
+def _address(i):
+    return "0x" + f"{i:040x}"
+
+
+@pytest.fixture
+def basescan():
+    """(fake API, client pointed at it); the client paces itself well below the fake's limit."""
+    api = FakeBasescan(ERC20_EVENTS_ABI, rate=50, unverified=[UNVERIFIED])
+    server = api.server(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = BasescanClient("key", f"http://127.0.0.1:{server.server_address[1]}/api", rate_per_second=40)
+    try:
+        yield api, client
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+
+def test_fetch_abis_reports_errors_per_address(basescan):
+    api, client = basescan
+    addresses = [_address(i) for i in range(1, 11)] + [UNVERIFIED]
+    abis = client.fetch_abis(addresses + [addresses[0].upper().replace("0X", "0x")]) # Duplicates are fetched once
+    assert api.requests == 11 and api.rate_limited == 0
+    assert all(abis[a] == ERC20_EVENTS_ABI for a in addresses[:10])
+    assert isinstance(abis[UNVERIFIED], RuntimeError) and "not verified" in str(abis[UNVERIFIED])
+
+
+def test_fetched_abis_are_stored_once_per_content(basescan, tmp_path, monkeypatch):
+    api, client = basescan
+    monkeypatch.setattr(abi_store, "get_basescan_client", lambda api_key: client)
+    addresses = [_address(i) for i in range(1, 31)]
+
+    paths = abi_store.fetch_and_save_abis(addresses + [UNVERIFIED], "key", str(tmp_path))
+    assert len({paths[a] for a in addresses}) == 1 # One file for 30 identical ABIs
+    assert isinstance(paths[UNVERIFIED], Exception)
+    assert os.listdir(tmp_path / "by_hash") == [os.path.basename(paths[addresses[0]])]
+    with open(tmp_path / "abi_index.json") as f:
+        assert set(json.load(f)) == set(addresses)
+
+    # Stored addresses are not fetched again; a fresh store reads the same index from disk
+    requests = api.requests
+    again = abi_store.AbiStore(str(tmp_path))
+    assert again.path_for(addresses[5]) == paths[addresses[5]]
+    assert abi_store.fetch_and_save_abis(addresses, "key", str(tmp_path)) == {a: paths[a] for a in addresses}
+    assert api.requests == requests
+    assert again.stats() == {"addresses": 30, "distinct_abis": 1}
+
+
+def test_balances_take_one_balancemulti_request_per_20_addresses(basescan):
+    api, client = basescan
+    addresses = [_address(i) for i in range(1, 46)]
+    balances = dict(client.iter_balances(addresses + addresses[:3])) # Duplicates are looked up once
+    assert sorted(api.addresses_per_request) == [5, 20, 20]
+    assert balances == {a: FakeBasescan.balance_of(a) for a in addresses}
+    assert client.fetch_balance(addresses[0]) == FakeBasescan.balance_of(addresses[0])
+    assert api.addresses_per_request[-1] == 1 # Plain account/balance for a single address
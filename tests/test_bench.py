@@ -0,0 +1,22 @@
+# tests/test_bench.py
+"""
+The event pipeline benchmark against its committed baseline; opt-in, it takes about a minute
+(run: RUN_BENCH=1 python -m pytest tests/test_bench.py; BENCH_TOLERANCE=0.5 widens it on a shared runner).
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join("agent", "devtools", "bench_baseline.json")
+
+
+@pytest.mark.skipif(not os.getenv("RUN_BENCH"), reason="benchmark: set RUN_BENCH=1 to run it")
+def test_no_regression_against_the_baseline():
+    # A process of its own: peak RSS is one of the checked metrics, and the run replaces listener globals
+    command = [sys.executable, "-m", "agent.devtools.bench", "--check", BASELINE,
+               "--tolerance", os.getenv("BENCH_TOLERANCE", "0.25")]
+    result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, timeout=900)
+    assert result.returncode == 0, result.stdout + result.stderr
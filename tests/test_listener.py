@@ -0,0 +1,152 @@
+# tests/test_listener.py
+"""listen_for_events over devtools/fake_ws_node WebSockets, with its state in a temp directory (run: python -m pytest tests)."""
+import asyncio
+import json
+import types
+from collections import Counter
+
+import pytest
+import websockets
+from web3 import Web3
+
+from agent import background_listener as bl
+from agent import transfer_windows
+from agent.action_pipeline import ActionPipeline
+from agent.backfill import BackfillCheckpoints, BlockProgress
+from agent.delivery import DeliveryDeduplicator
+from agent.devtools.bench import ERC20_EVENTS_ABI
+from agent.devtools.fake_ws_node import FakeNode
+from agent.event_journal import EventJournal
+from agent.event_store import RecentEventStore
+from agent.tools import contract_manager
+
+TOKEN = "0x" + "11" * 20
+TRANSFER_TOPIC = "0x" + Web3.keccak(text="Transfer(address,address,uint256)").hex().removeprefix("0x")
+BLOCKS = 400 # One Transfer per block
+
+
+def _logs(blocks=BLOCKS):
+    holder = "0x" + "00" * 12 + "22" * 20
+    return [{
+        "address": TOKEN,
+        "topics": [TRANSFER_TOPIC, holder, holder],
+        "data": "0x" + block.to_bytes(32, "big").hex(),
+        "blockNumber": hex(block),
+        "blockHash": "0x" + block.to_bytes(32, "big").hex(),
+        "transactionHash": "0x" + (block + 10 ** 6).to_bytes(32, "big").hex(),
+        "transactionIndex": "0x0",
+        "logIndex": "0x0",
+        "removed": False,
+    } for block in range(1, blocks + 1)]
+
+
+@pytest.fixture
+def listener(tmp_path, monkeypatch):
+    """
+    Fresh listener state tracking TOKEN (history from block 1) with one "count" action.
+    Yields its state: `dispatched` counts action runs per (tx, logIndex); while `gate` is
+    an unset asyncio.Event, actions for blocks past `hold_after` wait for it.
+    """
+    state = types.SimpleNamespace(dispatched=Counter(), gate=None, hold_after=0,
+                                  checkpoints=str(tmp_path / "checkpoints.json"))
+
+    async def count(event):
+        if state.gate is not None and event.block_number > state.hold_after:
+            await state.gate.wait()
+        state.dispatched[(event["transactionHash"], event.log_index)] += 1
+
+    monkeypatch.setitem(bl.ACTION_DISPATCHER, "count", count)
+    pipeline = ActionPipeline(bl.ACTION_DISPATCHER, workers=4, timeout=30, retries=0,
+                              spill_path=str(tmp_path / "action_spill.bin"))
+    pipeline.on_settled = bl._action_settled
+    checkpoints = BackfillCheckpoints(state.checkpoints)
+    for name, value in {
+        "ACTION_PIPELINE": pipeline, "BACKFILL_CHECKPOINTS": checkpoints, "BLOCK_PROGRESS": BlockProgress(checkpoints),
+        "RECENT_EVENTS": RecentEventStore(1000), "EVENT_JOURNAL": EventJournal(str(tmp_path / "events.db")),
+        "DELIVERED_LOGS": DeliveryDeduplicator(), "BACKFILLING": Counter(), "TRACKING_TARGETS": {},
+        "SHARD_FILTER": None, "EVENT_SINKS": [], "_HANDLED_LOGS": {}, "_CATCH_UP_TASKS": set(),
+        "RECONNECT_BASE_DELAY": 0.05,
+    }.items():
+        monkeypatch.setattr(bl, name, value)
+    monkeypatch.setattr(transfer_windows, "TOKEN_DECIMALS", transfer_windows.TokenDecimals(str(tmp_path / "decimals.json")))
+    monkeypatch.setattr(contract_manager, "CONTRACT_STORE_BACKEND", "json")
+    monkeypatch.setattr(contract_manager, "CONTRACTS_FILE", str(tmp_path / "contracts.json"))
+    abi_path = tmp_path / "erc20.json"
+    abi_path.write_text(json.dumps(ERC20_EVENTS_ABI))
+    contract_manager.add_or_update_contract(TOKEN, str(abi_path), ["Transfer"], ["count"], "client-1", {"start_block": 1})
+    return state
+
+
+async def _until(condition, timeout=15.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+async def _with_listener(node, test):
+    """Serves `node` over WebSocket and runs test() while listen_for_events runs against it."""
+    async with websockets.serve(node.handler, "127.0.0.1", 0, max_size=None) as server:
+        port = server.sockets[0].getsockname()[1]
+        task = asyncio.create_task(bl.listen_for_events(f"ws://127.0.0.1:{port}", workers=2, restore_history=False))
+        try:
+            return await test()
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+async def _reload():
+    applied = asyncio.get_running_loop().create_future()
+    assert bl.request_target_reload(lambda: applied.set_result(None))
+    await applied
+
+
+def test_a_handed_over_contract_does_not_dispatch_twice(listener):
+    node = FakeNode(_logs())
+    bl.SHARD_FILTER = lambda addr: True # A shard owning every contract
+
+    async def test():
+        listener.gate, listener.hold_after = asyncio.Event(), 300 # Blocks past 300 stay unsettled
+        # Every log handled, the catch-up done, and the node done pushing (it pushes old blocks
+        # to new subscriptions, where a real node only sends new ones)
+        await _until(lambda: len(bl.DELIVERED_LOGS) == BLOCKS and not bl._CATCH_UP_TASKS and node.sent == BLOCKS)
+
+        # The old owner drops the contract (its checkpoint is saved)...
+        bl.SHARD_FILTER = lambda addr: False
+        handed = await bl.hand_over_targets()
+        checkpoint = BackfillCheckpoints(listener.checkpoints).get(TOKEN)
+        assert checkpoint is not None and checkpoint <= 300
+        assert len(handed[TOKEN]) == BLOCKS - checkpoint
+
+        # ...and the new owner, with state of its own, replays from that checkpoint
+        bl.DELIVERED_LOGS = DeliveryDeduplicator()
+        bl.BACKFILL_CHECKPOINTS = BackfillCheckpoints(listener.checkpoints)
+        bl.BLOCK_PROGRESS = BlockProgress(bl.BACKFILL_CHECKPOINTS)
+        bl.adopt_handed_over(handed)
+        listener.gate.set() # The old owner's queued actions still run
+        bl.SHARD_FILTER = lambda addr: True
+        await _reload() # Subscribes and replays from the checkpoint
+        await _until(lambda: not bl._CATCH_UP_TASKS)
+        await bl.ACTION_PIPELINE.join()
+        assert bl.BACKFILL_CHECKPOINTS.get(TOKEN) == BLOCKS
+
+    asyncio.run(_with_listener(node, test))
+    assert len(listener.dispatched) == BLOCKS
+    assert set(listener.dispatched.values()) == {1}
+
+
+def test_every_log_reaches_its_action_once_across_reconnects(listener):
+    node = FakeNode(_logs(), drop_after=150) # Every connection is closed after 150 pushed logs
+
+    async def test():
+        # Live pushes, the first catch-up and the replays after each reconnect all overlap
+        await _until(lambda: len(listener.dispatched) == BLOCKS and node.sent >= 450)
+        await bl.ACTION_PIPELINE.join()
+        await _until(lambda: not bl._CATCH_UP_TASKS)
+        assert bl.BACKFILL_CHECKPOINTS.get(TOKEN) == BLOCKS
+
+    asyncio.run(_with_listener(node, test))
+    assert len(listener.dispatched) == BLOCKS
+    assert set(listener.dispatched.values()) == {1}
+    assert bl.DELIVERED_LOGS.duplicates >= 300 # Each reconnect pushed the first 150 logs again
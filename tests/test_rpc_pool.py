@@ -0,0 +1,86 @@
+# tests/test_rpc_pool.py
+"""RpcPool failover and hedging over devtools/fake_ws_node HTTP endpoints (run: python -m pytest tests)."""
+import asyncio
+import time
+
+from agent.devtools.fake_ws_node import FakeNode, start_http
+from agent.rpc_pool import RpcPool, pooled_web3
+
+HEAD = 100
+
+
+def _logs():
+    return [{
+        "address": "0x" + "11" * 20, "topics": [], "data": "0x", "blockNumber": hex(block),
+        "blockHash": "0x" + block.to_bytes(32, "big").hex(), "transactionHash": "0x" + block.to_bytes(32, "big").hex(),
+        "transactionIndex": "0x0", "logIndex": "0x0", "removed": False,
+    } for block in range(1, HEAD + 1)]
+
+
+async def _with_pool(nodes, test, **pool_kwargs):
+    """Serves each node on its own port and runs test(pool) over a pool of them, in that order."""
+    started = [await start_http(node) for node in nodes]
+    pool = RpcPool([url for _, url in started], **pool_kwargs)
+    try:
+        return await test(pool)
+    finally:
+        for endpoint in pool.endpoints:
+            provider = endpoint._provider
+            if provider is not None:
+                await provider.disconnect()
+        for runner, _ in started:
+            await runner.cleanup()
+
+
+def test_fails_over_from_a_rate_limited_endpoint():
+    limited, healthy = FakeNode(_logs(), error_rate=1.0), FakeNode(_logs())
+
+    async def test(pool):
+        w3 = pooled_web3(pool)
+        assert await w3.eth.block_number == HEAD
+        assert await w3.eth.block_number == HEAD
+        return pool
+
+    pool = asyncio.run(_with_pool([limited, healthy], test, hedge_min_delay=1.0))
+    first, second = pool.endpoints
+    assert pool.failovers == 1
+    assert pool.stale(first) and not pool.stale(second)
+    assert first.requests == 1 # Tried once, then ranked behind the healthy endpoint
+    assert second.requests == 2
+
+
+def test_fails_over_when_an_endpoint_stalls():
+    stalled, healthy = FakeNode(_logs(), stall_after=1e-9), FakeNode(_logs())
+
+    async def test(pool):
+        started = time.monotonic()
+        # Not a hedged method: waits out the timeout on the stalled endpoint, then moves on
+        response = await pool.request("eth_sendRawTransaction", ["0x00"])
+        return pool, response, time.monotonic() - started
+
+    pool, response, elapsed = asyncio.run(_with_pool([stalled, healthy], test, timeout=0.3))
+    assert "error" not in response
+    assert pool.failovers == 1 and pool.hedges == 0
+    assert 0.3 <= elapsed < 2.0
+    assert pool.stale(pool.endpoints[0])
+
+
+def test_hedges_a_read_when_the_best_endpoint_stalls():
+    fast, slow = FakeNode(_logs()), FakeNode(_logs(), latency=0.05)
+
+    async def test(pool):
+        w3 = pooled_web3(pool)
+        await pool.probe() # Measures both: the fast one ranks first
+        for _ in range(5):
+            assert len(await w3.eth.get_logs({"fromBlock": 1, "toBlock": 10})) == 10
+        assert pool.endpoints[0].requests > pool.endpoints[1].requests
+        fast.stall_after = 1e-9 # From now on the fast node never answers
+        started = time.monotonic()
+        logs = await w3.eth.get_logs({"fromBlock": 1, "toBlock": 10})
+        return pool, logs, time.monotonic() - started
+
+    pool, logs, elapsed = asyncio.run(_with_pool([fast, slow], test, timeout=5.0, hedge_min_delay=0.05))
+    assert len(logs) == 10
+    assert pool.hedges == 1 and pool.hedge_wins == 1
+    assert pool.failovers == 0
+    assert elapsed < 1.0 # Answered by the runner-up long before the 5s timeout
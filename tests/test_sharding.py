@@ -0,0 +1,107 @@
+# tests/test_sharding.py
+"""HashRing ownership and ShardSupervisor rebalancing / merging, over stub shard workers (run: python -m pytest tests)."""
+import types
+
+import pytest
+
+from agent import background_listener as bl
+from agent import sharding
+from agent.event_journal import EventJournal
+from agent.event_store import RecentEventStore
+from agent.sharding import HashRing, ShardSupervisor
+
+ADDRESSES = ["0x" + f"{i:040x}" for i in range(2000)]
+
+
+def _owners(shard_ids):
+    ring = HashRing(shard_ids)
+    return {addr: ring.owner(addr) for addr in ADDRESSES}
+
+
+def test_resizing_the_ring_moves_only_the_changed_owners():
+    three, four = _owners([0, 1, 2]), _owners([0, 1, 2, 3])
+    moved = [addr for addr in ADDRESSES if three[addr] != four[addr]]
+    assert all(four[addr] == 3 for addr in moved) # Growing: keys only move to the new shard...
+    assert 0.15 < len(moved) / len(ADDRESSES) < 0.35 # ...about 1/4 of them
+    # Shrinking back: only the removed shard's keys move, to where they were before
+    assert {addr: three[addr] for addr in moved} == {addr: owner for addr, owner in three.items() if four[addr] == 3}
+    assert HashRing([2, 0, 1]).owner(ADDRESSES[7].upper()) == three[ADDRESSES[7]] # Order and case don't matter
+
+
+class StubShard:
+    """A worker whose control queue answers "release" the way _shard_main does, synchronously."""
+
+    def __init__(self, supervisor, shard_id, shard_ids):
+        self.supervisor = supervisor
+        self.shard_id = shard_id
+        self.owned = [addr for addr, owner in _owners(shard_ids).items() if owner == shard_id]
+        self.commands = []
+        self.process = types.SimpleNamespace(is_alive=lambda: True)
+
+    def put(self, command):
+        self.commands.append(command)
+        if command[0] == "release":
+            ring = HashRing(command[1])
+            released = {addr: [f"handled:{addr}".encode()] for addr in self.owned if ring.owner(addr) != self.shard_id}
+            self.supervisor._merge_batch([("released", released)], self.shard_id)
+
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    """A supervisor over stub shards 0..2; spawning records (shard id, handed) instead of starting processes."""
+    supervisor = ShardSupervisor(shards=3, contracts_per_shard=0)
+    supervisor.spawned = []
+    monkeypatch.setattr(supervisor, "_spawn", lambda shard_id, restarts=0, handed=None: supervisor.spawned.append((shard_id, handed)))
+    supervisor._shard_ids = [0, 1, 2]
+    for shard_id in supervisor._shard_ids:
+        shard = StubShard(supervisor, shard_id, supervisor._shard_ids)
+        supervisor._workers[shard_id] = {"process": shard.process, "control": shard, "restarts": 0, "restart_at": None}
+    return supervisor
+
+
+def test_a_rebalance_hands_handled_logs_to_the_new_owner(supervisor):
+    shards = [worker["control"] for worker in supervisor._workers.values()]
+    supervisor.resize(4)
+    moved = {addr for addr, owner in _owners([0, 1, 2, 3]).items() if owner == 3}
+    # Old owners released first; the new shard starts knowing what they already handled
+    assert [command[0] for shard in shards for command in shard.commands] == ["release", "rebalance"] * 3
+    assert [shard_id for shard_id, _ in supervisor.spawned] == [3]
+    handed = supervisor.spawned[0][1]
+    assert set(handed) == moved and handed[min(moved)] == [f"handled:{min(moved)}".encode()]
+    assert all(shard.commands[1] == ("rebalance", ([0, 1, 2, 3], {})) for shard in shards)
+
+
+def test_shrinking_hands_the_retired_shards_contracts_to_their_new_owners(supervisor):
+    supervisor._shard_ids = [0, 1, 2, 3]
+    supervisor._workers[3] = {"process": types.SimpleNamespace(is_alive=lambda: True),
+                              "control": StubShard(supervisor, 3, [0, 1, 2, 3]), "restarts": 0, "restart_at": None}
+    retired = supervisor._workers[3]["control"]
+    supervisor.resize(3)
+    assert retired.commands == [("release", [0, 1, 2]), ("stop", None)]
+    owners = _owners([0, 1, 2])
+    for shard_id in range(3):
+        command, (shard_ids, handed) = supervisor._workers[shard_id]["control"].commands[-1]
+        assert command == "rebalance" and shard_ids == [0, 1, 2]
+        assert set(handed) == {addr for addr in retired.owned if owners[addr] == shard_id}
+    assert not supervisor.spawned
+
+
+def test_a_rebalance_does_not_wait_forever_for_a_silent_shard(supervisor, monkeypatch):
+    monkeypatch.setattr(sharding, "HANDOVER_TIMEOUT", 0.2)
+    supervisor._workers[1]["control"].put = supervisor._workers[1]["control"].commands.append # Never answers
+    supervisor.resize(4)
+    assert supervisor._released is None
+    assert [shard_id for shard_id, _ in supervisor.spawned] == [3]
+
+
+def test_merged_events_are_journaled_once(supervisor, tmp_path, monkeypatch):
+    monkeypatch.setattr(bl, "RECENT_EVENTS", RecentEventStore(100))
+    monkeypatch.setattr(bl, "EVENT_JOURNAL", EventJournal(str(tmp_path / "events.db")))
+    event = {"event": "Transfer", "address": "0x" + "11" * 20, "blockNumber": 5, "args": {"value": 1},
+             "transactionHash": "0x" + "ab" * 32, "logIndex": 0}
+    # The old and the new owner both report the event across a hand-over
+    supervisor._merge_batch([("event", event)], 0)
+    supervisor._merge_batch([("event", dict(event)), ("event", dict(event, logIndex=1))], 3)
+    assert bl.EVENT_JOURNAL.flush() == 2
+    assert [e.log_index for e in bl.EVENT_JOURNAL.replay(10)] == [0, 1]
+    assert supervisor.stats()["duplicates_dropped"] == 1
@@ -0,0 +1,99 @@
+# tests/test_tool_cache.py
+"""TTLCache and @cached_tool: expiry, LRU eviction, single flight and uncached errors (run: python -m pytest tests)."""
+import threading
+import time
+
+import pytest
+
+from agent.tools.cache import TOOL_CACHE, TTLCache, cached_tool
+
+
+def _counting(results):
+    """A tool returning `results` in turn, recording each real call."""
+    calls = []
+
+    def tool(address, limit=5):
+        calls.append((address, limit))
+        return results[min(len(calls), len(results)) - 1]
+
+    return tool, calls
+
+
+def test_entries_expire_after_their_ttl():
+    cache = TTLCache()
+    tool, calls = _counting(["first", "second"])
+    cached = cached_tool(0.1, cache=cache)(tool)
+    assert cached("0xa") == cached("0xa", 5) == "first" # Defaults applied: one entry
+    time.sleep(0.15)
+    assert cached("0xa") == "second"
+    assert len(calls) == 2
+    assert cache.stats()["tools"]["tool"] == {"hits": 1, "misses": 2, "coalesced": 0, "expired": 1}
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = TTLCache(maxsize=2)
+    tool, calls = _counting(["result"])
+    cached = cached_tool(60, cache=cache)(tool)
+    cached("a")
+    cached("b")
+    cached("a") # Now "b" is the least recently used
+    cached("c")
+    assert cache.evictions == 1 and len(cache) == 2
+    cached("a")
+    cached("b")
+    assert [address for address, _ in calls] == ["a", "b", "c", "b"]
+
+
+def test_concurrent_identical_calls_share_one_computation():
+    cache = TTLCache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow(address):
+        calls.append(address)
+        started.set()
+        release.wait(5)
+        return f"balance of {address}"
+
+    cached = cached_tool(60, cache=cache)(slow)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cached("0xa"))) for _ in range(8)]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    while cache.stats()["tools"]["slow"]["coalesced"] < 7:
+        time.sleep(0.005)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert calls == ["0xa"]
+    assert results == ["balance of 0xa"] * 8
+
+
+def test_errors_are_not_cached():
+    cache = TTLCache()
+    tool, calls = _counting(["Error: rate limited", "ok"])
+    cached = cached_tool(60, cache=cache)(tool)
+    assert cached("0xa") == "Error: rate limited"
+    assert cached("0xa") == "ok"
+    assert cached("0xa") == "ok"
+    assert len(calls) == 2
+
+    def failing():
+        calls.append("raised")
+        raise RuntimeError("down")
+
+    cached_failing = cached_tool(60, cache=cache)(failing)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            cached_failing()
+    assert calls.count("raised") == 2
+
+
+def test_an_empty_custom_cache_is_used_rather_than_the_shared_one():
+    cache = TTLCache()
+    tool, _ = _counting(["result"])
+    cached_tool(60, cache=cache)(tool)("0xempty-cache")
+    assert len(cache) == 1
+    assert ("tool", ("address", "0xempty-cache"), ("limit", 5)) not in TOOL_CACHE._data
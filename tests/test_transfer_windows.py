@@ -0,0 +1,38 @@
+# tests/test_transfer_windows.py
+"""TransferWindows' batch loop: flushes off the event loop, one failing alert handler per alert (run: python -m pytest tests)."""
+import asyncio
+import threading
+
+from agent.transfer_windows import TransferWindows
+
+TOKENS = ["0x" + f"{i:02x}" * 20 for i in range(1, 4)]
+HOLDER = "0x" + "22" * 20
+
+
+def test_a_failing_alert_handler_does_not_drop_the_rest_of_the_batch():
+    handled, threads = [], []
+    windows = TransferWindows(flush_interval=0.01)
+    flush = windows.flush
+    windows.flush = lambda: threads.append(threading.current_thread()) or flush()
+
+    async def on_alert(alert):
+        if alert["address"] == TOKENS[0]:
+            raise RuntimeError("webhook down")
+        handled.append(alert["address"])
+
+    async def run():
+        windows.on_alert = on_alert
+        task = asyncio.create_task(windows.run())
+        for i, token in enumerate(TOKENS):
+            windows.set_thresholds(token, whale=1)
+            # Alerts come largest first: the failing one leads the batch
+            windows.add(token, "client-1", 10, HOLDER, HOLDER, (5 - i) * 10 ** 18, 18)
+        while len(handled) < len(TOKENS) - 1 and not task.done():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+    assert windows.alerts["whale"] == len(TOKENS) # One batch, three whales
+    assert sorted(handled) == TOKENS[1:]
+    assert threads[0] is not threading.main_thread()
@@ -0,0 +1,181 @@
+# tests/test_x_ingest.py
+"""XIngestor and get_latest_tweets_from_user over a stub X client (run: python -m pytest tests)."""
+import json
+import time
+import types
+
+import pytest
+
+from agent.tools import x_tools
+from agent.tools.x_ingest import MAX_RESULTS, RateLimited, TweetStore, XIngestor
+
+USER_ID = 7
+
+
+def _reply(data=None, meta=None):
+    return types.SimpleNamespace(data=data, errors=None, meta=meta or {})
+
+
+class TooManyRequests(Exception):
+    def __init__(self, reset):
+        super().__init__("429 Too Many Requests")
+        self.response = types.SimpleNamespace(status_code=429, headers={"x-rate-limit-reset": str(reset)})
+
+
+class StubClient:
+    """tweepy.Client's get_users / get_users_tweets over an in-memory timeline."""
+
+    def __init__(self):
+        self.tweets = []
+        self.calls = []
+        self.rate_limit_reset = None
+
+    def post(self, count):
+        start = max((t["id"] for t in self.tweets), default=1000)
+        self.tweets += [{"id": start + i, "text": f"tweet {start + i}"} for i in range(1, count + 1)]
+
+    def get_users(self, usernames):
+        self.calls.append(("users", tuple(usernames)))
+        return _reply([types.SimpleNamespace(id=USER_ID, username="Alice")] if "alice" in usernames else None)
+
+    def get_users_tweets(self, id, max_results, tweet_fields=None, since_id=None, pagination_token=None):
+        if self.rate_limit_reset:
+            raise TooManyRequests(self.rate_limit_reset)
+        self.calls.append(("timeline", since_id, max_results, pagination_token))
+        newest_first = sorted((t for t in self.tweets if not since_id or t["id"] > since_id), key=lambda t: -t["id"])
+        start = int(pagination_token or 0)
+        page = newest_first[start:start + max_results]
+        meta = {"result_count": len(page)}
+        if page:
+            meta["newest_id"] = str(page[0]["id"])
+        if start + max_results < len(newest_first):
+            meta["next_token"] = str(start + max_results)
+        return _reply(page, meta)
+
+
+@pytest.fixture
+def client():
+    return StubClient()
+
+
+@pytest.fixture
+def ingestor(client, tmp_path):
+    ingestor = XIngestor(TweetStore(str(tmp_path / "tweets.db")), lambda: client,
+                         min_interval=60, max_interval=600, initial_count=5)
+    yield ingestor
+    ingestor.store.close()
+
+
+def _timeline_calls(client):
+    return [call[1:] for call in client.calls if call[0] == "timeline"]
+
+
+def test_usernames_are_looked_up_once(ingestor, client):
+    assert ingestor.resolve(["@Alice", "bob", "ALICE"]) == {"alice": USER_ID, "bob": None}
+    assert ingestor.resolve(["alice", "bob"]) == {"alice": USER_ID, "bob": None}
+    assert client.calls == [("users", ("alice", "bob"))]
+
+
+def test_polls_page_through_everything_since_the_last_tweet(ingestor, client):
+    client.post(30)
+    assert ingestor.poll(USER_ID) == 5 # First poll: recent tweets only
+    assert _timeline_calls(client) == [(None, 5, None)]
+    newest = max(t["id"] for t in client.tweets)
+    assert ingestor.store.account(USER_ID)["since_id"] == newest
+
+    client.post(150)
+    client.calls.clear()
+    assert ingestor.poll(USER_ID) == 150
+    assert _timeline_calls(client) == [(newest, MAX_RESULTS, None), (newest, MAX_RESULTS, str(MAX_RESULTS))]
+    assert ingestor.store.account(USER_ID)["since_id"] == newest + 150
+    assert [t["id"] for t in ingestor.store.latest(USER_ID, 3)] == [str(newest + 150 - i) for i in range(3)]
+
+    client.calls.clear()
+    assert ingestor.poll(USER_ID) == 0
+    assert _timeline_calls(client) == [(newest + 150, MAX_RESULTS, None)]
+
+
+def test_a_catch_up_past_max_pages_resumes_instead_of_skipping(client, tmp_path):
+    ingestor = XIngestor(TweetStore(str(tmp_path / "tweets.db"), keep_per_user=1000), lambda: client,
+                         min_interval=60, initial_count=5, max_pages=2)
+    client.post(5)
+    ingestor.poll(USER_ID)
+    since_id = ingestor.store.account(USER_ID)["since_id"]
+    client.post(450)
+    newest = max(t["id"] for t in client.tweets)
+
+    assert ingestor.poll(USER_ID) == 200 # The newest two pages...
+    account = ingestor.store.account(USER_ID)
+    assert account["since_id"] == since_id and account["resume_token"] == "200" # ...the rest still to fetch
+    assert account["poll_interval"] == 60
+    client.calls.clear()
+    assert ingestor.poll(USER_ID) == 200
+    assert _timeline_calls(client) == [(since_id, MAX_RESULTS, "200"), (since_id, MAX_RESULTS, "300")]
+    assert ingestor.poll(USER_ID) == 50
+    account = ingestor.store.account(USER_ID)
+    assert account["since_id"] == newest and account["resume_token"] is None
+    assert len(ingestor.store.latest(USER_ID, 1000)) == 455 # No gap
+
+    client.calls.clear()
+    assert ingestor.poll(USER_ID) == 0
+    assert _timeline_calls(client) == [(newest, MAX_RESULTS, None)]
+    ingestor.store.close()
+
+
+def test_poll_interval_backs_off_while_quiet(ingestor, client):
+    client.post(5)
+    ingestor.poll(USER_ID)
+    intervals = []
+    for _ in range(8):
+        ingestor.poll(USER_ID)
+        intervals.append(ingestor.store.account(USER_ID)["poll_interval"])
+    assert intervals[:3] == [90, 135, 202.5] # Grown by half per empty poll...
+    assert intervals[-1] == 600 # ...up to max_interval
+    client.post(1)
+    ingestor.poll(USER_ID)
+    assert ingestor.store.account(USER_ID)["poll_interval"] == 300 # Halved once tweets show up again
+    for _ in range(5):
+        client.post(1)
+        ingestor.poll(USER_ID)
+    assert ingestor.store.account(USER_ID)["poll_interval"] == 60
+
+
+def test_rate_limit_pauses_every_call_until_the_reset(ingestor, client):
+    client.post(5)
+    ingestor.poll(USER_ID)
+    reset = int(time.time()) + 120
+    client.rate_limit_reset = reset
+    with pytest.raises(RateLimited) as raised:
+        ingestor.poll(USER_ID)
+    assert raised.value.until == reset
+    client.rate_limit_reset = None
+    calls = len(client.calls)
+    with pytest.raises(RateLimited):
+        ingestor.poll(USER_ID) # Not sent: the window has not reset yet
+    assert len(client.calls) == calls
+    assert ingestor.next_due(["alice"]) >= reset
+    assert ingestor.stats()["rate_limited"] == 1 and ingestor.stats()["paused_until"] == reset
+
+
+def test_tool_serves_the_cache_when_a_refresh_fails(ingestor, client, monkeypatch):
+    monkeypatch.setattr(x_tools, "X_INGESTOR", ingestor)
+    monkeypatch.setattr(x_tools, "TWEETS_CACHE_TTL", 0)
+    client.post(30)
+    result = json.loads(x_tools.get_latest_tweets_from_user("@Alice", 12))
+    assert len(result["tweets"]) == 12 # A first poll fetches what was asked for, not just initial_count
+    assert "note" not in result
+    assert x_tools.get_latest_tweets_from_user("bob") == "Error: X user @bob not found."
+
+    client.rate_limit_reset = int(time.time()) + 60
+    result = json.loads(x_tools.get_latest_tweets_from_user("alice", 2))
+    assert [t["id"] for t in result["tweets"]] == [str(client.tweets[-1]["id"]), str(client.tweets[-2]["id"])]
+    assert "rate limit" in result["note"]
+
+
+def test_tool_reports_a_missing_client(tmp_path, monkeypatch):
+    unavailable = XIngestor(TweetStore(str(tmp_path / "tweets.db")), lambda: None)
+    monkeypatch.setattr(x_tools, "X_INGESTOR", unavailable)
+    try:
+        assert x_tools.get_latest_tweets_from_user("alice") == "Error: X client not available."
+    finally:
+        unavailable.store.close()